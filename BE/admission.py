@@ -0,0 +1,238 @@
+"""
+Query admission: a rows-examined estimate from EXPLAIN QUERY PLAN decides
+whether a statement runs on the regular DB executor, queues for the heavy
+executor, or is refused before it starts.
+"""
+import math
+import os
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Tuple
+
+from fastapi import HTTPException
+
+from cache import LRUCache
+from db import EXPORT_MAX_CONCURRENCY, EXPORT_TIMEOUT_SECONDS, SQL_TIMEOUT_SECONDS, db_fingerprint, db_pool
+from partitions import get_partition_set
+from telemetry import bump, metrics, snapshot
+
+QUERY_ADMISSION_ENABLED = os.getenv("QUERY_ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Estimated rows examined at which generated SQL goes to the heavy pool, and at which it is refused (0 disables)
+QUERY_COST_HEAVY = float(os.getenv("QUERY_COST_HEAVY", "1000000"))
+QUERY_COST_REJECT = float(os.getenv("QUERY_COST_REJECT", "1000000000"))
+HEAVY_EXECUTOR_WORKERS = int(os.getenv("HEAVY_EXECUTOR_WORKERS", "2"))
+QUERY_PLAN_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_PLAN_CACHE_MAX_ENTRIES", "1024"))
+# Plans are keyed on the database version as well, so this only bounds how long an idle entry lingers
+QUERY_PLAN_CACHE_TTL_SECONDS = float(os.getenv("QUERY_PLAN_CACHE_TTL_SECONDS", os.getenv("SQL_CACHE_TTL_SECONDS", "3600")))
+
+# Expensive statements queue for these few workers instead of tying up db_executor
+heavy_executor = ThreadPoolExecutor(max_workers=HEAVY_EXECUTOR_WORKERS, thread_name_prefix="sqlite-heavy")
+plan_cache = LRUCache(QUERY_PLAN_CACHE_MAX_ENTRIES, QUERY_PLAN_CACHE_TTL_SECONDS)
+
+# "SCAN s", "SEARCH w USING INDEX idx (SalesOrder=?)"; older SQLite writes "SCAN TABLE t AS s"
+_PLAN_LOOP = re.compile(r"^(SCAN|SEARCH) (?:TABLE )?(\w+)(?: AS (\w+))?")
+_PLAN_CONSTRAINT = re.compile(r"USING (?:(AUTOMATIC) )?(?:PARTIAL )?(?:COVERING )?INDEX (\w+)? ?\((.*)\)")
+_PLAN_DERIVED = re.compile(r"^(?:MATERIALIZE|CO-ROUTINE) (\w+)")
+_PLAN_SUBQUERY = re.compile(r"^(CORRELATED )?(?:SCALAR|LIST) SUBQUERY")
+# Table references after FROM, JOIN or a comma; non-table matches (select-list items) are filtered out later
+_FROM_ALIAS = re.compile(r'(?:\b(?:FROM|JOIN)|,)\s*["`\[]?(\w+)["`\]]?(?:\s+(?:AS\s+)?(\w+))?', re.I)
+# Rows per key assumed for an index without statistics, and for an automatic index
+_DEFAULT_ROWS_PER_KEY = 10
+
+admission_counters = {"run": 0, "heavy": 0, "rejected": 0, "timeouts": 0, "heavy_in_flight": 0}
+
+class PlanCostModel:
+    """
+    Rows-examined estimate for one statement's EXPLAIN QUERY PLAN. Nested loops
+    multiply: a scan by the table's row count, an index search by the index's
+    rows per key (sqlite_stat1, written by ANALYZE in the build); each temp
+    B-tree adds a sort, and a correlated subquery runs once per outer row.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, sql: str, table_rows: Optional[Dict[str, float]] = None):
+        self.conn = conn
+        self.tables = {r[0].lower(): r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.aliases: Dict[str, str] = {}
+        for table, alias in _FROM_ALIAS.findall(sql):
+            if table.lower() in self.tables:
+                self.aliases[table.lower()] = table.lower()
+                self.aliases.setdefault((alias or table).lower(), table.lower())
+        self.rows: Dict[str, float] = {}
+        self.rows_per_key: Dict[str, float] = {}
+        for tbl, idx, numbers in self.statistics(conn):
+            self.rows[tbl] = max(self.rows.get(tbl, 0), numbers[0])
+            if idx and len(numbers) > 1:
+                self.rows_per_key[idx] = numbers[1]
+        self.rows.update(table_rows or {})
+        self.derived: Dict[str, float] = {}
+        self.loops = 0
+        self.full_scans: set = set()
+        self.temp_btrees = 0
+        self.index_builds = 0.0
+
+    @staticmethod
+    def statistics(conn: sqlite3.Connection) -> List[Tuple[str, Optional[str], List[int]]]:
+        """(table, index, numbers) rows of sqlite_stat1, lower-cased; empty before ANALYZE"""
+        try:
+            stat_rows = conn.execute("SELECT tbl, idx, stat FROM sqlite_stat1").fetchall()
+        except sqlite3.Error:
+            return []
+        out = []
+        for tbl, idx, stat in stat_rows:
+            numbers = [int(n) for n in str(stat).split() if n.isdigit()]
+            if numbers:
+                out.append((tbl.lower(), idx.lower() if idx else None, numbers))
+        return out
+
+    def table_rows(self, table: str) -> float:
+        if table not in self.rows:
+            try:
+                count = self.conn.execute(f'SELECT MAX(rowid) FROM "{self.tables[table]}"').fetchone()[0]
+            except sqlite3.Error:
+                count = None
+            self.rows[table] = float(count or 0)
+        return self.rows[table]
+
+    def fanout(self, loop: "re.Match", detail: str) -> float:
+        """Rows one iteration of this loop produces"""
+        name = (loop.group(3) or loop.group(2)).lower()
+        table = None if name in self.derived else self.aliases.get(name) or (name if name in self.tables else None)
+        if table is None:
+            return max(self.derived.get(name, 1.0), 1.0)  # subquery, CTE or constant row
+        self.loops += 1
+        rows = max(self.table_rows(table), 1.0)
+        if loop.group(1) == "SCAN":
+            self.full_scans.add(self.tables[table])
+            return rows
+        constraint = _PLAN_CONSTRAINT.search(detail)
+        if constraint is None:
+            return 1.0  # rowid / INTEGER PRIMARY KEY lookup
+        automatic, index, terms = constraint.groups()
+        if automatic:
+            self.index_builds += rows * math.log2(rows + 1)  # built for this statement alone
+            per_key = float(_DEFAULT_ROWS_PER_KEY)
+        elif "=" in terms.replace(">=", "").replace("<=", ""):
+            per_key = float(self.rows_per_key.get((index or "").lower(), _DEFAULT_ROWS_PER_KEY))
+        else:
+            per_key = rows
+        if ">" in terms or "<" in terms:
+            per_key /= 4  # range constraint; SQLite's own guess is similar
+        return max(min(per_key, rows), 1.0)
+
+    def cost(self, node: int, children: Dict[int, List[Tuple[int, str]]]) -> Tuple[float, float]:
+        """(rows examined, rows produced) by the plan under one node"""
+        work, rows, branch_rows, loops = 0.0, 1.0, 0.0, 0
+        for child, detail in children.get(node, []):
+            loop = _PLAN_LOOP.match(detail)
+            if loop:
+                loops += 1
+                rows *= self.fanout(loop, detail)
+                work += rows
+                continue
+            if detail.startswith("USE TEMP B-TREE"):
+                self.temp_btrees += 1
+                work += rows * math.log2(rows + 1)
+                continue
+            sub_work, sub_rows = self.cost(child, children)
+            derived = _PLAN_DERIVED.match(detail)
+            subquery = _PLAN_SUBQUERY.match(detail)
+            if derived:
+                self.derived[derived.group(1).lower()] = sub_rows
+            elif subquery:
+                if subquery.group(1):
+                    sub_work *= rows
+            else:
+                branch_rows += sub_rows  # compound SELECT members, OR-by-union branches
+            work += sub_work
+        return work, rows if loops else max(branch_rows, 1.0)
+
+def _estimate(conn: sqlite3.Connection, sql: str, table_rows: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    model = PlanCostModel(conn, sql, table_rows)
+    children: Dict[int, List[Tuple[int, str]]] = {}
+    for node, parent, _, detail in conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall():
+        children.setdefault(parent, []).append((node, detail))
+    work, _ = model.cost(0, children)
+    return {
+        "cost": int(work + model.index_builds),
+        "tables": model.loops,
+        "full_scans": sorted(model.full_scans),
+        "temp_btrees": model.temp_btrees,
+    }
+
+def estimate_query_cost(sql: str) -> Dict[str, Any]:
+    """
+    Plan-based cost estimate; nothing is executed. On a partitioned build the
+    plan of one partition is used with the row counts of all partitions added
+    up; statements on catalog-only tables are planned on DB_PATH.
+    """
+    sql = sql.strip().rstrip(";")
+    partitions = get_partition_set()
+    if partitions is not None and partitions.pools:
+        totals: Dict[str, float] = {}
+        for pool in partitions.pools.values():
+            with pool.connection() as conn:
+                counts = {tbl: numbers[0] for tbl, _, numbers in PlanCostModel.statistics(conn)}
+            for tbl, n in counts.items():
+                totals[tbl] = totals.get(tbl, 0) + n
+        try:
+            with next(iter(partitions.pools.values())).connection() as conn:
+                return _estimate(conn, sql, totals)
+        except sqlite3.Error:
+            pass
+    with db_pool.connection() as conn:
+        return _estimate(conn, sql)
+
+def admit_query(sql: str) -> Dict[str, Any]:
+    """
+    Admission decision for a statement: run (db_executor), heavy (heavy_executor)
+    or rejected, with the estimate behind it. Cached per database version.
+    """
+    if not QUERY_ADMISSION_ENABLED:
+        return {"decision": "run"}
+    key = f"{db_fingerprint()}\x1f{sql}"
+    admission = plan_cache.get(key)
+    if admission is None:
+        try:
+            estimate = estimate_query_cost(sql)
+        except sqlite3.Error:
+            # Not plannable; run_select() reports the actual error
+            return {"decision": "run", "cost": None}
+        cost = estimate["cost"]
+        if QUERY_COST_REJECT > 0 and cost >= QUERY_COST_REJECT:
+            decision = "rejected"
+        elif QUERY_COST_HEAVY > 0 and cost >= QUERY_COST_HEAVY:
+            decision = "heavy"
+        else:
+            decision = "run"
+        admission = {"decision": decision, **estimate}
+        plan_cache.put(key, admission)
+    return admission
+
+def record_admission(execution: Dict[str, Any]) -> None:
+    """
+    Count an admission decision; a rejected plan raises HTTPException 422.
+    """
+    decision = execution["decision"]
+    bump(admission_counters, decision)
+    metrics.inc("sql_admission_total", decision=decision)
+    if execution.get("cost") is not None:
+        metrics.observe("sql_estimated_cost", execution["cost"])
+    if decision == "rejected":
+        raise HTTPException(status_code=422, detail={
+            "message": f"Query rejected: it would examine about {execution['cost']:,} rows. Try a narrower question.",
+            "execution": execution,
+        })
+
+def admission_stats() -> Dict[str, Any]:
+    return {
+        "enabled": QUERY_ADMISSION_ENABLED,
+        "cost_heavy": QUERY_COST_HEAVY,
+        "cost_reject": QUERY_COST_REJECT,
+        "timeout_seconds": SQL_TIMEOUT_SECONDS,
+        "heavy_workers": HEAVY_EXECUTOR_WORKERS,
+        "export_timeout_seconds": EXPORT_TIMEOUT_SECONDS,
+        "export_max_concurrency": EXPORT_MAX_CONCURRENCY,
+        **snapshot(admission_counters),
+        "plan_cache": plan_cache.stats(),
+    }
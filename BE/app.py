@@ -1,134 +1,259 @@
 import os
+import io
+import csv
 import json
 import re
 import sqlite3
-from typing import Optional, Dict, Any, List
+import asyncio
+import functools
+import hashlib
+import inspect
+import random
+import threading
+import time
+import urllib.parse
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, asynccontextmanager
+from typing import Optional, Dict, Any, List, Literal, Tuple
 
-from fastapi import FastAPI, HTTPException
+PROCESS_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
-from ibm_watsonx_ai import Credentials
-from ibm_watsonx_ai.foundation_models import ModelInference
-
 # =========================
 # Env & Model Initialization
 # =========================
 load_dotenv()
 
+# Read their settings from the environment on import, so they come after load_dotenv()
+from admission import admission_counters, admission_stats, admit_query, heavy_executor, record_admission
+from cache import LRUCache
+from db import (
+    DB_PATH,
+    EXPORT_MAX_CONCURRENCY,
+    EXPORT_TIMEOUT_SECONDS,
+    SQLiteReadPool,
+    db_fingerprint,
+    db_pool,
+    encode_rows,
+    ensure_select_only,
+    fetch_capped,
+    interrupt_after,
+    query_deadline,
+    result_records,
+    top_level_keywords,
+)
+from paging import (
+    PageRequest,
+    PageResponse,
+    create_result_handle,
+    decode_cursor,
+    next_cursor,
+    page_sql,
+    result_handles,
+    unique_key_sql,
+)
+from partitions import get_partition_set, partition_executor
+from question_index import (
+    QUESTION_INDEX_ENABLED,
+    QUESTION_INDEX_MAX_ENTRIES,
+    QUESTION_INDEX_PATH,
+    QuestionIndex,
+)
+from telemetry import RequestTrace, bump, metrics, record_query, record_token_usage, request_trace, snapshot, stage
+
 WATSONX_PROJECT_ID = os.getenv("WATSONX_PROJECT_ID")
 WATSONX_API_KEY = os.getenv("WATSONX_API_KEY")
-if not WATSONX_PROJECT_ID or not WATSONX_API_KEY:
-    raise RuntimeError("Missing WATSONX_PROJECT_ID or WATSONX_API_KEY in environment.")
-
-credentials = Credentials(url="https://us-south.ml.cloud.ibm.com", api_key=WATSONX_API_KEY)
-
-model = ModelInference(
-    model_id="openai/gpt-oss-120b",
-    params={
-        "frequency_penalty": 0,
-        "max_tokens": 2000,
-        "presence_penalty": 0,
-        "temperature": 0,
-        "top_p": 1,
-    },
-    credentials=credentials,
-    project_id=WATSONX_PROJECT_ID,
-)
 
-# =========================
-# SQLite (school.db)
-# =========================
-DB_PATH = os.getenv("DB_PATH", "../DATA/data.db")
+MODEL_ID = "openai/gpt-oss-120b"
+
+# "watsonx" (default) or "stub": a local stand-in for offline benchmarks and CI
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "watsonx").lower()
+# Stand-in settings: recorded responses (JSONL with "question", "sql", optional "explanation"),
+# fallback SQL, and simulated latency
+STUB_MODEL_RESPONSES = os.getenv("STUB_MODEL_RESPONSES", "")
+STUB_MODEL_DEFAULT_SQL = os.getenv("STUB_MODEL_DEFAULT_SQL", "")
+STUB_MODEL_LATENCY_MS = float(os.getenv("STUB_MODEL_LATENCY_MS", "50"))
+STUB_MODEL_JITTER_MS = float(os.getenv("STUB_MODEL_JITTER_MS", "0"))
+
+def build_watsonx_model():
+    from ibm_watsonx_ai import Credentials
+    from ibm_watsonx_ai.foundation_models import ModelInference
 
-def _connect_db() -> sqlite3.Connection:
-    # Thread-safe for FastAPI dev; set row_factory for dict-like rows
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+    if not WATSONX_PROJECT_ID or not WATSONX_API_KEY:
+        raise RuntimeError("Missing WATSONX_PROJECT_ID or WATSONX_API_KEY in environment.")
 
-db_conn = _connect_db()
+    credentials = Credentials(url="https://us-south.ml.cloud.ibm.com", api_key=WATSONX_API_KEY)
 
-def run_select(sql: str) -> Dict[str, Any]:
+    return ModelInference(
+        model_id=MODEL_ID,
+        params={
+            "frequency_penalty": 0,
+            "max_tokens": 2000,
+            "presence_penalty": 0,
+            "temperature": 0,
+            "top_p": 1,
+        },
+        credentials=credentials,
+        project_id=WATSONX_PROJECT_ID,
+    )
+
+class StubModel:
+    """
+    Stand-in for ModelInference with the same chat/achat/achat_stream surface.
+    SQL comes from recorded responses matched on the question (falling back to
+    STUB_MODEL_DEFAULT_SQL, or a COUNT(*) over the first table); explanations
+    are canned. Each call sleeps STUB_MODEL_LATENCY_MS (+/- jitter).
+    """
+
+    def __init__(self, responses_path: str = "", default_sql: str = "",
+                 latency_ms: float = 50.0, jitter_ms: float = 0.0):
+        self.default_sql = default_sql
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.responses: Dict[str, Dict[str, str]] = {}
+        self._rng = random.Random(0)
+        if responses_path:
+            with open(responses_path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    record = json.loads(line)
+                    if record.get("question") and record.get("sql"):
+                        self.responses[" ".join(record["question"].lower().split())] = record
+
+    def _delay(self) -> float:
+        jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+    def _lookup(self, question: str) -> Dict[str, str]:
+        return self.responses.get(" ".join(question.lower().split()), {})
+
+    def _fallback_sql(self) -> str:
+        if self.default_sql:
+            return self.default_sql
+        tables = list(get_schema_catalog().tables)
+        return f'SELECT COUNT(*) AS row_count FROM "{tables[0]}";' if tables else "SELECT 1 AS ok;"
+
+    def _complete(self, messages: List[Dict[str, str]]) -> str:
+        if messages and messages[0]["role"] == "system" and "senior SQL expert" in messages[0]["content"]:
+            # Generation (and repair): the question is the first user turn, before any assumptions
+            question = messages[1]["content"].split("\n\nAdditional assumptions/notes:")[0]
+            return self._lookup(question).get("sql") or self._fallback_sql()
+        m = re.search(r"Original question: (.*)", messages[-1]["content"])
+        question = m.group(1).strip() if m else ""
+        return self._lookup(question).get("explanation") or f"(stub) Answer to: {question}"
+
+    def _response(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        content = self._complete(messages)
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        return {
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": prompt_tokens + len(content) // 4,
+            },
+        }
+
+    def chat(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        time.sleep(self._delay())
+        return self._response(messages)
+
+    async def achat(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        await asyncio.sleep(self._delay())
+        return self._response(messages)
+
+    async def achat_stream(self, messages: List[Dict[str, str]], **kwargs):
+        await asyncio.sleep(self._delay())
+        out = self._response(messages)
+        words = out["choices"][0]["message"]["content"].split(" ")
+        for i, word in enumerate(words):
+            yield {"choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}}]}
+        yield {"choices": [], "usage": out["usage"]}
+
+def build_model():
+    if MODEL_BACKEND == "stub":
+        return StubModel(STUB_MODEL_RESPONSES, STUB_MODEL_DEFAULT_SQL, STUB_MODEL_LATENCY_MS, STUB_MODEL_JITTER_MS)
+    if MODEL_BACKEND == "watsonx":
+        return build_watsonx_model()
+    raise RuntimeError(f"Unknown MODEL_BACKEND {MODEL_BACKEND!r} (expected 'watsonx' or 'stub').")
+
+# Built on first use (or by the startup warm-up): importing the SDK and creating the
+# client is the slowest part of a cold start, so it stays off the import path
+_model_lock = threading.Lock()
+_model = None
+model_init_seconds: Optional[float] = None
+
+def get_model():
+    global _model, model_init_seconds
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                started = time.perf_counter()
+                _model = build_model()
+                model_init_seconds = time.perf_counter() - started
+    return _model
+
+async def aget_model():
+    """
+    get_model() without blocking the event loop on the first (constructing) call.
+    """
+    if _model is not None:
+        return _model
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, get_model)
+
+# =========================
+# SQLite (school.db)
+# =========================
+def run_select(
+    sql: str,
+    max_rows: Optional[int] = None,
+    row_format: str = "rows",
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
     """
     Execute a SELECT-only SQL statement and return rows + columns.
+    At most max_rows rows are read from the cursor; "truncated" reports whether more existed.
+    The statement is interrupted after timeout seconds (capped at SQL_TIMEOUT_SECONDS) with a 504.
     """
-    # Basic safety: only allow SELECT; no multiple statements
-    stripped = sql.strip().rstrip(";").lstrip("(").strip()  # tolerate surrounding parens
-    if not stripped.lower().startswith("select"):
-        raise HTTPException(status_code=400, detail=f"Only SELECT queries are allowed. SQL: {sql}")
-    if ";" in sql.strip().rstrip(";"):
-        raise HTTPException(status_code=400, detail="Multiple statements are not allowed.")
+    ensure_select_only(sql)
 
+    deadline = query_deadline(timeout)
     try:
-        cur = db_conn.execute(sql)
-        cols = [c[0] for c in cur.description] if cur.description else []
-        rows = [dict(row) for row in cur.fetchall()]
-        return {"columns": cols, "rows": rows, "row_count": len(rows)}
+        partitions = get_partition_set()
+        if partitions is not None:
+            routed = partitions.run(sql, max_rows, deadline)
+            if routed is not None:
+                cols, rows, truncated = routed
+                return encode_rows(cols, rows, row_format, truncated)
+        with db_pool.connection() as conn, interrupt_after(conn, deadline):
+            cur = conn.cursor()
+            cur.row_factory = None  # plain tuples; column names are attached once in encode_rows
+            cur.execute(sql)
+            cols = [c[0] for c in cur.description] if cur.description else []
+            rows, truncated = fetch_capped(cur, max_rows)
+        return encode_rows(cols, rows, row_format, truncated)
     except Exception as e:
+        if deadline is not None and isinstance(e, sqlite3.OperationalError) and time.monotonic() > deadline:
+            metrics.inc("sql_timeouts_total")
+            raise HTTPException(status_code=504, detail="SQL execution error: the query ran past its deadline and was cancelled.")
         raise HTTPException(status_code=400, detail=f"SQL execution error: {e}")
 
 # =========================
 # Prompt Templates
 # =========================
-SQL_GENERATION_PROMPT = """
+SQL_GENERATION_PROMPT_TEMPLATE = """
 You are a senior SQL expert. Convert the user's natural language question into a SQL query for a SQLite database with this schema:
 
-TABLE SALES_LOGISTICS (
-    SalesOrder,               -- Sales Order Number
-    SalesType,               -- Refers to the abbreviation for type of Sales Order (e.g., 'ZODM': domestic, 'ZOEX': international)
-    OverallStatus,         -- Overall Status of the Sales Order (e.g., 'A': Completed and 'B': Incomplete)
-    SalesDate2,            -- Sales Order Date as a format: YYYY-MM-DD (e.g, 2023-12-31)
-    Plant,                 -- Plant code (e.g., ''1000': RC and '1100': Food, '2000': RMP)	
-    PuchaseOrder,           -- Puchase Order Number, PO Number. 
-    LineItemNo,             -- consists of sequence item in Sales Order. 	
-    OrderQty,              -- Order Quantity
-    DeliveryQty,           -- Delivery Quantity
-    OpenQty,               -- consists of outstanding balance
-    SalesUnit,            -- Sales Unit of Measure (e.g., 'PCS': pieces, 'SET': set, 'SH': sheet)
-    RequestedDlDate2,          -- Date the customer wants to receive the item as a format: YYYY-MM-DD (e.g, 2023-12-31)
-    NameSoldtoParty,         -- Name of the Sold-to Party (Customer name)	
-    NameEmployee,          -- Name of the Employee who created the Sales Order
-    PurchaseOrderDate2,       -- Date of the Purchase Order as a format: YYYY-MM-DD (e.g, 2023-12-31)
-    Currency,             -- Currency (e.g., 'THB': Thai Baht, 'USD': US Dollar)
-    DeliveryStatus,       -- Delivery or Shipping status (e.g., 'A': Completed and 'B': not yet sent)
-    ShiptoParty,            -- Shipping Location (Customer code)	
-    uploaded           -- Date the record was uploaded to the database as a format: YYYY-MM-DD (e.g, 2023-12-31)
-);
-
-
-TABLE MATERIAL_MANUFACTURING (
-SalesOrder,             -- Sales Order Number
-MG2,                  -- '3PC': 3 piece can, 'END': normal cap or shell cap, 'EOE': easy to open cap, 'POE': quick peel cap, 'EOS': Spoon cap, '2PC': 2 piece can, 'SOT': Stay On Tab
-Material1,          -- Material Number code,
-MaterialDes,       -- Material Description or name of material
-Uom,              -- Unit of Measure code (e.g., 'PCS': Piece, 'BLK': Blank, 'SET': Set, 'ST': Strip, 'SH': Shearline Sheet, 'SHT': Sheet of Color printing coating
-MatGroup1,         -- Material Group, Types of Steel (Note: 'A': Aluminum and 'L': Laminate and 'S': Steel)
-MatGroup3,      -- Material Group 3, Types of Can Size, Lid Size
-MatGroup4,    -- Material Group 4, '1': Color Printing, '2': No Color Printing, '999': Other Jobs, 'OEM': Contract Jobs, 'Z01': Claim Jobs
-PricingUnit,       -- Price per unit. 
-NetPrice        -- Net Price
-);
-
-TABLE WAREHOUSE_STOCK (
-SalesOrder,        -- Sales Order Number
-Sloc,          -- Storage Location
-GoodRecipient,         -- Good Recipient Number
-Batch,        -- Batch Number
-UnrestrictQty,         -- Unrestricted Quantity
-InspQty,         -- Balance waiting for QC Inspection
-BlockQty,         -- Balance stuck in Block
-UnrestrictValue,    -- Balance value in Unrestricted, UR balance value, available balance value
-InspValue,     -- QC inspection balance value, QC check balance value
-BlockValue,   -- Block balance value, unsold balance value
-StockWH,    -- Stock Warehouse
-StockWIP,   -- Stock Work In Progress
-StockHold,      -- Stock on Hold
-StockQI,        -- Stock Quality Inspection
-StockBlock    -- Stock Block
-);
-
+{schema}
 
 Guidelines:
 - SQLite-compatible SQL only.
@@ -136,10 +261,7 @@ Guidelines:
 - Your query must start with SELECT and does not contain any other SQL commands. (e.g., no INSERT, UPDATE, DELETE, CREATE, DROP, etc.)
 - Do not use WITH (Common Table Expressions/CTEs). Write all queries using only SELECT, subqueries, and derived tables. Avoid starting queries with WITH.
 - If your query uses UNION or UNION ALL, you must not put ORDER BY before or between any UNION/UNION ALL statements. The ORDER BY clause must come only once, after all UNION/UNION ALL statements, at the very end of the query. Do not generate ORDER BY in any subquery or before a UNION/UNION ALL.
-- Use JOINs when connecting tables: 
-  * SALES_LOGISTICS.SalesOrder = WAREHOUSE_STOCK.SalesOrder
-  * SALES_LOGISTICS.SalesOrder = MATERIAL_MANUFACTURING.SalesOrder
-- Date columns should use SQLite date functions when needed (DATE(), DATETIME(), etc.)
+{joins}{summaries}- Date columns should use SQLite date functions when needed (DATE(), DATETIME(), etc.)
 - If ambiguous, choose the most reasonable interpretation.
 - Some fields may have fixed set of possible values use them if known.
 - This helps prevent missing results due to calendar system or formatting inconsistencies.
@@ -150,6 +272,15 @@ Common query patterns:
 Respond ONLY with a valid SQL query. No explanation, no markdown, no extra text - just the SQL query.
 """.strip()
 
+SQL_REPAIR_PROMPT = """
+The query you wrote failed to compile on SQLite:
+
+{error}
+
+Fix the query so it runs on this schema and still answers the original question.
+Respond ONLY with the corrected SQL query. No explanation, no markdown, no extra text.
+""".strip()
+
 EXPLANATION_PROMPT = """
 You are a data analyst explaining query results to users. Given:
 1. Original question: {question}
@@ -163,6 +294,202 @@ Do not lie or give false information
 Only give the direct answer in the same language as the question.
 """.strip()
 
+# =========================
+# Schema Catalog
+# =========================
+SCHEMA_ANNOTATIONS_PATH = os.getenv(
+    "SCHEMA_ANNOTATIONS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema_annotations.json"),
+)
+# Prune tables/columns per question; set to false to always send the full schema
+SCHEMA_PRUNING = os.getenv("SCHEMA_PRUNING", "true").lower() in ("1", "true", "yes")
+# Tables matched only by name/alias (no column hits) keep all columns up to this many
+SCHEMA_MIN_COLUMNS = int(os.getenv("SCHEMA_MIN_COLUMNS", "6"))
+# Text columns with at most this many distinct values count as named entities (plants, customers, statuses)
+ENTITY_MAX_DISTINCT = int(os.getenv("ENTITY_MAX_DISTINCT", "10000"))
+
+def _load_annotations() -> Dict[str, Any]:
+    try:
+        with open(SCHEMA_ANNOTATIONS_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"tables": {}, "joins": [], "summaries": {}}
+
+def _summary_annotations(spec: Dict[str, Any]) -> Dict[str, Any]:
+    # A summary spec annotates its table the same way a "tables" entry does
+    columns = dict(spec.get("dimensions", {}))
+    columns.update(spec.get("measures", {}))
+    return {
+        "description": spec.get("description", ""),
+        "aliases": spec.get("aliases", []),
+        "columns": {
+            name: {"comment": col.get("comment", ""), "aliases": col.get("aliases", [])}
+            for name, col in columns.items()
+        },
+    }
+
+def _split_identifier(name: str) -> str:
+    # OpenQty -> "open qty", SALES_LOGISTICS -> "sales logistics"
+    spaced = re.sub(r"(?<=[a-z0-9])(?=[A-Z])", " ", name).replace("_", " ")
+    return " ".join(spaced.lower().split())
+
+def _mentions(text: str, term: str) -> bool:
+    """
+    Keyword test on a lowercased question. ASCII terms must match on word
+    boundaries; Thai terms (no spaces between words) match as substrings.
+    """
+    term = term.lower().strip()
+    if not term:
+        return False
+    if term.isascii():
+        return re.search(rf"(?<![a-z0-9]){re.escape(term)}(?![a-z0-9])", text) is not None
+    return term in text
+
+class SchemaCatalog:
+    """
+    Tables and columns introspected from the live database, annotated from
+    schema_annotations.json, rendered into the generation prompt per question.
+    """
+
+    def __init__(self, tables: "OrderedDict[str, List[Tuple[str, str]]]", annotations: Dict[str, Any], version: str):
+        self.tables = tables
+        self.annotations = dict(annotations.get("tables", {}))
+        # Precomputed summary tables built by DATA/build_datadase.py from the same spec
+        self.summaries = [name for name in annotations.get("summaries", {}) if name in tables]
+        for name in self.summaries:
+            self.annotations[name] = _summary_annotations(annotations["summaries"][name])
+        self.joins = [
+            j for j in annotations.get("joins", [])
+            if all(side.split(".")[0].strip() in tables for side in j.split("="))
+        ]
+        self.version = version
+        self._entities: Optional[set] = None
+        self._entity_lock = threading.Lock()
+        self.fingerprint = hashlib.sha256(json.dumps(
+            [list(tables.items()), annotations], sort_keys=True, ensure_ascii=False
+        ).encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def introspect(cls, conn: sqlite3.Connection, version: str) -> "SchemaCatalog":
+        tables: "OrderedDict[str, List[Tuple[str, str]]]" = OrderedDict()
+        names = [r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )]
+        for name in names:
+            tables[name] = [(r[1], r[2] or "") for r in conn.execute(f'PRAGMA table_info("{name}")')]
+        return cls(tables, _load_annotations(), version)
+
+    def entity_values(self) -> set:
+        """
+        Casefolded distinct values of the text columns with at most
+        ENTITY_MAX_DISTINCT of them; read from the database on first use.
+        """
+        with self._entity_lock:
+            if self._entities is None:
+                # On a partitioned build the catalog's copies are empty; read through the union views
+                partitions = get_partition_set()
+                pool = partitions.union_pool if partitions is not None else db_pool
+                values: set = set()
+                with pool.connection() as conn:
+                    for table, columns in self.tables.items():
+                        for column, col_type in columns:
+                            if col_type and not any(t in col_type.upper() for t in ("TEXT", "CHAR", "CLOB")):
+                                continue
+                            rows = conn.execute(
+                                f'SELECT DISTINCT "{column}" FROM "{table}" WHERE typeof("{column}") = \'text\' LIMIT ?',
+                                (ENTITY_MAX_DISTINCT + 1,),
+                            ).fetchall()
+                            if len(rows) <= ENTITY_MAX_DISTINCT:
+                                values.update(" ".join(r[0].split()).casefold() for r in rows)
+                self._entities = values
+            return self._entities
+
+    def _column_terms(self, table: str, column: str) -> List[str]:
+        ann = self.annotations.get(table, {}).get("columns", {}).get(column, {})
+        return [column, _split_identifier(column)] + list(ann.get("aliases", []))
+
+    def select(self, question: str) -> "OrderedDict[str, List[Tuple[str, str]]]":
+        """
+        Tables (and their columns) relevant to the question. Falls back to the
+        full schema when nothing matches.
+        """
+        if not SCHEMA_PRUNING:
+            return self.tables
+        text = question.lower()
+        selected: "OrderedDict[str, List[Tuple[str, str]]]" = OrderedDict()
+        for table, columns in self.tables.items():
+            ann = self.annotations.get(table, {})
+            table_hit = any(_mentions(text, t) for t in [table, _split_identifier(table)] + list(ann.get("aliases", [])))
+            column_hits = {c for c, _ in columns if any(_mentions(text, t) for t in self._column_terms(table, c))}
+            if not table_hit and not column_hits:
+                continue
+            keep = set(ann.get("always_include", [])) | column_hits
+            if table_hit and len(column_hits) < SCHEMA_MIN_COLUMNS:
+                keep = {c for c, _ in columns}
+            selected[table] = [(c, t) for c, t in columns if c in keep]
+        if not selected:
+            return self.tables
+        # A question spanning tables needs the join keys of each
+        if len(selected) > 1:
+            for join in self.joins:
+                for side in join.split("="):
+                    table, column = [p.strip() for p in side.split(".", 1)]
+                    keep = {c for c, _ in selected.get(table, [])}
+                    if table in selected and column not in keep:
+                        keep.add(column)
+                        selected[table] = [(c, t) for c, t in self.tables[table] if c in keep]
+        return selected
+
+    def render(self, question: str) -> Tuple[str, str, str]:
+        selected = self.select(question)
+        blocks = []
+        for table, columns in selected.items():
+            col_ann = self.annotations.get(table, {}).get("columns", {})
+            lines = []
+            if table in self.summaries:
+                lines.append(f"    -- Summary: {self.annotations[table]['description']}")
+            for i, (column, col_type) in enumerate(columns):
+                sep = "," if i < len(columns) - 1 else ""
+                decl = f"{column} {col_type}".strip() + sep
+                comment = col_ann.get(column, {}).get("comment")
+                lines.append(f"    {decl:<28} -- {comment}" if comment else f"    {decl}")
+            blocks.append(f"TABLE {table} (\n" + "\n".join(lines) + "\n);")
+        joins = [j for j in self.joins if all(side.split(".")[0].strip() in selected for side in j.split("="))]
+        join_text = ""
+        if joins:
+            join_text = "- Use JOINs when connecting tables: \n" + "\n".join(f"  * {j}" for j in joins) + "\n"
+        summary_text = ""
+        summaries = [t for t in selected if t in self.summaries]
+        if summaries:
+            summary_text = (
+                f"- {', '.join(summaries)} are precomputed aggregates of the raw tables. Prefer them when their "
+                "dimensions and measures answer the question (re-aggregate with SUM over their rows if needed); "
+                "use the raw tables for anything they do not cover.\n"
+            )
+        return "\n\n".join(blocks), join_text, summary_text
+
+_catalog_lock = threading.Lock()
+_schema_catalog: Optional[SchemaCatalog] = None
+
+def get_schema_catalog() -> SchemaCatalog:
+    """
+    Catalog for the current database file; re-introspected when the file changes.
+    """
+    global _schema_catalog
+    version = db_fingerprint()
+    catalog = _schema_catalog
+    if catalog is not None and catalog.version == version:
+        return catalog
+    with _catalog_lock:
+        if _schema_catalog is None or _schema_catalog.version != version:
+            with db_pool.connection() as conn:
+                _schema_catalog = SchemaCatalog.introspect(conn, version)
+        return _schema_catalog
+
+def build_generation_prompt(question: str) -> str:
+    schema, joins, summaries = get_schema_catalog().render(question)
+    return SQL_GENERATION_PROMPT_TEMPLATE.format(schema=schema, joins=joins, summaries=summaries)
+
 # =========================
 # Pydantic Schemas
 # =========================
@@ -171,11 +498,25 @@ class Text2SQLRequest(BaseModel):
     assumptions: Optional[str] = Field(None, description="Optional clarifications/assumptions")
     # Optional: cap result size
     limit: Optional[int] = Field(500, ge=1, le=10000, description="Max rows to return")
+    format: Literal["rows", "columnar", "matrix"] = Field(
+        "rows", description="Result encoding: list of row objects, per-column arrays, or row arrays"
+    )
+    explain: Literal["auto", "always", "never"] = Field(
+        "auto", description="auto: template for simple results, LLM otherwise; always: LLM; never: no explanation"
+    )
+    timeout_seconds: Optional[float] = Field(
+        None, gt=0, description="Execution deadline for the generated SQL (capped at SQL_TIMEOUT_SECONDS)"
+    )
 
 class Text2SQLResponse(BaseModel):
     sql_query: str
     explanation: str
-    results: Dict[str, Any]      # {columns: [...], rows: [...], row_count: n}
+    results: Dict[str, Any]      # {columns: [...], rows: [...] | data: [...], row_count: n, truncated: bool}
+    # Set when results were truncated: POST /results/{result_handle}/page with next_cursor for more rows
+    result_handle: Optional[str] = None
+    next_cursor: Optional[str] = None
+    # Admission decision (run/heavy), plan estimate, and queued/elapsed milliseconds of the SQL
+    execution: Optional[Dict[str, Any]] = None
 
 # =========================
 # Utilities
@@ -252,76 +593,861 @@ def extract_sql_query(model_output: str) -> str:
     
     return result
 
-def format_results_summary(results: Dict[str, Any]) -> str:
+# Explanation prompt digest: column stats plus a few representative rows, capped at a token budget
+RESULT_DIGEST_TOKEN_BUDGET = int(os.getenv("RESULT_DIGEST_TOKEN_BUDGET", "1200"))
+RESULT_DIGEST_TOP_K = int(os.getenv("RESULT_DIGEST_TOP_K", "5"))
+RESULT_DIGEST_SAMPLE_ROWS = int(os.getenv("RESULT_DIGEST_SAMPLE_ROWS", "10"))
+RESULT_DIGEST_MAX_CELL_CHARS = int(os.getenv("RESULT_DIGEST_MAX_CELL_CHARS", "60"))
+_DIGEST_DATE = re.compile(r"^\d{4}-\d{2}(?:-\d{2})?")
+
+def estimate_tokens(text: str) -> int:
+    # ~4 bytes per token: close for English, on the safe side for Thai (3 bytes per character)
+    return (len(text.encode("utf-8")) + 3) // 4
+
+def _digest_value(value: Any) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, float):
+        return f"{value:.6g}" if not value.is_integer() else str(int(value))
+    text = str(value)
+    if len(text) > RESULT_DIGEST_MAX_CELL_CHARS:
+        text = text[:RESULT_DIGEST_MAX_CELL_CHARS - 1] + "…"
+    return text
+
+def column_stats(name: str, values: List[Any], top_k: int) -> str:
+    """
+    One line of stats for a result column: count/distinct, and min/max/sum/mean
+    for numbers or the most frequent values for text.
+    """
+    present = [v for v in values if v is not None]
+    distinct = len(set(present))
+    line = f"- {name}: {len(present)} values"
+    if len(present) < len(values):
+        line += f" ({len(values) - len(present)} NULL)"
+    line += f", {distinct} distinct"
+    if not present:
+        return line
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        total = sum(present)
+        return line + (f", min {_digest_value(min(present))}, max {_digest_value(max(present))}, "
+                       f"sum {_digest_value(total)}, mean {_digest_value(total / len(present))}")
+    texts = [str(v) for v in present]
+    if distinct > top_k and all(_DIGEST_DATE.match(t) for t in texts):
+        line += f", range {min(texts)} .. {max(texts)}"
+    top = Counter(present).most_common(top_k)
+    # Frequencies only say something when values repeat a fair amount
+    if top and (distinct <= top_k or (top[0][1] > 1 and distinct <= len(present) // 2)):
+        line += ", top: " + ", ".join(f"{_digest_value(v)} ({n})" for v, n in top)
+    return line
+
+def representative_rows(columns: List[str], data: List[tuple], sample_rows: int) -> List[int]:
+    """
+    Indexes of rows worth showing: the first few, the last one, and the rows
+    holding the min/max of each numeric column.
+    """
+    picks = list(range(min(len(data), max(1, sample_rows // 2))))
+    if data:
+        picks.append(len(data) - 1)
+    for i in range(len(columns)):
+        numeric = [(row[i], n) for n, row in enumerate(data) if isinstance(row[i], (int, float)) and not isinstance(row[i], bool)]
+        if numeric:
+            picks += [min(numeric)[1], max(numeric)[1]]
+    return sorted(dict.fromkeys(picks))[:sample_rows]
+
+def build_result_digest(
+    results: Dict[str, Any],
+    token_budget: int = RESULT_DIGEST_TOKEN_BUDGET,
+    top_k: int = RESULT_DIGEST_TOP_K,
+    sample_rows: int = RESULT_DIGEST_SAMPLE_ROWS,
+) -> Tuple[str, int]:
     """
-    Create a concise summary of query results for explanation generation.
+    (digest text, estimated tokens) describing query results for the explanation prompt.
+    Small results are listed in full; larger ones get per-column stats and
+    representative rows. Lines stop being added once token_budget is reached.
     """
     row_count = results.get("row_count", 0)
     columns = results.get("columns", [])
-    rows = results.get("rows", [])
-    
     if row_count == 0:
-        return "No results found."
-    
-    summary = f"Found {row_count} result{'s' if row_count != 1 else ''}.\n"
-    summary += f"Columns: {', '.join(columns)}\n"
-    
-    # Include sample data (first few rows)
-    if rows:
-        sample_size = min(50, len(rows))
-        summary += f"Sample data (first {sample_size} row{'s' if sample_size != 1 else ''}):\n"
-        for i, row in enumerate(rows[:sample_size]):
-            summary += f"Row {i+1}: {dict(row)}\n"
-    
-    return summary
+        return "No results found.", estimate_tokens("No results found.")
+
+    # One transpose, then every statistic is a builtin over a column list
+    data = [tuple(r[c] for c in columns) for r in result_records(results)]
+    by_column = list(zip(*data)) if data else [() for _ in columns]
+
+    more = f" (more rows exist; everything below covers the first {row_count})" if results.get("truncated") else ""
+    lines = [f"Found {row_count} result{'s' if row_count != 1 else ''}{more}.", f"Columns: {', '.join(columns)}"]
+    used = sum(estimate_tokens(line) + 1 for line in lines)
+
+    def add(line: str) -> bool:
+        nonlocal used
+        cost = estimate_tokens(line) + 1
+        if used + cost > token_budget:
+            return False
+        lines.append(line)
+        used += cost
+        return True
+
+    # Try listing every row first; fall back to stats + samples when that doesn't fit
+    full_listing = [" | ".join(_digest_value(v) for v in row) for row in data]
+    listing_cost = sum(estimate_tokens(f"{i}. {line}") + 1 for i, line in enumerate(full_listing, 1))
+    if used + listing_cost + 2 <= token_budget:
+        add(f"All rows ({' | '.join(columns)}):")
+        for i, line in enumerate(full_listing, 1):
+            add(f"{i}. {line}")
+        return "\n".join(lines), used
+
+    add("Column stats:")
+    for n, name in enumerate(columns):
+        if not add(column_stats(name, list(by_column[n]), top_k)):
+            add(f"- ... stats for {len(columns) - n} more columns omitted")
+            break
+    picks = representative_rows(columns, data, sample_rows)
+    if add(f"Representative rows ({len(picks)} of {row_count}; {' | '.join(columns)}):"):
+        for n in picks:
+            if not add(f"{n + 1}. {full_listing[n]}"):
+                break
+    return "\n".join(lines), used
+
+def row_probe_limit(limit: Optional[int]) -> Optional[int]:
+    # One extra row lets run_select() tell a full page from a truncated one
+    return limit + 1 if limit else limit
 
 def maybe_wrap_with_limit(sql: str, limit: Optional[int]) -> str:
     """
     Add LIMIT clause if not already present and limit is specified.
+    A LIMIT inside a subquery does not count; run_select() caps rows either way.
     """
     if not limit:
         return sql
-    # Simple LIMIT appender if none present
-    low = sql.lower()
-    if " limit " in low:
+    if "LIMIT" in top_level_keywords(sql):
         return sql
-    return sql.rstrip().rstrip(";") + f" LIMIT {limit};"
+    # Newline so a trailing "-- comment" cannot swallow the clause
+    return sql.rstrip().rstrip(";") + f"\nLIMIT {limit};"
+
+def build_explanation_messages(question: str, sql_query: str, results: Dict[str, Any]) -> List[Dict[str, str]]:
+    results_summary, digest_tokens = build_result_digest(results)
+    
+    prompt = EXPLANATION_PROMPT.format(
+        question=question,
+        sql_query=sql_query,
+        results_summary=results_summary
+    )
+    # Estimated sizes, for tuning RESULT_DIGEST_TOKEN_BUDGET against answer quality
+    metrics.observe("explanation_prompt_tokens", digest_tokens, part="digest")
+    metrics.observe("explanation_prompt_tokens", estimate_tokens(prompt), part="prompt")
+    trace = request_trace.get()
+    if trace is not None:
+        trace.add_tokens("digest", digest_tokens)
+    
+    return [
+        {"role": "system", "content": "You are a helpful data analyst."},
+        {"role": "user", "content": prompt}
+    ]
+
+def fallback_explanation(results: Dict[str, Any]) -> str:
+    row_count = results.get("row_count", 0)
+    return f"Query executed successfully. Found {row_count} result{'s' if row_count != 1 else ''}."
+
+# =========================
+# SQL Generation Cache
+# =========================
+SQL_CACHE_MAX_ENTRIES = int(os.getenv("SQL_CACHE_MAX_ENTRIES", "256"))
+SQL_CACHE_TTL_SECONDS = float(os.getenv("SQL_CACHE_TTL_SECONDS", "3600"))
+
+sql_cache = LRUCache(SQL_CACHE_MAX_ENTRIES, SQL_CACHE_TTL_SECONDS)
 
-def generate_explanation(question: str, sql_query: str, results: Dict[str, Any]) -> str:
+def normalize_question(text: Optional[str]) -> str:
+    """
+    Case-fold and collapse whitespace so trivially different phrasings share a cache entry.
+    """
+    if not text:
+        return ""
+    return " ".join(text.casefold().split()).rstrip("?.!").strip()
+
+def prompt_fingerprint() -> str:
+    catalog = get_schema_catalog()
+    return hashlib.sha256(
+        f"{MODEL_ID}\n{SQL_GENERATION_PROMPT_TEMPLATE}\n{catalog.fingerprint}".encode("utf-8")
+    ).hexdigest()[:16]
+
+def sql_cache_key(question: str, assumptions: Optional[str]) -> str:
+    raw = "\x1f".join([
+        normalize_question(question),
+        normalize_question(assumptions),
+        prompt_fingerprint(),
+        db_fingerprint(),
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def build_generation_messages(
+    question: str,
+    assumptions: Optional[str],
+    examples: Optional[List[Tuple[str, str]]] = None,
+) -> List[Dict[str, str]]:
+    user_content = question
+    if assumptions:
+        user_content += f"\n\nAdditional assumptions/notes: {assumptions}"
+
+    system_prompt = build_generation_prompt(user_content)
+    if examples:
+        shots = "\n\n".join(f"Question: {q}\nSQL: {sql}" for q, sql in examples)
+        system_prompt += f"\n\nExamples of similar questions answered before:\n\n{shots}"
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_content}
+    ]
+
+# =========================
+# Result & Explanation Cache
+# =========================
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESULT_CACHE_MAX_ROWS = int(os.getenv("RESULT_CACHE_MAX_ROWS", "200000"))
+EXPLANATION_CACHE_MAX_ENTRIES = int(os.getenv("EXPLANATION_CACHE_MAX_ENTRIES", "512"))
+
+class ResultCache:
+    """
+    LRU cache of run_select() results keyed on the executed SQL.
+    Bounded by total cached rows and approximate bytes rather than entry count,
+    and flushed as a whole when the database fingerprint changes.
+    """
+
+    def __init__(self, max_bytes: int, max_rows: int):
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_version: Optional[str] = None
+        self.total_bytes = 0
+        self.total_rows = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_version(self, db_version: str) -> None:
+        # Caller holds the lock
+        if self._db_version != db_version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.total_bytes = 0
+            self.total_rows = 0
+            self._db_version = db_version
+
+    def _drop(self, key: str) -> None:
+        results, size = self._entries.pop(key)
+        self.total_bytes -= size
+        self.total_rows -= results.get("row_count", 0)
+
+    def get(self, sql: str, db_version: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._check_version(db_version)
+            entry = self._entries.get(sql)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(sql)
+            self.hits += 1
+            return dict(entry[0])
+
+    def put(self, sql: str, db_version: str, results: Dict[str, Any], size: Optional[int] = None) -> None:
+        row_count = results.get("row_count", 0)
+        if size is None:
+            size = result_size(results)
+        if size > self.max_bytes or row_count > self.max_rows:
+            return
+        with self._lock:
+            self._check_version(db_version)
+            if sql in self._entries:
+                self._drop(sql)
+            self._entries[sql] = (dict(results), size)
+            self.total_bytes += size
+            self.total_rows += row_count
+            while self._entries and (self.total_bytes > self.max_bytes or self.total_rows > self.max_rows):
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> int:
+        with self._lock:
+            n = len(self._entries)
+            self._entries.clear()
+            self.total_bytes = 0
+            self.total_rows = 0
+            return n
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "rows": self.total_rows,
+                "max_rows": self.max_rows,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+result_cache = ResultCache(RESULT_CACHE_MAX_BYTES, RESULT_CACHE_MAX_ROWS)
+explanation_cache = LRUCache(EXPLANATION_CACHE_MAX_ENTRIES, SQL_CACHE_TTL_SECONDS)
+
+def result_size(results: Dict[str, Any]) -> int:
+    return len(json.dumps(results, default=str).encode("utf-8"))
+
+def cached_select(
+    sql: str,
+    max_rows: Optional[int] = None,
+    row_format: str = "rows",
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    run_select() behind the result cache. The DB fingerprint is part of the key,
+    so a replaced data.db never serves stale rows.
+    """
+    db_version = db_fingerprint()
+    key = f"{row_format}\x1f{max_rows}\x1f{sql}"
+    results = result_cache.get(key, db_version)
+    if results is None:
+        started = time.perf_counter()
+        results = run_select(sql, max_rows, row_format, timeout)
+        elapsed = time.perf_counter() - started
+        size = result_size(results)
+        result_cache.put(key, db_version, results, size)
+        # On a partitioned build data.db only holds empty copies of the partitioned tables,
+        # so the slow-query plan comes from where the statement ran
+        partitions = get_partition_set()
+        record_query(sql, elapsed, results, size, partitions.explain_target if partitions is not None else None)
+    return results
+
+def explanation_cache_key(question: str, sql_query: str, results: Dict[str, Any]) -> str:
+    return hashlib.sha256("\x1f".join([
+        normalize_question(question),
+        sql_query,
+        str(results.get("row_count", 0)),
+        db_fingerprint(),
+    ]).encode("utf-8")).hexdigest()
+
+# =========================
+# Async Pipeline
+# =========================
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "8"))
+
+# Dedicated pool so SQLite work never competes with Starlette's default threadpool
+db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="sqlite")
+
+class LLMGate:
+    """
+    Caps in-flight model requests with an asyncio semaphore and reports queue depth.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._sem = asyncio.Semaphore(limit)
+        self.waiting = 0
+        self.in_flight = 0
+        self.max_waiting = 0
+        self.completed = 0
+        self.failed = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            with stage("llm_wait"):
+                await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            yield
+            self.completed += 1
+            metrics.inc("llm_calls_total", outcome="ok")
+        except BaseException:
+            self.failed += 1
+            metrics.inc("llm_calls_total", outcome="error")
+            raise
+        finally:
+            self.in_flight -= 1
+            self._sem.release()
+
+    async def chat(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        async with self.slot():
+            out = await _model_chat_async(messages)
+        record_token_usage(out)
+        return out
+
+    async def stream(self, messages: List[Dict[str, str]]):
+        """
+        Yield content deltas; the slot is held until the stream is exhausted.
+        """
+        async with self.slot():
+            astream = getattr(await aget_model(), "achat_stream", None)
+            if astream is not None:
+                chunks = astream(messages=messages)
+                if inspect.isawaitable(chunks):
+                    chunks = await chunks
+                async for chunk in chunks:
+                    if chunk.get("usage"):
+                        record_token_usage(chunk)
+                    delta = _stream_delta(chunk)
+                    if delta:
+                        yield delta
+            else:
+                # No async streaming in this SDK: emit the whole completion as a single delta
+                out = await _model_chat_async(messages)
+                record_token_usage(out)
+                yield out["choices"][0]["message"]["content"]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+llm_gate = LLMGate(LLM_MAX_CONCURRENCY)
+
+async def _model_chat_async(messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    # ModelInference.achat reuses the SDK's pooled async HTTP client; older SDKs fall back to a thread
+    model = await aget_model()
+    achat = getattr(model, "achat", None)
+    if achat is not None:
+        return await achat(messages=messages)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(model.chat, messages=messages))
+
+def _stream_delta(chunk: Dict[str, Any]) -> str:
+    choices = chunk.get("choices") or []
+    if not choices:
+        return ""
+    return (choices[0].get("delta") or {}).get("content") or ""
+
+async def run_in_db_executor(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(fn, *args))
+
+async def agenerate_sql(
+    question: str,
+    assumptions: Optional[str],
+    examples: Optional[List[Tuple[str, str]]] = None,
+) -> str:
+    """
+    Ask the model for a SQL query and return the cleaned statement,
+    gated by LLM_MAX_CONCURRENCY.
+    """
+    messages = build_generation_messages(question, assumptions, examples)
+    sql_out = await llm_gate.chat(messages)
+    sql_content = sql_out["choices"][0]["message"]["content"]
+    return extract_sql_query(sql_content)
+
+# =========================
+# SQL Validation & Repair
+# =========================
+SQL_REPAIR_ENABLED = os.getenv("SQL_REPAIR_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Authorizer actions a prepared SELECT may need; anything else is refused at compile time
+_ALLOWED_SQL_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION}
+
+validation_counters = {
+    "validated": 0,
+    "failed": 0,
+    "repairs": 0,
+    "repaired": 0,
+    "repair_failed": 0,
+    "repair_seconds_total": 0.0,
+}
+
+def validate_sql(sql: str) -> Optional[str]:
+    """
+    Compile the statement with EXPLAIN (nothing is executed) against the live
+    database. SQLite resolves every table and column name while preparing, and
+    the authorizer rejects anything other than reads. Returns the error
+    message, or None when the statement is valid.
+    """
+    bump(validation_counters, "validated")
+    try:
+        ensure_select_only(sql)
+    except HTTPException as he:
+        bump(validation_counters, "failed")
+        return str(he.detail)
+
+    denied: List[int] = []
+
+    def authorizer(action, arg1, arg2, db_name, trigger):
+        if action in _ALLOWED_SQL_ACTIONS:
+            return sqlite3.SQLITE_OK
+        denied.append(action)
+        return sqlite3.SQLITE_DENY
+
+    with db_pool.connection() as conn:
+        conn.set_authorizer(authorizer)
+        try:
+            conn.execute("EXPLAIN " + sql.strip().rstrip(";"))
+        except sqlite3.Error as e:
+            bump(validation_counters, "failed")
+            if denied:
+                return "Only read-only SELECT statements are allowed."
+            return str(e)
+        finally:
+            conn.set_authorizer(None)
+    return None
+
+def build_repair_messages(
+    question: str,
+    assumptions: Optional[str],
+    sql: str,
+    error: str,
+    examples: Optional[List[Tuple[str, str]]] = None,
+) -> List[Dict[str, str]]:
+    return build_generation_messages(question, assumptions, examples) + [
+        {"role": "assistant", "content": sql},
+        {"role": "user", "content": SQL_REPAIR_PROMPT.format(error=error)},
+    ]
+
+async def agenerate_valid_sql(
+    question: str,
+    assumptions: Optional[str],
+    examples: Optional[List[Tuple[str, str]]] = None,
+) -> str:
+    """
+    Generate SQL, validate it without running it, and make at most one repair
+    call with the SQLite error message. Raises HTTPException(400) if the
+    statement is still invalid.
+    """
+    sql_query = await agenerate_sql(question, assumptions, examples)
+    with stage("sql_validation"):
+        error = await run_in_db_executor(validate_sql, sql_query)
+    if error is None:
+        return sql_query
+    if not SQL_REPAIR_ENABLED:
+        raise HTTPException(status_code=400, detail=f"SQL validation error: {error}. SQL: {sql_query}")
+
+    bump(validation_counters, "repairs")
+    started = time.perf_counter()
+    try:
+        out = await llm_gate.chat(build_repair_messages(question, assumptions, sql_query, error, examples))
+        repaired = extract_sql_query(out["choices"][0]["message"]["content"])
+        repair_error = await run_in_db_executor(validate_sql, repaired)
+    finally:
+        bump(validation_counters, "repair_seconds_total", time.perf_counter() - started)
+    if repair_error is not None:
+        bump(validation_counters, "repair_failed")
+        raise HTTPException(status_code=400, detail=f"SQL validation error after repair: {repair_error}. SQL: {repaired}")
+    bump(validation_counters, "repaired")
+    return repaired
+
+def validation_stats() -> Dict[str, Any]:
+    stats = snapshot(validation_counters)
+    stats["failure_rate"] = round(stats["failed"] / stats["validated"], 4) if stats["validated"] else 0.0
+    stats["repair_seconds_avg"] = round(stats["repair_seconds_total"] / stats["repairs"], 4) if stats["repairs"] else 0.0
+    return stats
+
+# =========================
+# Query Admission
+# =========================
+async def execute_admitted(
+    sql: str,
+    max_rows: Optional[int],
+    row_format: str,
+    timeout: Optional[float] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    cached_select() under admission control. Returns (results, execution), where
+    execution reports the decision, the plan estimate and the milliseconds spent
+    queued and executing. Raises HTTPException 422 for a rejected plan and 504
+    when the statement runs past its deadline.
+    """
+    with stage("admission"):
+        admission = await run_in_db_executor(admit_query, sql)
+    execution = dict(admission)
+    decision = execution["decision"]
+    record_admission(execution)
+
+    started: List[float] = []
+
+    def run() -> Dict[str, Any]:
+        started.append(time.perf_counter())
+        return cached_select(sql, max_rows, row_format, timeout)
+
+    def timing() -> None:
+        finished = time.perf_counter()
+        began = started[0] if started else finished
+        execution["queued_ms"] = round((began - submitted) * 1000, 1)
+        execution["elapsed_ms"] = round((finished - began) * 1000, 1)
+
+    heavy = decision == "heavy"
+    loop = asyncio.get_running_loop()
+    submitted = time.perf_counter()
+    bump(admission_counters, "heavy_in_flight", int(heavy))
+    try:
+        with stage("db"):
+            results = await loop.run_in_executor(heavy_executor if heavy else db_executor, run)
+    except HTTPException as he:
+        timing()
+        if he.status_code != 504:
+            raise
+        bump(admission_counters, "timeouts")
+        raise HTTPException(status_code=504, detail={"message": he.detail, "execution": execution})
+    finally:
+        bump(admission_counters, "heavy_in_flight", -int(heavy))
+    timing()
+    return results, execution
+
+# =========================
+# Similar-question Index
+# =========================
+question_index = QuestionIndex(
+    QUESTION_INDEX_PATH, QUESTION_INDEX_MAX_ENTRIES, lambda: get_schema_catalog().entity_values()
+)
+
+async def acached_sql(question: str, assumptions: Optional[str]) -> Tuple[str, Optional[str]]:
+    """
+    Cached SQL for the question, or fresh SQL (reused from a similar past
+    question, or generated) plus the cache key to store it under once it has
+    executed successfully (None on a cache hit).
+    """
+    cache_key = sql_cache_key(question, assumptions)
+    sql_query = sql_cache.get(cache_key)
+    if sql_query is not None:
+        return sql_query, None
+
+    examples: List[Tuple[str, str]] = []
+    if QUESTION_INDEX_ENABLED and not assumptions:
+        # Off the event loop: a first text-slot match reads the catalog's entity values
+        reused, examples = await run_in_db_executor(question_index.lookup, question)
+        if reused is not None and await run_in_db_executor(validate_sql, reused) is None:
+            return reused, cache_key
+    return await agenerate_valid_sql(question, assumptions, examples), cache_key
+
+# Append every executed SQL to this JSONL file; DATA/index_advisor.py reads it as the index workload (empty = off)
+SQL_WORKLOAD_LOG_PATH = os.getenv("SQL_WORKLOAD_LOG_PATH", "")
+_workload_log_lock = threading.Lock()
+
+def log_workload_sql(sql_query: str, question: Optional[str] = None) -> None:
+    if not SQL_WORKLOAD_LOG_PATH:
+        return
+    # The question lets bench/loadtest.py --replay re-run the same traffic end to end
+    record = json.dumps({"ts": round(time.time(), 3), "question": question, "sql": sql_query}, ensure_ascii=False)
+    with _workload_log_lock:
+        try:
+            with open(SQL_WORKLOAD_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(record + "\n")
+        except OSError as e:
+            print(f"Warning: could not write SQL workload log: {e}")
+
+def remember_sql(pending_key: Optional[str], question: str, assumptions: Optional[str], sql_query: str) -> None:
+    """
+    Record SQL that executed successfully in the workload log, the generation
+    cache and the similar-question index. Appends to both files, so callers
+    run it on the DB executor rather than the event loop.
+    """
+    log_workload_sql(sql_query, question)
+    if not pending_key:
+        return
+    sql_cache.put(pending_key, sql_query)
+    if QUESTION_INDEX_ENABLED and not assumptions:
+        question_index.add(question, sql_query)
+
+async def agenerate_explanation(question: str, sql_query: str, results: Dict[str, Any]) -> str:
     """
     Generate explanation using the AI model after query execution.
     """
     try:
-        results_summary = format_results_summary(results)
-        
-        prompt = EXPLANATION_PROMPT.format(
-            question=question,
-            sql_query=sql_query,
-            results_summary=results_summary
-        )
-        
-        messages = [
-            {"role": "system", "content": "You are a helpful data analyst."},
-            {"role": "user", "content": prompt}
-        ]
-        
-        out = model.chat(messages=messages)
-        explanation = out["choices"][0]["message"]["content"].strip()
-        
-        return explanation
-        
-    except Exception as e:
+        messages = build_explanation_messages(question, sql_query, results)
+        out = await llm_gate.chat(messages)
+        return out["choices"][0]["message"]["content"].strip()
+    except Exception:
         # Fallback explanation if AI generation fails
-        row_count = results.get("row_count", 0)
-        return f"Query executed successfully. Found {row_count} result{'s' if row_count != 1 else ''}."
+        return fallback_explanation(results)
+
+async def acached_explanation(question: str, sql_query: str, results: Dict[str, Any]) -> str:
+    """
+    agenerate_explanation() behind a small cache keyed on question, SQL and DB version.
+    """
+    key = explanation_cache_key(question, sql_query, results)
+    explanation = explanation_cache.get(key)
+    if explanation is None:
+        explanation = await agenerate_explanation(question, sql_query, results)
+        explanation_cache.put(key, explanation)
+    return explanation
+
+# =========================
+# Fast-path Explanations
+# =========================
+FAST_EXPLAIN_MAX_ROWS = int(os.getenv("FAST_EXPLAIN_MAX_ROWS", "10"))
+FAST_EXPLAIN_MAX_COLUMNS = int(os.getenv("FAST_EXPLAIN_MAX_COLUMNS", "3"))
+FAST_EXPLAIN_SINGLE_ROW_MAX_COLUMNS = int(os.getenv("FAST_EXPLAIN_SINGLE_ROW_MAX_COLUMNS", "8"))
+
+THAI_CHARS = re.compile(r"[\u0e00-\u0e7f]")
+
+EXPLANATION_TEMPLATES = {
+    "en": {
+        "empty": "No matching records were found for your question.",
+        "scalar": "The result for {column} is {value}.",
+        "single_row": "Found 1 result: {pairs}.",
+        "list": "Found {count} results:\n{lines}",
+    },
+    "th": {
+        "empty": "ไม่พบข้อมูลที่ตรงกับคำถามของคุณ",
+        "scalar": "ผลลัพธ์ของ {column} คือ {value}",
+        "single_row": "พบ 1 รายการ: {pairs}",
+        "list": "พบทั้งหมด {count} รายการ:\n{lines}",
+    },
+}
+
+explain_counters = {"template": 0, "llm": 0, "skipped": 0}
+
+def detect_language(text: str) -> str:
+    return "th" if THAI_CHARS.search(text or "") else "en"
+
+def format_value(value: Any) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, int):
+        return f"{value:,}"
+    if isinstance(value, float):
+        if value.is_integer():
+            return f"{int(value):,}"
+        return f"{value:,.2f}"
+    return str(value)
+
+def template_explanation(question: str, results: Dict[str, Any]) -> Optional[str]:
+    """
+    Deterministic explanation for simple result shapes (empty, scalar, single row,
+    small list / group-by). Returns None when the LLM should explain instead.
+    """
+    if results.get("truncated"):
+        return None
+    templates = EXPLANATION_TEMPLATES[detect_language(question)]
+    columns = results.get("columns", [])
+    row_count = results.get("row_count", 0)
+
+    if row_count == 0:
+        return templates["empty"]
+
+    records = result_records(results, limit=FAST_EXPLAIN_MAX_ROWS + 1)
+    if row_count == 1 and len(columns) == 1:
+        return templates["scalar"].format(column=columns[0], value=format_value(records[0][columns[0]]))
+    if row_count == 1 and len(columns) <= FAST_EXPLAIN_SINGLE_ROW_MAX_COLUMNS:
+        pairs = ", ".join(f"{c} = {format_value(records[0][c])}" for c in columns)
+        return templates["single_row"].format(pairs=pairs)
+    if row_count <= FAST_EXPLAIN_MAX_ROWS and len(columns) <= FAST_EXPLAIN_MAX_COLUMNS:
+        lines = []
+        for record in records:
+            # First column is the group label (plant, customer, ...): keep it verbatim
+            label = "-" if record[columns[0]] is None else str(record[columns[0]])
+            values = [format_value(record[c]) for c in columns[1:]]
+            lines.append(f"- {label}: {', '.join(values)}" if values else f"- {label}")
+        return templates["list"].format(count=row_count, lines="\n".join(lines))
+    return None
+
+async def aexplain(question: str, sql_query: str, results: Dict[str, Any], mode: str) -> str:
+    """
+    Explanation according to the request's explain mode.
+    """
+    if mode == "never":
+        bump(explain_counters, "skipped")
+        return ""
+    if mode == "auto":
+        explanation = template_explanation(question, results)
+        if explanation is not None:
+            bump(explain_counters, "template")
+            return explanation
+    bump(explain_counters, "llm")
+    return await acached_explanation(question, sql_query, results)
 
 # =========================
 # FastAPI App
 # =========================
+# Build the model client in the background once the service is ready, so the first
+# question doesn't pay for it; readiness never waits for it
+STARTUP_WARM_MODEL = os.getenv("STARTUP_WARM_MODEL", "true").lower() in ("1", "true", "yes")
+
+class StartupState:
+    """
+    Background warm-up progress, reported by the readiness probe.
+    """
+
+    def __init__(self):
+        self.import_seconds = time.perf_counter() - PROCESS_STARTED
+        self.started_at: Optional[float] = None
+        self.ready_seconds: Optional[float] = None
+        self.model = "lazy"          # lazy | warming | ready | error
+        self.errors: Dict[str, str] = {}
+
+    @property
+    def ready(self) -> bool:
+        # A model that failed at warm-up but was built later by a request counts as healthy
+        return self.ready_seconds is not None and (self.model != "error" or _model is not None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "import_seconds": round(self.import_seconds, 4),
+            "ready_seconds": None if self.ready_seconds is None else round(self.ready_seconds, 4),
+            "model": self.model,
+            "model_init_seconds": None if model_init_seconds is None else round(model_init_seconds, 4),
+            "errors": self.errors,
+        }
+
+startup_state = StartupState()
+
+async def warm_up():
+    """
+    Schema introspection and the question index make the service ready; the model
+    client is built afterwards so a slow SDK import never delays taking traffic.
+    """
+    try:
+        await run_in_db_executor(get_schema_catalog)
+    except Exception as e:
+        startup_state.errors["schema"] = str(e)
+        print(f"Warning: schema introspection failed at startup: {e}")
+    if QUESTION_INDEX_ENABLED:
+        try:
+            await run_in_db_executor(question_index.load)
+        except Exception as e:
+            startup_state.errors["question_index"] = str(e)
+            print(f"Warning: question index failed to load: {e}")
+    startup_state.ready_seconds = time.perf_counter() - PROCESS_STARTED
+    print(f"Ready in {startup_state.ready_seconds:.3f}s (import {startup_state.import_seconds:.3f}s)")
+    if STARTUP_WARM_MODEL and startup_state.model == "lazy":
+        startup_state.model = "warming"
+        try:
+            await aget_model()
+            startup_state.model = "ready"
+        except Exception as e:
+            startup_state.model = "error"
+            startup_state.errors["model"] = str(e)
+            print(f"Warning: model client failed to initialize: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background so the server starts accepting (liveness) right away
+    startup_state.started_at = time.perf_counter()
+    warmup = asyncio.create_task(warm_up())
+    yield
+    warmup.cancel()
+    db_executor.shutdown(wait=False, cancel_futures=True)
+    heavy_executor.shutdown(wait=False, cancel_futures=True)
+    partition_executor.shutdown(wait=False, cancel_futures=True)
+    db_pool.close_all()
+    export_pool.close_all()
+
 app = FastAPI(
     title="Text2SQL + Execute (School DB)",
     version="1.0.0",
-    description="Turns NL questions into SQL with watsonx.ai gpt-oss-120b and executes on SQLite school.db."
+    description="Turns NL questions into SQL with watsonx.ai gpt-oss-120b and executes on SQLite school.db.",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -332,49 +1458,219 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Per-request stage timings (Server-Timing header) and route latency/count metrics.
+    """
+    trace = RequestTrace()
+    token = request_trace.set(trace)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        request_trace.reset(token)
+    elapsed = time.perf_counter() - started
+    route = request.scope.get("route")
+    path = getattr(route, "path", "unmatched")
+    metrics.observe("http_request_duration_seconds", elapsed, route=path)
+    metrics.inc("http_requests_total", route=path, method=request.method, status=str(response.status_code))
+    response.headers["Server-Timing"] = trace.server_timing(elapsed)
+    return response
+
+metrics.gauge("llm_in_flight", "Model requests currently running.", lambda: llm_gate.in_flight)
+metrics.gauge("llm_waiting", "Model requests waiting for a concurrency slot.", lambda: llm_gate.waiting)
+metrics.gauge("startup_ready_seconds", "Seconds from process start until the service was ready (0 while starting).",
+              lambda: startup_state.ready_seconds or 0.0)
+metrics.gauge("startup_model_init_seconds", "Seconds spent constructing the model client (0 until built).",
+              lambda: model_init_seconds or 0.0)
+metrics.gauge("text2sql_coalescing_in_flight", "Distinct /text2sql pipelines currently shared by coalesced requests.",
+              lambda: single_flight.in_flight)
+metrics.gauge("sql_heavy_in_flight", "Statements queued or running on the heavy-query pool.",
+              lambda: admission_counters["heavy_in_flight"])
+metrics.gauge("result_cache_bytes", "Bytes held by the result cache.", lambda: result_cache.total_bytes)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """
+    Prometheus text exposition of stage latencies, token counts and SQL result sizes.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/health/live")
+def health_live():
+    """
+    Liveness: the process is up and serving requests; no dependencies are checked.
+    """
+    return {"status": "ok", "uptime_seconds": round(time.perf_counter() - PROCESS_STARTED, 3)}
+
+@app.get("/health/ready")
+def health_ready():
+    """
+    Readiness: warm-up finished, the model client (if built) is healthy and the DB answers.
+    """
+    try:
+        with db_pool.connection() as conn:
+            conn.execute("SELECT 1;").fetchone()
+        db_ok = True
+    except Exception:
+        db_ok = False
+    ready = startup_state.ready and db_ok
+    status = "ready" if ready else ("error" if startup_state.errors.get("model") and _model is None else "starting")
+    body = {"status": status, "db_connected": db_ok, "startup": startup_state.stats()}
+    return JSONResponse(body, status_code=200 if ready else 503)
+
 @app.get("/health")
 def health():
     # Basic DB check
     try:
-        db_conn.execute("SELECT 1;").fetchone()
+        with db_pool.connection() as conn:
+            conn.execute("SELECT 1;").fetchone()
         db_ok = True
     except Exception:
         db_ok = False
-    return {"status": "ok", "db_connected": db_ok, "db_path": os.path.abspath(DB_PATH)}
+    partitions = get_partition_set()
+    return {
+        "status": "ok",
+        "ready": startup_state.ready,
+        "db_connected": db_ok,
+        "db_path": os.path.abspath(DB_PATH),
+        "db_pool": db_pool.stats(),
+        "partitions": partitions.stats() if partitions is not None else None,
+        "startup": startup_state.stats(),
+    }
 
-@app.post("/text2sql", response_model=Text2SQLResponse)
-def text2sql(req: Text2SQLRequest):
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "sql_generation": sql_cache.stats(),
+        "results": result_cache.stats(),
+        "explanations": explanation_cache.stats(),
+        "result_handles": result_handles.stats(),
+        "db_fingerprint": db_fingerprint(),
+    }
+
+@app.post("/cache/invalidate")
+def cache_invalidate():
     """
-    Generate SQL from NL question, execute it on school.db, and return results with AI-generated explanation.
+    Drop all cached SQL, results and explanations. Called by DATA/build_datadase.py after a rebuild.
+    """
+    return {
+        "sql_generation_cleared": sql_cache.clear(),
+        "results_cleared": result_cache.clear(),
+        "explanations_cleared": explanation_cache.clear(),
+        "result_handles_cleared": result_handles.clear(),
+    }
+
+@app.get("/llm/stats")
+def llm_stats():
+    return {
+        "llm": llm_gate.stats(),
+        "explanations": snapshot(explain_counters),
+        "validation": validation_stats(),
+        "question_index": question_index.stats(),
+        "coalescing": single_flight.stats(),
+        "admission": admission_stats(),
+        "db_executor_workers": DB_EXECUTOR_WORKERS,
+    }
+
+# =========================
+# Request Coalescing
+# =========================
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "true").lower() in ("1", "true", "yes")
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one in-flight task: the first caller
+    starts it, later callers await the same result (or exception). Nothing is kept
+    once the task finishes, so this is not a cache.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _finished(self, key: str, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Mark a failure as retrieved even if every waiter has gone away
+        if not task.cancelled():
+            task.exception()
+
+    async def run(self, key: str, fn):
+        task = self._tasks.get(key)
+        if task is None:
+            self.leaders += 1
+            # The task inherits this request's context, so its stages land in the leader's trace
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(functools.partial(self._finished, key))
+            # Shielded: a disconnecting caller must not cancel the work the others wait on
+            return await asyncio.shield(task)
+        self.coalesced += 1
+        metrics.inc("text2sql_coalesced_total")
+        with stage("coalesced"):
+            return await asyncio.shield(task)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": COALESCE_REQUESTS, "in_flight": self.in_flight, "leaders": self.leaders, "coalesced": self.coalesced}
+
+single_flight = SingleFlight()
+
+def request_key(req: Text2SQLRequest) -> str:
+    """
+    Identity of a request for deduplication: same question, assumptions and output options.
+    """
+    return "\x1f".join([
+        normalize_question(req.question),
+        normalize_question(req.assumptions),
+        str(req.limit),
+        req.format,
+        req.explain,
+        str(req.timeout_seconds),
+    ])
+
+async def run_coalesced(req: Text2SQLRequest) -> Text2SQLResponse:
+    """
+    run_pipeline, shared with any identical request already in flight.
+    """
+    if not COALESCE_REQUESTS:
+        return await run_pipeline(req)
+    return await single_flight.run(request_key(req), lambda: run_pipeline(req))
+
+async def run_pipeline(req: Text2SQLRequest) -> Text2SQLResponse:
+    """
+    Generate SQL from NL question, execute it, and explain the results.
+    Raises HTTPException on failure; shared by the single and batch endpoints.
     """
     try:
-        # Step 1: Generate SQL query
-        user_content = req.question
-        if req.assumptions:
-            user_content += f"\n\nAdditional assumptions/notes: {req.assumptions}"
-            
-        messages = [
-            {"role": "system", "content": SQL_GENERATION_PROMPT},
-            {"role": "user", "content": user_content}
-        ]
-        
-        sql_out = model.chat(messages=messages)
-        sql_content = sql_out["choices"][0]["message"]["content"]
-        
-        # Step 2: Extract and clean SQL query
-        sql_query = extract_sql_query(sql_content)
+        # Step 1-2: Generate and clean SQL query (skipped on cache hit)
+        with stage("sql_generation"):
+            sql_query, pending_key = await acached_sql(req.question, req.assumptions)
         
         # Step 3: Execute query
-        sql_to_run = maybe_wrap_with_limit(sql_query, req.limit)
-        results = run_select(sql_to_run)
+        sql_to_run = maybe_wrap_with_limit(sql_query, row_probe_limit(req.limit))
+        results, execution = await execute_admitted(sql_to_run, req.limit, req.format, req.timeout_seconds)
+        # Only remember SQL that actually executed
+        await run_in_db_executor(remember_sql, pending_key, req.question, req.assumptions, sql_query)
         
         # Step 4: Generate explanation based on results
-        explanation = generate_explanation(req.question, sql_query, results)
+        with stage("explanation"):
+            explanation = await aexplain(req.question, sql_query, results, req.explain)
 
+        result_handle, cursor = create_result_handle(sql_query, results)
         return Text2SQLResponse(
             sql_query=sql_query,
             explanation=explanation,
-            results=results
+            results=results,
+            result_handle=result_handle,
+            next_cursor=cursor,
+            execution=execution,
         )
 
     except ValueError as ve:
@@ -384,6 +1680,471 @@ def text2sql(req: Text2SQLRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Model/DB error: {e}")
 
+@app.post("/text2sql", response_model=Text2SQLResponse)
+async def text2sql(req: Text2SQLRequest):
+    """
+    Generate SQL from NL question, execute it on school.db, and return results with AI-generated explanation.
+    Identical questions already in flight share that pipeline run.
+    """
+    return await run_coalesced(req)
+
+# =========================
+# Streaming (Server-Sent Events)
+# =========================
+SSE_ROW_CHUNK_SIZE = int(os.getenv("SSE_ROW_CHUNK_SIZE", "200"))
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+def slice_results(results: Dict[str, Any], start: int, stop: int) -> Dict[str, Any]:
+    fmt = results.get("format", "rows")
+    if fmt == "rows":
+        return {"offset": start, "rows": results["rows"][start:stop]}
+    if fmt == "matrix":
+        return {"offset": start, "data": results["data"][start:stop]}
+    return {"offset": start, "data": [col[start:stop] for col in results["data"]]}
+
+async def text2sql_events(req: Text2SQLRequest):
+    """
+    Same pipeline as /text2sql, emitted as it progresses:
+    sql -> columns -> rows (chunked) -> explanation (token deltas) -> done.
+    """
+    try:
+        with stage("sql_generation"):
+            sql_query, pending_key = await acached_sql(req.question, req.assumptions)
+        yield sse_event("sql", {"sql_query": sql_query, "cached": pending_key is None})
+
+        sql_to_run = maybe_wrap_with_limit(sql_query, row_probe_limit(req.limit))
+        results, execution = await execute_admitted(sql_to_run, req.limit, req.format, req.timeout_seconds)
+        await run_in_db_executor(remember_sql, pending_key, req.question, req.assumptions, sql_query)
+        yield sse_event("columns", {
+            "columns": results["columns"],
+            "row_count": results["row_count"],
+            "truncated": results.get("truncated", False),
+            "format": req.format,
+            "execution": execution,
+        })
+        for start in range(0, results["row_count"], SSE_ROW_CHUNK_SIZE):
+            yield sse_event("rows", slice_results(results, start, start + SSE_ROW_CHUNK_SIZE))
+
+        key = explanation_cache_key(req.question, sql_query, results)
+        explanation = explanation_cache.get(key) if req.explain != "never" else ""
+        if req.explain == "auto" and explanation is None:
+            explanation = template_explanation(req.question, results)
+            if explanation is not None:
+                bump(explain_counters, "template")
+        if explanation is not None:
+            if explanation:
+                yield sse_event("explanation", {"delta": explanation})
+        else:
+            bump(explain_counters, "llm")
+            parts: List[str] = []
+            try:
+                messages = build_explanation_messages(req.question, sql_query, results)
+                async for delta in llm_gate.stream(messages):
+                    parts.append(delta)
+                    yield sse_event("explanation", {"delta": delta})
+                explanation = "".join(parts).strip()
+                explanation_cache.put(key, explanation)
+            except Exception:
+                if not parts:
+                    explanation = fallback_explanation(results)
+                    yield sse_event("explanation", {"delta": explanation})
+                else:
+                    explanation = "".join(parts).strip()
+
+        result_handle, cursor = create_result_handle(sql_query, results)
+        yield sse_event("done", {
+            "row_count": results["row_count"],
+            "explanation": explanation,
+            "result_handle": result_handle,
+            "next_cursor": cursor,
+        })
+
+    except ValueError as ve:
+        yield sse_event("error", {"status_code": 400, "detail": f"SQL parsing error: {ve}"})
+    except HTTPException as he:
+        yield sse_event("error", {"status_code": he.status_code, "detail": he.detail})
+    except Exception as e:
+        yield sse_event("error", {"status_code": 500, "detail": f"Model/DB error: {e}"})
+
+@app.post("/text2sql/stream")
+async def text2sql_stream(req: Text2SQLRequest):
+    """
+    Streaming variant of /text2sql. Non-streaming callers keep using /text2sql.
+    """
+    return StreamingResponse(
+        text2sql_events(req),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# =========================
+# Batch
+# =========================
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+class BatchText2SQLRequest(BaseModel):
+    items: List[Text2SQLRequest] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+    max_concurrency: Optional[int] = Field(None, ge=1, le=64, description="Pipelines run in parallel (default BATCH_MAX_CONCURRENCY)")
+
+class BatchItemError(BaseModel):
+    status_code: int
+    detail: Any
+
+class BatchItemResult(BaseModel):
+    index: int
+    ok: bool
+    response: Optional[Text2SQLResponse] = None
+    error: Optional[BatchItemError] = None
+    deduplicated: bool = False
+
+class BatchText2SQLResponse(BaseModel):
+    results: List[BatchItemResult]
+    unique_items: int
+
+async def run_pipeline_safe(req: Text2SQLRequest) -> Tuple[Optional[Text2SQLResponse], Optional[BatchItemError]]:
+    try:
+        return await run_coalesced(req), None
+    except HTTPException as he:
+        return None, BatchItemError(status_code=he.status_code, detail=he.detail)
+
+@app.post("/text2sql/batch", response_model=BatchText2SQLResponse)
+async def text2sql_batch(req: BatchText2SQLRequest):
+    """
+    Run many questions at once. Identical items are executed once; unique items run
+    in parallel (bounded), and each item reports its own result or error.
+    """
+    unique: "OrderedDict[str, Text2SQLRequest]" = OrderedDict()
+    keys = []
+    for item in req.items:
+        key = request_key(item)
+        unique.setdefault(key, item)
+        keys.append(key)
+
+    sem = asyncio.Semaphore(req.max_concurrency or BATCH_MAX_CONCURRENCY)
+
+    async def run_one(item: Text2SQLRequest):
+        async with sem:
+            return await run_pipeline_safe(item)
+
+    outcomes = dict(zip(unique.keys(), await asyncio.gather(*(run_one(item) for item in unique.values()))))
+
+    results = []
+    seen = set()
+    for index, key in enumerate(keys):
+        response, error = outcomes[key]
+        results.append(BatchItemResult(
+            index=index,
+            ok=error is None,
+            response=response,
+            error=error,
+            deduplicated=key in seen,
+        ))
+        seen.add(key)
+    return BatchText2SQLResponse(results=results, unique_items=len(unique))
+
+# =========================
+# Result Handles (paging)
+# =========================
+@app.post("/results/{handle_id}/page", response_model=PageResponse)
+async def result_page(handle_id: str, req: PageRequest):
+    """
+    Further rows of a /text2sql result, re-running the pinned SQL without the model.
+    Handles expire after RESULT_HANDLE_TTL_SECONDS and when the database is rebuilt.
+    """
+    handle = result_handles.get(handle_id)
+    if handle is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired result handle.")
+    if handle["db_version"] != db_fingerprint():
+        raise HTTPException(status_code=410, detail="The database was rebuilt; ask the question again.")
+    state = decode_cursor(req.cursor) if req.cursor else {"o": req.offset or 0}
+    try:
+        if handle["key"] and "v" in state and "unique" not in handle:
+            with stage("db"):
+                repeated = await run_in_db_executor(run_select, unique_key_sql(handle), 1)
+            handle["unique"] = repeated["row_count"] == 0
+        sql, mode = page_sql(handle, state, row_probe_limit(req.limit))
+        results, execution = await execute_admitted(sql, req.limit, req.format)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"DB error: {e}")
+    return PageResponse(
+        result_handle=handle_id,
+        sql_query=handle["sql"],
+        offset=state["o"],
+        mode=mode,
+        results=results,
+        next_cursor=next_cursor(handle, state, results),
+        execution=execution,
+    )
+
+# =========================
+# Bulk Export
+# =========================
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+# Exports get their own connections, so a slow download never holds one of db_pool's
+export_pool = SQLiteReadPool(DB_PATH, EXPORT_MAX_CONCURRENCY)
+export_slots = asyncio.Semaphore(EXPORT_MAX_CONCURRENCY)
+
+class ExportRequest(BaseModel):
+    question: Optional[str] = Field(None, description="Natural language question (ignored when sql_query is given)")
+    assumptions: Optional[str] = Field(None, description="Optional clarifications/assumptions")
+    sql_query: Optional[str] = Field(None, description="Previously generated SELECT to export as-is")
+    format: Literal["ndjson", "csv", "parquet"] = Field("ndjson", description="Output format")
+
+class NDJSONEncoder:
+    media_type = "application/x-ndjson"
+    extension = "ndjson"
+
+    def __init__(self, columns: List[str]):
+        self.columns = columns
+
+    def header(self) -> bytes:
+        return b""
+
+    def batch(self, rows: List[tuple]) -> bytes:
+        return "".join(
+            json.dumps(dict(zip(self.columns, row)), ensure_ascii=False, default=str) + "\n"
+            for row in rows
+        ).encode("utf-8")
+
+    def footer(self) -> bytes:
+        return b""
+
+class CSVEncoder:
+    media_type = "text/csv"
+    extension = "csv"
+
+    def __init__(self, columns: List[str]):
+        self.columns = columns
+        self._buf = io.StringIO()
+        self._writer = csv.writer(self._buf)
+
+    def _drain(self) -> bytes:
+        out = self._buf.getvalue().encode("utf-8")
+        self._buf.seek(0)
+        self._buf.truncate(0)
+        return out
+
+    def header(self) -> bytes:
+        self._writer.writerow(self.columns)
+        return self._drain()
+
+    def batch(self, rows: List[tuple]) -> bytes:
+        self._writer.writerows(rows)
+        return self._drain()
+
+    def footer(self) -> bytes:
+        return b""
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        data = bytes(b)
+        self._chunks.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks = []
+        return out
+
+class ParquetEncoder:
+    media_type = "application/vnd.apache.parquet"
+    extension = "parquet"
+
+    def __init__(self, columns: List[str]):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise HTTPException(status_code=501, detail="Parquet export requires pyarrow to be installed.")
+        self._pa = pa
+        self._pq = pq
+        self.columns = columns
+        self._sink = _ChunkSink()
+        self._writer = None
+
+    def _schema(self, rows: List[tuple]):
+        pa = self._pa
+        fields = []
+        for i, name in enumerate(self.columns):
+            kinds = {type(row[i]) for row in rows if row[i] is not None}
+            if kinds and kinds <= {int}:
+                typ = pa.int64()
+            elif kinds and kinds <= {int, float}:
+                typ = pa.float64()
+            elif kinds == {bytes}:
+                typ = pa.binary()
+            else:
+                typ = pa.string()
+            fields.append(pa.field(name, typ))
+        return pa.schema(fields)
+
+    def header(self) -> bytes:
+        return b""
+
+    def batch(self, rows: List[tuple]) -> bytes:
+        pa = self._pa
+        if self._writer is None:
+            # Schema is fixed from the first batch; SQLite's dynamic typing is coerced to it
+            self._arrow_schema = self._schema(rows)
+            self._writer = self._pq.ParquetWriter(self._sink, self._arrow_schema)
+        arrays = []
+        for i, field in enumerate(self._arrow_schema):
+            values = [row[i] for row in rows]
+            if pa.types.is_string(field.type):
+                values = [None if v is None else str(v) for v in values]
+            elif pa.types.is_floating(field.type):
+                values = [None if v is None else float(v) for v in values]
+            arrays.append(pa.array(values, type=field.type))
+        self._writer.write_table(pa.Table.from_arrays(arrays, names=self.columns))
+        return self._sink.drain()
+
+    def footer(self) -> bytes:
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self._sink, self._pa.schema(
+                [self._pa.field(name, self._pa.string()) for name in self.columns]
+            ))
+        self._writer.close()
+        return self._sink.drain()
+
+EXPORT_ENCODERS = {"ndjson": NDJSONEncoder, "csv": CSVEncoder, "parquet": ParquetEncoder}
+
+def export_timed_out(e: Exception, deadline: Optional[float]) -> bool:
+    if deadline is None or not isinstance(e, sqlite3.OperationalError) or time.monotonic() <= deadline:
+        return False
+    metrics.inc("sql_timeouts_total")
+    bump(admission_counters, "timeouts")
+    return True
+
+def open_export_cursor(sql: str, deadline: Optional[float]) -> Tuple[ExitStack, sqlite3.Cursor]:
+    """
+    Check out an export connection and start executing under the export deadline,
+    which stays armed while the rows are fetched; the caller owns the ExitStack.
+    """
+    ensure_select_only(sql)
+    stack = ExitStack()
+    try:
+        pool = export_pool
+        partitions = get_partition_set()
+        if partitions is not None and partitions.referenced_tables(sql) & partitions.tables:
+            # Streamed as one cursor, so exports read the partitions through the union views
+            pool = partitions.export_pool
+        conn = stack.enter_context(pool.connection())
+        stack.enter_context(interrupt_after(conn, deadline))
+        cur = conn.cursor()
+        cur.row_factory = None
+        cur.execute(sql)
+        return stack, cur
+    except Exception as e:
+        stack.close()
+        if export_timed_out(e, deadline):
+            raise HTTPException(status_code=504, detail="SQL execution error: the export ran past its deadline and was cancelled.")
+        raise HTTPException(status_code=400, detail=f"SQL execution error: {e}")
+
+async def export_stream(stack: ExitStack, cur: sqlite3.Cursor, encoder, executor: ThreadPoolExecutor,
+                        deadline: Optional[float]):
+    """
+    Stream the full result set batch by batch; memory stays at one batch regardless of row count.
+    Releases the export slot when done.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        chunk = encoder.header()
+        if chunk:
+            yield chunk
+        while True:
+            try:
+                rows = await loop.run_in_executor(executor, cur.fetchmany, EXPORT_BATCH_SIZE)
+            except Exception as e:
+                # Headers are already sent: a timeout can only cut the download short
+                export_timed_out(e, deadline)
+                raise
+            if not rows:
+                break
+            chunk = encoder.batch(rows)
+            if chunk:
+                yield chunk
+        chunk = encoder.footer()
+        if chunk:
+            yield chunk
+    finally:
+        await loop.run_in_executor(executor, stack.close)
+        export_slots.release()
+
+@app.post("/export")
+async def export(req: ExportRequest):
+    """
+    Stream the complete result of a question (or a given SELECT) as NDJSON, CSV or Parquet.
+    No row limit is applied and no explanation is generated. The statement goes through
+    admission control and runs under EXPORT_TIMEOUT_SECONDS; beyond
+    EXPORT_MAX_CONCURRENCY exports in flight the request gets a 429.
+    """
+    pending_key = None
+    try:
+        if req.sql_query:
+            sql_query = req.sql_query.strip()
+        elif req.question:
+            with stage("sql_generation"):
+                sql_query, pending_key = await acached_sql(req.question, req.assumptions)
+        else:
+            raise HTTPException(status_code=400, detail="Either question or sql_query is required.")
+
+        ensure_select_only(sql_query)
+        with stage("admission"):
+            admission = await run_in_db_executor(admit_query, sql_query)
+        record_admission(dict(admission))
+        executor = heavy_executor if admission["decision"] == "heavy" else db_executor
+        deadline = time.monotonic() + EXPORT_TIMEOUT_SECONDS if EXPORT_TIMEOUT_SECONDS > 0 else None
+
+        if export_slots.locked():
+            raise HTTPException(status_code=429, detail="Too many exports in progress; try again shortly.")
+        await export_slots.acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            stack, cur = await loop.run_in_executor(executor, open_export_cursor, sql_query, deadline)
+        except BaseException:
+            export_slots.release()
+            raise
+        await run_in_db_executor(remember_sql, pending_key, req.question, req.assumptions, sql_query)
+        try:
+            encoder = EXPORT_ENCODERS[req.format]([c[0] for c in cur.description or []])
+        except BaseException:
+            await loop.run_in_executor(executor, stack.close)
+            export_slots.release()
+            raise
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=f"SQL parsing error: {ve}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Model/DB error: {e}")
+
+    return StreamingResponse(
+        export_stream(stack, cur, encoder, executor, deadline),
+        media_type=encoder.media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="export.{encoder.extension}"',
+            "X-SQL-Query": urllib.parse.quote(" ".join(sql_query.split())),
+        },
+    )
+
 # Local dev
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,283 @@
+"""
+Offline load test for the Text2SQL API.
+
+Replays a question corpus, or recorded traffic, against the FastAPI app
+in-process, with the stand-in model backend by default, so it needs neither
+network access nor watsonx.ai credentials. Reports p50/p95/p99 per pipeline
+stage (from the Server-Timing header) plus end-to-end latency and throughput.
+
+--replay takes the API's SQL workload log (SQL_WORKLOAD_LOG_PATH) or its
+question index: every logged question is asked again, and the stand-in model
+answers it with the SQL that was logged for it, so the database sees the
+production query mix.
+
+    python BE/bench/loadtest.py --concurrency 8 --rounds 5
+    python BE/bench/loadtest.py --replay BE/sql_workload.jsonl --cold --output bench.json
+    python BE/bench/loadtest.py --baseline bench.json --max-regression 0.25   # CI gate
+
+Set MODEL_BACKEND=watsonx (with credentials) to measure against the real model.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+BE_DIR = BENCH_DIR.parent
+REPO_DIR = BE_DIR.parent
+
+_TIMING_ENTRY = re.compile(r'\s*([\w-]+)\s*(?:;\s*dur=([\d.]+))?(?:;\s*desc="[^"]*")?\s*')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay questions against the Text2SQL API and report latency percentiles")
+    parser.add_argument("--corpus", action="append", default=[], help="Question file: .txt (one per line) or .jsonl "
+                        "(\"question\" per record); repeatable. Default: bench/questions.txt")
+    parser.add_argument("--replay", action="append", default=[], help="Workload log or question index (.jsonl with "
+                        "\"sql\" and \"question\") to replay with its recorded SQL; repeatable")
+    parser.add_argument("--rounds", type=int, default=3, help="Times the corpus is replayed")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once")
+    parser.add_argument("--endpoint", default="/text2sql", choices=["/text2sql", "/text2sql/stream"])
+    parser.add_argument("--explain", default="auto", choices=["auto", "always", "never"])
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--cold", action="store_true", help="Disable the SQL/result/explanation caches")
+    parser.add_argument("--latency-ms", type=float, help="Stand-in model latency (STUB_MODEL_LATENCY_MS)")
+    parser.add_argument("--jitter-ms", type=float, help="Stand-in model latency jitter (STUB_MODEL_JITTER_MS)")
+    parser.add_argument("--db", help="SQLite database (default: DATA/data.db)")
+    parser.add_argument("--output", help="Write the report as JSON")
+    parser.add_argument("--baseline", help="Previous JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="Fail if p95 latency grows (or throughput drops) by more than this fraction vs --baseline")
+    return parser.parse_args()
+
+
+def configure_env(args, recorded=()):
+    """Environment for the app under test; must run before it is imported"""
+    os.environ.setdefault("MODEL_BACKEND", "stub")
+    os.environ.setdefault("STUB_MODEL_RESPONSES", str(BENCH_DIR / "stub_responses.jsonl"))
+    if recorded:
+        # Recorded SQL first, so replayed questions get exactly what was logged for them
+        path = Path(tempfile.mkdtemp(prefix="text2sql-replay-")) / "stub_responses.jsonl"
+        with open(path, "w", encoding="utf-8") as out:
+            for question, sql in recorded:
+                out.write(json.dumps({"question": question, "sql": sql}, ensure_ascii=False) + "\n")
+            with open(os.environ["STUB_MODEL_RESPONSES"], encoding="utf-8") as f:
+                out.write(f.read())
+        os.environ["STUB_MODEL_RESPONSES"] = str(path)
+    os.environ["DB_PATH"] = str(Path(args.db).resolve()) if args.db else os.getenv(
+        "DB_PATH", str(REPO_DIR / "DATA" / "data.db"))
+    # Never let a benchmark write into the real similar-question index or workload log
+    os.environ["QUESTION_INDEX_PATH"] = str(Path(tempfile.mkdtemp(prefix="text2sql-bench-")) / "question_index.jsonl")
+    os.environ["SQL_WORKLOAD_LOG_PATH"] = ""
+    if args.latency_ms is not None:
+        os.environ["STUB_MODEL_LATENCY_MS"] = str(args.latency_ms)
+    if args.jitter_ms is not None:
+        os.environ["STUB_MODEL_JITTER_MS"] = str(args.jitter_ms)
+    if args.cold:
+        os.environ["SQL_CACHE_MAX_ENTRIES"] = "0"
+        os.environ["RESULT_CACHE_MAX_BYTES"] = "0"
+        os.environ["EXPLANATION_CACHE_MAX_ENTRIES"] = "0"
+        os.environ["QUESTION_INDEX_ENABLED"] = "false"
+
+
+def load_questions(paths):
+    questions = []
+    for path in paths:
+        path = Path(path)
+        with open(path, encoding="utf-8") as f:
+            if path.suffix.lower() == ".jsonl":
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    record = json.loads(line)
+                    question = record.get("question")
+                    if question:
+                        questions.append(question.strip())
+            else:
+                questions += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    return questions
+
+
+def load_replay(paths):
+    """
+    (question, sql) pairs from workload logs or question indexes. Log records
+    written before questions were logged get a placeholder question per query.
+    """
+    recorded = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                sql = record.get("sql")
+                if sql:
+                    recorded.append((record.get("question") or f"Replay query {len(recorded) + 1}", sql))
+    return recorded
+
+
+def parse_server_timing(header):
+    """{stage: milliseconds} from a Server-Timing header"""
+    stages = {}
+    for entry in (header or "").split(","):
+        m = _TIMING_ENTRY.fullmatch(entry)
+        if m and m.group(2) is not None:
+            stages[m.group(1)] = float(m.group(2))
+    return stages
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+def summarize(samples):
+    values = sorted(samples)
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": values[-1] if values else 0.0,
+    }
+
+
+async def run_load(app, questions, args):
+    import httpx
+
+    queue = asyncio.Queue()
+    for question in questions:
+        queue.put_nowait(question)
+    stage_samples = defaultdict(list)
+    latencies = []
+    statuses = Counter()
+
+    async def worker(client):
+        while True:
+            try:
+                question = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            body = {"question": question, "explain": args.explain, "limit": args.limit}
+            started = time.perf_counter()
+            try:
+                response = await client.post(args.endpoint, json=body)
+                await response.aread()
+                status = str(response.status_code)
+                if args.endpoint.endswith("/stream") and "event: error" in response.text:
+                    status = "stream-error"
+            except Exception as e:
+                statuses[type(e).__name__] += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[status] += 1
+            for name, ms in parse_server_timing(response.headers.get("server-timing")).items():
+                stage_samples[name].append(ms)
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(client) for _ in range(max(1, args.concurrency))))
+            wall = time.perf_counter() - started
+
+    return {
+        "config": {
+            "endpoint": args.endpoint,
+            "concurrency": args.concurrency,
+            "requests": len(questions),
+            "cold": args.cold,
+            "backend": os.environ.get("MODEL_BACKEND"),
+            "stub_latency_ms": float(os.environ.get("STUB_MODEL_LATENCY_MS", "50")),
+        },
+        "wall_seconds": wall,
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "statuses": dict(statuses),
+        "latency_ms": summarize(latencies),
+        "stages_ms": {name: summarize(values) for name, values in stage_samples.items()},
+    }
+
+
+def print_report(report):
+    cfg = report["config"]
+    print(f"\n{cfg['requests']} requests to {cfg['endpoint']} at concurrency {cfg['concurrency']} "
+          f"(backend={cfg['backend']}, cold={cfg['cold']})")
+    print(f"Throughput: {report['throughput_rps']:.1f} req/s over {report['wall_seconds']:.2f}s; "
+          f"statuses: {report['statuses']}")
+    print(f"\n{'stage':<16}{'count':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}   (ms)")
+    rows = list(report["stages_ms"].items()) + [("end-to-end", report["latency_ms"])]
+    for name, s in rows:
+        print(f"{name:<16}{s['count']:>7}{s['mean']:>10.1f}{s['p50']:>10.1f}{s['p95']:>10.1f}{s['p99']:>10.1f}{s['max']:>10.1f}")
+
+
+def compare(report, baseline, max_regression):
+    """Regression messages vs a baseline report (empty when within tolerance)"""
+    problems = []
+    checks = [("end-to-end", report["latency_ms"], baseline.get("latency_ms"))]
+    checks += [(name, s, baseline.get("stages_ms", {}).get(name)) for name, s in report["stages_ms"].items()]
+    for name, current, previous in checks:
+        if not previous or previous["p95"] <= 0:
+            continue
+        growth = current["p95"] / previous["p95"] - 1
+        if growth > max_regression:
+            problems.append(f"{name} p95 {previous['p95']:.1f} -> {current['p95']:.1f} ms (+{growth:.0%})")
+    if baseline.get("throughput_rps"):
+        drop = 1 - report["throughput_rps"] / baseline["throughput_rps"]
+        if drop > max_regression:
+            problems.append(f"throughput {baseline['throughput_rps']:.1f} -> {report['throughput_rps']:.1f} req/s (-{drop:.0%})")
+    return problems
+
+
+def main():
+    args = parse_args()
+    recorded = load_replay(args.replay)
+    if recorded and os.environ.get("MODEL_BACKEND", "stub") != "stub":
+        print("Note: --replay only pins the recorded SQL with the stub backend; the model regenerates it.")
+    configure_env(args, recorded)
+    sys.path.insert(0, str(BE_DIR))
+    import app as text2sql_app
+
+    questions = [question for question, _ in recorded]
+    if args.corpus or not recorded:
+        questions += load_questions(args.corpus or [BENCH_DIR / "questions.txt"])
+    if not questions:
+        print("No questions to replay.")
+        return 1
+    questions = questions * max(1, args.rounds)
+
+    report = asyncio.run(run_load(text2sql_app.app, questions, args))
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare(report, json.load(f), args.max_regression)
+        if problems:
+            print("\nPerformance regression vs baseline:")
+            for problem in problems:
+                print(f"  - {problem}")
+            return 1
+        print("\nWithin tolerance of baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+Query-plan regression suite.
+
+Runs a golden set of generated SQL (bench/stub_responses.jsonl by default, plus
+any --queries files) against one or more databases, typically the scaled-up
+ones from DATA/scale_up.py. For each query it records the best-of-N time, the
+row count and the EXPLAIN QUERY PLAN, and it compares them with a saved
+baseline. A table that is now read with a full scan, and was not before, is a
+regression. So is, optionally, a slowdown beyond --max-slowdown.
+
+    python DATA/scale_up.py --factor 100 --output /tmp/data_x100.db
+    python BE/bench/plan_regression.py --db /tmp/data_x100.db --update      # record the baseline
+    python BE/bench/plan_regression.py --db /tmp/data_x100.db               # check against it
+"""
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent.parent
+sys.path.insert(0, str(REPO_DIR / "DATA"))
+
+from index_advisor import read_workload  # noqa: E402
+
+DEFAULT_QUERIES = [BENCH_DIR / "stub_responses.jsonl"]
+DEFAULT_BASELINE = BENCH_DIR / "plan_baseline.json"
+# "SCAN t" / "SCAN TABLE t" without an index is a full table scan; covering-index scans are not flagged
+_FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$")
+
+
+def query_id(sql):
+    return hashlib.sha1(" ".join(sql.split()).encode("utf-8")).hexdigest()[:12]
+
+
+def explain(conn, sql):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+
+
+def full_scans(conn, sql, plan):
+    """Real tables read by a full scan (subquery/CTE materializations are not tables)"""
+    tables = {r[0].lower(): r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    aliases = {}
+    for table, alias in re.findall(r'\b(?:FROM|JOIN)\s+"?(\w+)"?(?:\s+(?:AS\s+)?(\w+))?', sql, re.I):
+        if table.lower() in tables:
+            aliases[(alias or table).lower()] = tables[table.lower()]
+            aliases[table.lower()] = tables[table.lower()]
+    scans = []
+    for detail in plan:
+        m = _FULL_SCAN.match(detail.strip())
+        if m and m.group(1).lower() in aliases:
+            scans.append(aliases[m.group(1).lower()])
+    return sorted(set(scans))
+
+
+def run_suite(db_path, queries, repeat=3):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    results = {}
+    try:
+        for sql in dict.fromkeys(queries):
+            qid = query_id(sql)
+            try:
+                plan = explain(conn, sql)
+                best, rows = None, 0
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    rows = len(conn.execute(sql).fetchall())
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+            except sqlite3.Error as e:
+                results[qid] = {"sql": sql, "error": str(e)}
+                continue
+            results[qid] = {
+                "sql": sql,
+                "ms": round(best * 1000, 3),
+                "rows": rows,
+                "plan": plan,
+                "full_scans": full_scans(conn, sql, plan),
+            }
+    finally:
+        conn.close()
+    return results
+
+
+def compare(current, baseline, max_slowdown=None):
+    """(regressions, notes) for one database's results vs its baseline"""
+    regressions, notes = [], []
+    for qid, cur in current.items():
+        prev = baseline.get(qid)
+        label = f"{qid} {' '.join(cur['sql'].split())[:80]}"
+        if "error" in cur:
+            regressions.append(f"{label}\n      fails: {cur['error']}")
+            continue
+        if prev is None or "error" in prev:
+            if cur["full_scans"]:
+                notes.append(f"{label}\n      new query, full scan of {', '.join(cur['full_scans'])}")
+            continue
+        new_scans = sorted(set(cur["full_scans"]) - set(prev.get("full_scans", [])))
+        if new_scans:
+            regressions.append(
+                f"{label}\n      new full scan of {', '.join(new_scans)}\n"
+                f"      was: {' | '.join(prev['plan'])}\n      now: {' | '.join(cur['plan'])}"
+            )
+        if max_slowdown and prev.get("ms", 0) > 0 and cur["ms"] > prev["ms"] * max_slowdown:
+            regressions.append(f"{label}\n      {prev['ms']:.2f} ms -> {cur['ms']:.2f} ms")
+    return regressions, notes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check generated SQL for query-plan regressions")
+    parser.add_argument("--db", action="append", required=True, help="Database to test; repeatable")
+    parser.add_argument("--queries", action="append", default=[], help="Extra golden SQL (.jsonl with \"sql\", or .sql)")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="Baseline JSON (keyed by database file name)")
+    parser.add_argument("--update", action="store_true", help="Record the current plans as the new baseline")
+    parser.add_argument("--max-slowdown", type=float, help="Also fail when a query gets this many times slower")
+    args = parser.parse_args()
+
+    queries = read_workload(DEFAULT_QUERIES + [Path(q) for q in args.queries])
+    baseline_path = Path(args.baseline)
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+
+    failed = False
+    for db in args.db:
+        label = Path(db).name
+        current = run_suite(db, queries)
+        total_ms = sum(r.get("ms", 0) for r in current.values())
+        scans = sum(1 for r in current.values() if r.get("full_scans"))
+        print(f"\n{label}: {len(current)} queries, {total_ms:.1f} ms total, {scans} with full table scans")
+        if args.update:
+            baseline[label] = current
+            continue
+        if label not in baseline:
+            print(f"  no baseline for {label}; run with --update to record one")
+            continue
+        regressions, notes = compare(current, baseline[label], args.max_slowdown)
+        for note in notes:
+            print(f"  note: {note}")
+        for regression in regressions:
+            print(f"  REGRESSION: {regression}")
+        failed = failed or bool(regressions)
+        if not regressions:
+            print("  no plan regressions")
+
+    if args.update:
+        baseline_path.write_text(json.dumps(baseline, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"\nBaseline written to {baseline_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
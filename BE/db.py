@@ -0,0 +1,297 @@
+"""
+SQLite access shared by the API modules: read-only connection pools, row
+encoding, execution deadlines and the top-level SQL word scanner.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Tuple
+
+from fastapi import HTTPException
+
+DB_PATH = os.getenv("DB_PATH", "../DATA/data.db")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Connections reserved for /export, which holds one for the whole download
+EXPORT_MAX_CONCURRENCY = int(os.getenv("EXPORT_MAX_CONCURRENCY", "2"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "65536"))
+# Load the whole database into memory (one copy per pooled connection); only for small DBs
+DB_IN_MEMORY = os.getenv("DB_IN_MEMORY", "false").lower() in ("1", "true", "yes")
+
+def db_fingerprint() -> str:
+    """
+    Cheap version token for the database file (inode, size, mtime).
+    Changes whenever DATA/build_datadase.py rewrites or replaces data.db.
+    """
+    try:
+        st = os.stat(DB_PATH)
+        return f"{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+    except OSError:
+        return "missing"
+
+class SQLiteReadPool:
+    """
+    Pool of read-only SQLite connections checked out per request.
+    Connections opened against an older version of the DB file are closed
+    and reopened transparently when the file is swapped.
+    """
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._idle: "queue.LifoQueue[Tuple[sqlite3.Connection, str]]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._version = ""
+        self._snapshot: Optional[bytes] = None
+        self.opened = 0
+        self.discarded = 0
+        self.reloads = 0
+
+    def _uri(self) -> str:
+        return f"file:{os.path.abspath(self.path)}?mode=ro"
+
+    def _open(self) -> sqlite3.Connection:
+        if DB_IN_MEMORY:
+            conn = sqlite3.connect(":memory:", check_same_thread=False)
+            conn.deserialize(self._load_snapshot())
+        else:
+            conn = sqlite3.connect(self._uri(), uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+        conn.execute("PRAGMA query_only = ON")
+        conn.row_factory = sqlite3.Row
+        self.opened += 1
+        return conn
+
+    def _load_snapshot(self) -> bytes:
+        with self._lock:
+            if self._snapshot is None:
+                src = sqlite3.connect(self._uri(), uri=True)
+                try:
+                    self._snapshot = src.serialize()
+                finally:
+                    src.close()
+            return self._snapshot
+
+    def _current_version(self) -> str:
+        version = db_fingerprint()
+        with self._lock:
+            if version != self._version:
+                if self._version:
+                    self.reloads += 1
+                self._version = version
+                self._snapshot = None
+        return version
+
+    def _close(self, conn: sqlite3.Connection) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self):
+        version = self._current_version()
+        if not self._slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise RuntimeError(f"Timed out after {DB_POOL_TIMEOUT}s waiting for a database connection")
+        conn = None
+        try:
+            while conn is None:
+                try:
+                    idle_conn, idle_version = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = self._open()
+                    break
+                if idle_version == version:
+                    conn = idle_conn
+                else:
+                    self._close(idle_conn)
+            healthy = True
+            try:
+                yield conn
+            except BaseException:
+                healthy = self._probe(conn)
+                raise
+            finally:
+                if healthy and version == self._version:
+                    conn.rollback()
+                    self._idle.put((conn, version))
+                else:
+                    self.discarded += 1
+                    self._close(conn)
+        finally:
+            self._slots.release()
+
+    def _probe(self, conn: sqlite3.Connection) -> bool:
+        # Distinguish a bad query from a broken connection
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except Exception:
+            return False
+
+    def close_all(self) -> None:
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "opened": self.opened,
+            "discarded": self.discarded,
+            "reloads": self.reloads,
+            "in_memory": DB_IN_MEMORY,
+            "version": self._version,
+        }
+
+db_pool = SQLiteReadPool(DB_PATH, DB_POOL_SIZE)
+
+FETCH_BATCH_SIZE = int(os.getenv("FETCH_BATCH_SIZE", "1000"))
+
+def fetch_capped(cur: sqlite3.Cursor, max_rows: Optional[int]) -> Tuple[List[tuple], bool]:
+    """
+    Read at most max_rows rows with fetchmany; report whether more rows were available.
+    """
+    if not max_rows:
+        return cur.fetchall(), False
+    rows: List[tuple] = []
+    while len(rows) < max_rows:
+        batch = cur.fetchmany(min(FETCH_BATCH_SIZE, max_rows - len(rows)))
+        if not batch:
+            return rows, False
+        rows.extend(batch)
+    return rows, cur.fetchone() is not None
+
+def encode_rows(columns: List[str], rows: List[tuple], row_format: str, truncated: bool) -> Dict[str, Any]:
+    """
+    Shape raw row tuples for the response:
+    - rows:     {"rows": [{col: val, ...}, ...]}  (default, backwards compatible)
+    - matrix:   {"data": [[val, ...], ...]}       (one array per row)
+    - columnar: {"data": [[val, ...], ...]}       (one array per column, aligned with columns)
+    """
+    results: Dict[str, Any] = {"columns": columns}
+    if row_format == "columnar":
+        results["format"] = "columnar"
+        results["data"] = [list(col) for col in zip(*rows)] if rows else [[] for _ in columns]
+    elif row_format == "matrix":
+        results["format"] = "matrix"
+        results["data"] = [list(row) for row in rows]
+    else:
+        results["rows"] = [dict(zip(columns, row)) for row in rows]
+    results["row_count"] = len(rows)
+    results["truncated"] = truncated
+    return results
+
+def result_records(results: Dict[str, Any], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Rows as dicts regardless of the encoding produced by encode_rows().
+    """
+    fmt = results.get("format", "rows")
+    if fmt == "rows":
+        rows = results.get("rows", [])
+        return rows[:limit] if limit is not None else rows
+    columns = results.get("columns", [])
+    data = results.get("data", [])
+    if fmt == "columnar":
+        data = list(zip(*data)) if data else []
+    if limit is not None:
+        data = data[:limit]
+    return [dict(zip(columns, row)) for row in data]
+
+# Execution deadline per statement; 0 disables it. Requests may ask for less, never more.
+SQL_TIMEOUT_SECONDS = float(os.getenv("SQL_TIMEOUT_SECONDS", "30"))
+# Exports stream for as long as the client keeps reading, so they get their own deadline
+EXPORT_TIMEOUT_SECONDS = float(os.getenv("EXPORT_TIMEOUT_SECONDS", "300"))
+# SQLite VM instructions between deadline checks
+SQL_PROGRESS_STEPS = int(os.getenv("SQL_PROGRESS_STEPS", "10000"))
+
+def query_deadline(timeout: Optional[float]) -> Optional[float]:
+    """
+    time.monotonic() deadline for a statement starting now (None when unlimited).
+    """
+    limit = SQL_TIMEOUT_SECONDS if SQL_TIMEOUT_SECONDS > 0 else None
+    if timeout:
+        limit = min(timeout, limit) if limit else timeout
+    return time.monotonic() + limit if limit else None
+
+@contextmanager
+def interrupt_after(conn: sqlite3.Connection, deadline: Optional[float]):
+    """
+    Abort whatever conn is executing once the deadline passes; SQLite then
+    raises OperationalError("interrupted") from execute() or fetchmany().
+    """
+    if deadline is None:
+        yield
+        return
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, SQL_PROGRESS_STEPS)
+    try:
+        yield
+    finally:
+        conn.set_progress_handler(None, 0)
+
+def ensure_select_only(sql: str) -> None:
+    # Basic safety: only allow SELECT; no multiple statements
+    stripped = sql.strip().rstrip(";").lstrip("(").strip()  # tolerate surrounding parens
+    if not stripped.lower().startswith("select"):
+        raise HTTPException(status_code=400, detail=f"Only SELECT queries are allowed. SQL: {sql}")
+    if ";" in sql.strip().rstrip(";"):
+        raise HTTPException(status_code=400, detail="Multiple statements are not allowed.")
+
+def top_level_keywords(sql: str) -> List[str]:
+    """
+    Upper-cased words that appear outside parentheses, string literals,
+    quoted identifiers and comments.
+    """
+    return [word for word, _ in top_level_words(sql)]
+
+def top_level_words(sql: str) -> List[Tuple[str, int]]:
+    """
+    (upper-cased word, offset) for the words top_level_keywords() returns.
+    """
+    words: List[Tuple[str, int]] = []
+    depth = 0
+    i, n = 0, len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch in "'\"`":
+            end = sql.find(ch, i + 1)
+            # Doubled quotes are escapes; the scan resumes after the pair
+            while end != -1 and end + 1 < n and sql[end + 1] == ch:
+                end = sql.find(ch, end + 2)
+            i = n if end == -1 else end + 1
+        elif ch == "[":
+            end = sql.find("]", i + 1)
+            i = n if end == -1 else end + 1
+        elif sql.startswith("--", i):
+            end = sql.find("\n", i)
+            i = n if end == -1 else end + 1
+        elif sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+        elif ch == "(":
+            depth += 1
+            i += 1
+        elif ch == ")":
+            depth -= 1
+            i += 1
+        elif ch.isalpha() or ch == "_":
+            j = i + 1
+            while j < n and (sql[j].isalnum() or sql[j] == "_"):
+                j += 1
+            if depth == 0:
+                words.append((sql[i:j].upper(), i))
+            i = j
+        else:
+            i += 1
+    return words
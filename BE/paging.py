@@ -0,0 +1,156 @@
+"""
+Result handles for paging through a /text2sql result without the model:
+the generated SQL is pinned with the database version, and each page re-runs
+it with keyset (unique order key) or OFFSET paging.
+"""
+import base64
+import json
+import os
+import re
+import secrets
+from typing import Optional, Dict, Any, List, Literal, Tuple
+
+from fastapi import HTTPException
+from pydantic import BaseModel, Field
+
+from cache import LRUCache
+from db import db_fingerprint, result_records, top_level_keywords
+
+RESULT_HANDLE_MAX_ENTRIES = int(os.getenv("RESULT_HANDLE_MAX_ENTRIES", "1024"))
+RESULT_HANDLE_TTL_SECONDS = float(os.getenv("RESULT_HANDLE_TTL_SECONDS", "900"))
+
+result_handles = LRUCache(RESULT_HANDLE_MAX_ENTRIES, RESULT_HANDLE_TTL_SECONDS)
+
+# A single plain output column at the end of the statement: "ORDER BY [t.]col [ASC|DESC] [LIMIT n [OFFSET m]]"
+_ORDER_KEY = re.compile(
+    r'\bORDER\s+BY\s+(?:\w+\.)?["`\[]?(\w+)["`\]]?(?:\s+(ASC|DESC))?'
+    r'(?:\s+LIMIT\s+\d+(?:\s*(?:OFFSET|,)\s*\d+)?)?\s*;?\s*$',
+    re.IGNORECASE,
+)
+
+class PageRequest(BaseModel):
+    cursor: Optional[str] = Field(None, description="next_cursor from the previous page (keyset paging)")
+    offset: Optional[int] = Field(None, ge=0, description="Row offset (ignored when cursor is given)")
+    limit: int = Field(500, ge=1, le=10000, description="Rows per page")
+    format: Literal["rows", "columnar", "matrix"] = Field("rows", description="Result encoding")
+
+class PageResponse(BaseModel):
+    result_handle: str
+    sql_query: str
+    offset: int
+    mode: Literal["keyset", "offset"]
+    results: Dict[str, Any]
+    next_cursor: Optional[str] = None
+    execution: Optional[Dict[str, Any]] = None
+
+def order_key(sql: str, columns: List[str]) -> Optional[Tuple[str, str]]:
+    """
+    (column, "ASC"|"DESC") when the query is ordered by one of its own output
+    columns, which allows keyset paging; None means offset paging.
+    """
+    if "ORDER" not in top_level_keywords(sql):
+        return None
+    m = _ORDER_KEY.search(sql.strip())
+    if not m or m.group(1) not in columns:
+        return None
+    return m.group(1), (m.group(2) or "ASC").upper()
+
+def sql_literal(value: Any) -> str:
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+def encode_cursor(state: Dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(state, default=str).encode("utf-8")).decode("ascii").rstrip("=")
+
+def _count(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """
+    Cursor state {"o": offset[, "v": last key value, "t": ties already returned]};
+    anything else is a 400.
+    """
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        state = None
+    if (
+        not isinstance(state, dict)
+        or not _count(state.get("o"))
+        or ("t" in state and not _count(state["t"]))
+        or ("v" in state and not isinstance(state["v"], (str, int, float)))
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    return state
+
+def next_cursor(handle: Dict[str, Any], state: Dict[str, Any], results: Dict[str, Any]) -> Optional[str]:
+    """
+    Cursor after this page: the position, plus for keyset paging the last key value
+    and how many rows with that value were already returned (ties are skipped by count).
+    """
+    if not results.get("truncated"):
+        return None
+    rows = results["row_count"]
+    nxt: Dict[str, Any] = {"o": state["o"] + rows}
+    if handle["key"] and handle.get("unique") is not False and rows:
+        column = handle["key"][0]
+        values = [r[column] for r in result_records(results)]
+        last = values[-1]
+        ties = 0
+        for v in reversed(values):
+            if v != last:
+                break
+            ties += 1
+        if ties == rows and state.get("v") == last and "v" in state:
+            ties += state.get("t", 0)
+        if last is not None:
+            nxt.update(v=last, t=ties)
+    return encode_cursor(nxt)
+
+def unique_key_sql(handle: Dict[str, Any]) -> str:
+    """
+    Finds a repeated order-key value. Rows that share one have no defined order
+    between them, so a keyset page could repeat or skip them.
+    """
+    inner = handle["sql"].strip().rstrip(";")
+    quoted = '"' + handle["key"][0].replace('"', '""') + '"'
+    return f"SELECT {quoted} FROM (\n{inner}\n) GROUP BY {quoted} HAVING COUNT(*) > 1 LIMIT 1;"
+
+def page_sql(handle: Dict[str, Any], state: Dict[str, Any], limit: int) -> Tuple[str, str]:
+    """
+    (SQL for one page, mode). Keyset pages filter on the order column so an index on it
+    can seek straight to the page; that needs a key with no repeated values
+    (handle["unique"]). Everything else pages with OFFSET.
+    """
+    inner = handle["sql"].strip().rstrip(";")
+    if handle["key"] and handle.get("unique") and "v" in state:
+        column, direction = handle["key"]
+        quoted = '"' + column.replace('"', '""') + '"'
+        if direction == "ASC":
+            where = f"{quoted} >= {sql_literal(state['v'])}"
+        else:
+            # NULLs sort last when descending, so they are always still ahead
+            where = f"({quoted} <= {sql_literal(state['v'])} OR {quoted} IS NULL)"
+        return (f"SELECT * FROM (\n{inner}\n) WHERE {where} ORDER BY {quoted} {direction}\n"
+                f"LIMIT {limit} OFFSET {int(state.get('t', 0))};", "keyset")
+    return f"SELECT * FROM (\n{inner}\n)\nLIMIT {limit} OFFSET {int(state['o'])};", "offset"
+
+def create_result_handle(sql_query: str, results: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    (handle, next_cursor) for a truncated result: pins the generated SQL and the
+    DB version so further pages never go back to the model. (None, None) otherwise.
+    """
+    if not results.get("truncated") or RESULT_HANDLE_MAX_ENTRIES <= 0:
+        return None, None
+    handle_id = secrets.token_urlsafe(16)
+    handle = {
+        "sql": sql_query,
+        "db_version": db_fingerprint(),
+        "columns": results.get("columns", []),
+        "key": order_key(sql_query, results.get("columns", [])),
+    }
+    result_handles.put(handle_id, handle)
+    return handle_id, next_cursor(handle, {"o": 0}, results)
@@ -0,0 +1,471 @@
+"""
+Partitioned databases, written by `build_datadase.py --partition-by <column>`:
+DB_PATH then holds the schema and the global summary tables only, and the raw
+rows live in one database per partition value. Statements are fanned out over
+the partitions and merged when they decompose, and otherwise run on one
+connection that ATTACHes every partition.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Tuple
+
+from db import (
+    DB_CACHE_SIZE_KB,
+    DB_PATH,
+    DB_POOL_SIZE,
+    EXPORT_MAX_CONCURRENCY,
+    SQLiteReadPool,
+    db_fingerprint,
+    db_pool,
+    fetch_capped,
+    interrupt_after,
+    top_level_words,
+)
+from telemetry import metrics
+
+DB_PARTITIONS_PATH = os.getenv("DB_PARTITIONS_PATH", os.path.splitext(DB_PATH)[0] + ".partitions.json")
+PARTITION_POOL_SIZE = int(os.getenv("PARTITION_POOL_SIZE", "4"))
+PARTITION_FANOUT_WORKERS = int(os.getenv("PARTITION_FANOUT_WORKERS", "8"))
+
+partition_executor = ThreadPoolExecutor(max_workers=PARTITION_FANOUT_WORKERS, thread_name_prefix="partition")
+
+_MERGEABLE_AGGREGATES = {"SUM", "TOTAL", "COUNT", "MIN", "MAX"}
+_AGGREGATE_CALL = re.compile(r"^(\w+)\s*\((.*)\)$", re.S)
+_ANY_AGGREGATE = re.compile(r"\b(SUM|TOTAL|COUNT|AVG|MIN|MAX|GROUP_CONCAT|STRING_AGG)\s*\(", re.I)
+_ALIAS = re.compile(r'^(.*?)\s+(?:AS\s+)?("[^"]+"|`[^`]+`|\[[^\]]+\]|[A-Za-z_]\w*)$', re.I | re.S)
+_SORT_TERM = re.compile(r"^(.*?)(?:\s+(ASC|DESC))?$", re.I | re.S)
+_NOT_DECOMPOSABLE = re.compile(r"\(\s*SELECT\b|\bOVER\s*\(|--|/\*", re.I)
+
+class UnionReadPool(SQLiteReadPool):
+    """
+    Catalog connections with every partition ATTACHed and each partitioned table
+    shadowed by a TEMP VIEW over the UNION ALL of its partitions: any query runs
+    here unchanged, just without the parallelism of the fan-out.
+    """
+
+    def __init__(self, path: str, size: int, partition_paths: List[str], tables: List[str]):
+        super().__init__(path, size)
+        self.partition_paths = partition_paths
+        self.tables = tables
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._uri(), uri=True, check_same_thread=False)
+        for i, path in enumerate(self.partition_paths):
+            conn.execute(f"ATTACH DATABASE ? AS p{i}", (f"file:{os.path.abspath(path)}?mode=ro",))
+        for table in self.tables:
+            union = " UNION ALL ".join(f'SELECT * FROM p{i}."{table}"' for i in range(len(self.partition_paths)))
+            conn.execute(f'CREATE TEMP VIEW "{table}" AS {union}')
+        conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+        conn.execute("PRAGMA query_only = ON")
+        conn.row_factory = sqlite3.Row
+        self.opened += 1
+        return conn
+
+def _unquote(name: str) -> str:
+    name = name.strip()
+    if len(name) > 1 and name[0] + name[-1] in ('""', "``", "[]"):
+        return name[1:-1]
+    return name
+
+def _norm(expr: str) -> str:
+    return " ".join(expr.split()).lower()
+
+def split_top_level(text: str) -> List[str]:
+    """
+    Comma-separated parts of a SELECT list / GROUP BY / ORDER BY outside parentheses and quotes.
+    """
+    parts, depth, start, i = [], 0, 0, 0
+    while i < len(text):
+        ch = text[i]
+        if ch in "'\"`":
+            end = text.find(ch, i + 1)
+            i = len(text) if end == -1 else end + 1
+            continue
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            parts.append(text[start:i].strip())
+            start = i + 1
+        i += 1
+    parts.append(text[start:].strip())
+    return parts
+
+def _balanced(text: str) -> bool:
+    depth = 0
+    for ch in text:
+        depth += ch == "("
+        depth -= ch == ")"
+        if depth < 0:
+            return False
+    return depth == 0
+
+def _sql_sort_key(value: Any) -> Tuple[int, Any]:
+    # SQLite's cross-type order: NULL < numbers < text < blobs
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (3, bytes(value))
+
+def _merge_aggregate(func: str, a: Any, b: Any) -> Any:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if func in ("SUM", "TOTAL", "COUNT"):
+        return a + b
+    return min(a, b, key=_sql_sort_key) if func == "MIN" else max(a, b, key=_sql_sort_key)
+
+def _equi_join(condition: str, column: str) -> bool:
+    # <a>.col = <b>.col as one AND-ed term of the condition (an OR could pair rows across partitions)
+    if re.search(r"\bOR\b", condition, re.I):
+        return False
+    c = re.escape(column)
+    side = rf'(?:\w+\.|"[^"]+"\.)?(?:{c}|"{c}"|`{c}`|\[{c}\])(?!\w)'
+    return re.search(rf"(?<![\w.]){side}\s*=\s*{side}(?!\s*[-+*/%|])", condition, re.I) is not None
+
+def plan_fanout(sql: str, co_located: set, columns: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """
+    How to run a statement on every partition and merge the results, or None when
+    it can't be decomposed. Supported: plain SELECTs (optionally DISTINCT), and
+    SUM/TOTAL/COUNT/MIN/MAX with or without GROUP BY, where every grouping key is
+    selected; ORDER BY on output columns and LIMIT/OFFSET are applied after the
+    merge. Joins must be equi-joins on a co-located column (rows that join share a
+    partition), and COUNT(DISTINCT ...) is only additive over those columns.
+    columns are the statement's output names, needed to place ORDER BY terms after a *.
+    """
+    body = sql.strip().rstrip(";").strip()
+    if _NOT_DECOMPOSABLE.search(body):
+        return None
+    words = top_level_words(body)
+    keywords = [w for w, _ in words]
+    if not keywords or keywords[0] != "SELECT" or "FROM" not in keywords:
+        return None
+    if {"UNION", "INTERSECT", "EXCEPT", "WINDOW", "HAVING", "WITH"} & set(keywords):
+        return None
+
+    def position(word: str) -> Optional[int]:
+        return next((i for w, i in words if w == word), None)
+
+    from_at = position("FROM")
+    select_end = words[0][1] + len("SELECT")
+    distinct = len(words) > 1 and words[1][0] in ("DISTINCT", "ALL") and words[1][1] < from_at
+    if distinct:
+        select_end = words[1][1] + len(words[1][0])
+        distinct = words[1][0] == "DISTINCT"
+    items = split_top_level(body[select_end:from_at])
+
+    # Joins: every ON / USING must mention a co-located column
+    clause_ends = sorted(i for w, i in words if w in ("WHERE", "GROUP", "ORDER", "LIMIT") and i > from_at)
+    from_end = clause_ends[0] if clause_ends else len(body)
+    from_clause = body[from_at + 4:from_end]
+    if split_top_level(from_clause)[1:]:
+        return None
+    if re.search(r"\bJOIN\b", from_clause, re.I):
+        conditions = re.split(r"\bJOIN\b", from_clause, flags=re.I)[1:]
+        for cond in conditions:
+            m = re.search(r"\b(ON|USING)\b(.*)", cond, re.I | re.S)
+            if not m:
+                return None
+            if m.group(1).upper() == "USING":
+                using = re.match(r"\s*\(([^)]*)\)", m.group(2))
+                joined = {_unquote(c).lower() for c in split_top_level(using.group(1))} if using else set()
+                if not any(c.lower() in joined for c in co_located):
+                    return None
+            elif not any(_equi_join(m.group(2), c) for c in co_located):
+                return None
+
+    order_at, limit_at, group_at = position("ORDER"), position("LIMIT"), position("GROUP")
+    tail_at = min(i for i in (order_at, limit_at, len(body)) if i is not None)
+    limit = offset = None
+    if limit_at is not None:
+        m = re.fullmatch(r"LIMIT\s+(\d+)(?:\s*(?:OFFSET\s+(\d+)|,\s*(\d+)))?", body[limit_at:].strip(), re.I)
+        if not m:
+            return None
+        if m.group(3) is not None:
+            offset, limit = int(m.group(1)), int(m.group(3))
+        else:
+            limit, offset = int(m.group(1)), int(m.group(2) or 0)
+    order_terms = []
+    if order_at is not None:
+        for term in split_top_level(re.sub(r"^ORDER\s+BY\s+", "", body[order_at:limit_at or len(body)].strip(), flags=re.I)):
+            m = _SORT_TERM.match(term)
+            if not m or re.search(r"\b(NULLS|COLLATE)\b", term, re.I):
+                return None
+            order_terms.append((m.group(1).strip(), (m.group(2) or "ASC").upper() == "DESC"))
+
+    # Select items: aggregate calls we can merge, or plain expressions
+    aggregates: Dict[int, str] = {}
+    exprs, names = [], []
+    for n, item in enumerate(items):
+        m = _ALIAS.match(item)
+        expr, alias = item, None
+        if m and (re.search(r"\s+AS\s+\S+$", item, re.I) or m.group(1).rstrip().endswith(")")
+                  or re.fullmatch(r"[\w.\"`\[\]]+", m.group(1).strip())):
+            expr, alias = m.group(1).strip(), _unquote(m.group(2))
+        if alias is None:
+            # SQLite names an unaliased column after the column itself, anything else after its text
+            alias = _unquote(expr.split(".")[-1]) if re.fullmatch(r"[\w.\"`\[\]]+", expr) else expr
+        exprs.append(expr)
+        names.append(alias)
+        call = _AGGREGATE_CALL.match(expr)
+        if call and _balanced(call.group(2)) and _ANY_AGGREGATE.match(expr):
+            func, arg = call.group(1).upper(), call.group(2).strip()
+            # AVG / GROUP_CONCAT don't merge; two-argument MIN/MAX are scalar functions
+            if func not in _MERGEABLE_AGGREGATES or len(split_top_level(arg)) > 1:
+                return None
+            if re.match(r"DISTINCT\b", arg, re.I):
+                target = _unquote(arg[8:].strip().split(".")[-1])
+                if func != "COUNT" or target not in co_located:
+                    return None
+            aggregates[n] = func
+        elif _ANY_AGGREGATE.search(expr):
+            return None
+
+    # ORDER BY terms -> output column positions, so the merge never has to give up
+    star = any(e.strip().endswith("*") for e in exprs)
+    if star and order_terms and columns is None:
+        return None
+    output = columns if star else names
+    order = []
+    for term, descending in order_terms:
+        index = resolve_output(term, [] if star else exprs, output, output)
+        if index is None:
+            return None
+        order.append((index, descending))
+
+    group_items: List[int] = []
+    if group_at is not None:
+        group_text = re.sub(r"^GROUP\s+BY\s+", "", body[group_at:tail_at].strip(), flags=re.I)
+        for term in split_top_level(group_text):
+            index = resolve_output(term, exprs, names)
+            if index is None or index in aggregates:
+                return None
+            group_items.append(index)
+    if aggregates or group_at is not None:
+        if distinct or any("*" == e.strip() for e in exprs):
+            return None
+        # Every non-aggregate column must be a grouping key, or partitions can't be combined
+        if any(n not in aggregates and n not in group_items for n in range(len(exprs))):
+            return None
+        per_partition = body[:tail_at]
+        kind = "aggregate"
+    else:
+        # Each partition applies ORDER BY and enough LIMIT for the merged page
+        per_partition = body[:limit_at] if limit_at is not None else body
+        if limit is not None:
+            per_partition += f" LIMIT {limit + offset}"
+        kind = "rows"
+    return {
+        "kind": kind,
+        "sql": per_partition,
+        "distinct": distinct,
+        "aggregates": aggregates,
+        "group": group_items,
+        "exprs": exprs,
+        "names": names,
+        "order": order,
+        "limit": limit,
+        "offset": offset or 0,
+    }
+
+def resolve_output(term: str, exprs: List[str], names: List[str], columns: Optional[List[str]] = None) -> Optional[int]:
+    """
+    Index of the output column a GROUP BY / ORDER BY term refers to: position, alias or same expression.
+    """
+    term = term.strip()
+    if term.isdigit():
+        index = int(term) - 1
+        return index if 0 <= index < len(columns or exprs) else None
+    bare = _unquote(term).lower()
+    for n, name in enumerate(columns or names):
+        if str(name).lower() == bare:
+            return n
+    for n, expr in enumerate(exprs):
+        if _norm(expr) == _norm(term):
+            return n
+    return None
+
+def merge_partition_results(plan: Dict[str, Any], parts: List[List[tuple]]) -> List[tuple]:
+    """
+    Combine per-partition rows as the original statement would have produced them
+    on a single database.
+    """
+    if plan["kind"] == "aggregate":
+        merged: "OrderedDict[tuple, list]" = OrderedDict()
+        for rows in parts:
+            for row in rows:
+                key = tuple(row[i] for i in plan["group"])
+                current = merged.get(key)
+                if current is None:
+                    merged[key] = list(row)
+                    continue
+                for i, func in plan["aggregates"].items():
+                    current[i] = _merge_aggregate(func, current[i], row[i])
+        rows = [tuple(r) for r in merged.values()]
+    else:
+        rows = [row for part in parts for row in part]
+        if plan["distinct"]:
+            rows = list(dict.fromkeys(rows))
+    for index, descending in reversed(plan["order"]):
+        rows.sort(key=lambda r: _sql_sort_key(r[index]), reverse=descending)
+    start = plan["offset"]
+    return rows[start:start + plan["limit"]] if plan["limit"] is not None else rows[start:]
+
+class PartitionSet:
+    """
+    The partition databases of the current build, with a read pool each, plus the
+    ATTACH-and-union pool for statements that can't be split. Statements that only
+    read catalog tables (summaries, unpartitioned tables) run on DB_PATH as usual.
+    """
+
+    def __init__(self, catalog: Dict[str, Any], version: str):
+        base = os.path.dirname(os.path.abspath(DB_PATH))
+        self.version = version
+        self.column = catalog["column"]
+        # Rows are assigned by the link column when there is one (an order spanning two
+        # plants sits in one partition), so only the link is whole within a partition
+        self.co_located = {catalog.get("link") or catalog["column"]}
+        self.tables = set(catalog.get("tables", []))
+        self.paths = {name: os.path.join(base, p["path"]) for name, p in catalog["partitions"].items()}
+        self.pools = {name: SQLiteReadPool(path, PARTITION_POOL_SIZE) for name, path in self.paths.items()}
+        self.union_pool = UnionReadPool(DB_PATH, DB_POOL_SIZE, list(self.paths.values()), sorted(self.tables))
+        self.export_pool = UnionReadPool(DB_PATH, EXPORT_MAX_CONCURRENCY, list(self.paths.values()), sorted(self.tables))
+        self.routes: Dict[str, int] = {"catalog": 0, "fanout": 0, "union": 0}
+        self.root_pages: Optional[Dict[int, str]] = None
+
+    def referenced_tables(self, sql: str) -> set:
+        """
+        Tables the statement's program opens for reading (an index counts as its
+        table). Column reads alone miss COUNT(*) and USING / NATURAL join columns.
+        """
+        with db_pool.connection() as conn:
+            cur = conn.cursor()
+            cur.row_factory = None
+            if self.root_pages is None:
+                self.root_pages = dict(cur.execute("SELECT rootpage, tbl_name FROM sqlite_master WHERE rootpage > 0"))
+            program = cur.execute("EXPLAIN " + sql.strip().rstrip(";")).fetchall()
+        # (addr, opcode, p1, p2 = root page, p3 = database, ...); database 0 is main
+        return {self.root_pages[op[3]] for op in program if op[1] == "OpenRead" and op[4] == 0 and op[3] in self.root_pages}
+
+    def output_columns(self, sql: str) -> List[str]:
+        # The catalog's copies of the partitioned tables are empty, so this only names the columns
+        with db_pool.connection() as conn:
+            cur = conn.cursor()
+            cur.row_factory = None
+            cur.execute(sql)
+            return [c[0] for c in cur.description] if cur.description else []
+
+    def _route(self, route: str) -> None:
+        self.routes[route] += 1
+        metrics.inc("partition_queries_total", route=route)
+
+    def _query(
+        self, pool: SQLiteReadPool, sql: str, max_rows: Optional[int], deadline: Optional[float] = None,
+    ) -> Tuple[List[str], List[tuple], bool]:
+        with pool.connection() as conn, interrupt_after(conn, deadline):
+            cur = conn.cursor()
+            cur.row_factory = None
+            cur.execute(sql)
+            cols = [c[0] for c in cur.description] if cur.description else []
+            rows, truncated = fetch_capped(cur, max_rows)
+        return cols, rows, truncated
+
+    def plan_route(self, sql: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Where the statement runs ("catalog", "fanout" or "union"), with the fan-out plan.
+        """
+        tables = self.referenced_tables(sql)
+        if not tables & self.tables:
+            return "catalog", None
+        if tables <= self.tables:
+            columns = self.output_columns(sql) if "*" in sql else None
+            plan = plan_fanout(sql, self.co_located, columns)
+            if plan is not None:
+                return "fanout", plan
+        return "union", None
+
+    def explain_target(self, sql: str) -> Tuple[SQLiteReadPool, str]:
+        """
+        The pool and statement to EXPLAIN for a query that ran here. A fan-out ran the
+        same rewritten statement on every partition, so the first one stands for all.
+        """
+        route, plan = self.plan_route(sql)
+        if route == "catalog":
+            return db_pool, sql
+        if route == "fanout":
+            return next(iter(self.pools.values())), plan["sql"]
+        return self.union_pool, sql
+
+    def run(
+        self, sql: str, max_rows: Optional[int], deadline: Optional[float] = None,
+    ) -> Optional[Tuple[List[str], List[tuple], bool]]:
+        """
+        (columns, rows, truncated) for the statement, or None to run it on the catalog.
+        """
+        route, plan = self.plan_route(sql)
+        if route == "catalog":
+            self._route("catalog")
+            return None
+        if plan is not None:
+            # Groups must all be merged; plain rows only need the first page from each partition
+            cap = max_rows + plan["offset"] if max_rows and plan["kind"] == "rows" else None
+            futures = [partition_executor.submit(self._query, pool, plan["sql"], cap, deadline) for pool in self.pools.values()]
+            results = [f.result() for f in futures]
+            columns = results[0][0] if results else []
+            rows = merge_partition_results(plan, [r[1] for r in results])
+            self._route("fanout")
+            truncated = any(r[2] for r in results) or bool(max_rows) and len(rows) > max_rows
+            return columns, rows[:max_rows] if max_rows else rows, truncated
+        self._route("union")
+        return self._query(self.union_pool, sql, max_rows, deadline)
+
+    def close_all(self) -> None:
+        for pool in self.pools.values():
+            pool.close_all()
+        self.union_pool.close_all()
+        self.export_pool.close_all()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "column": self.column,
+            "partitions": sorted(self.paths),
+            "routes": dict(self.routes),
+            "union_pool": self.union_pool.stats(),
+        }
+
+_partition_lock = threading.Lock()
+_partition_state: Tuple[Optional[str], Optional[PartitionSet]] = (None, None)
+
+def get_partition_set() -> Optional[PartitionSet]:
+    """
+    Partitions of the current build (None for a single-database build); re-read
+    whenever the catalog database changes.
+    """
+    global _partition_state
+    version = db_fingerprint()
+    loaded_version, partitions = _partition_state
+    if loaded_version == version:
+        return partitions
+    with _partition_lock:
+        if _partition_state[0] != version:
+            try:
+                with open(DB_PARTITIONS_PATH, encoding="utf-8") as f:
+                    catalog = json.load(f)
+                new = PartitionSet(catalog, version) if catalog.get("partitions") else None
+            except FileNotFoundError:
+                new = None
+            old = _partition_state[1]
+            _partition_state = (version, new)
+            if old is not None:
+                old.close_all()
+        return _partition_state[1]
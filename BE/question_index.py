@@ -0,0 +1,272 @@
+"""
+Similar-question index: BM25 over (question, SQL) pairs that executed
+successfully. A question worded like a stored one, apart from its literal
+values, reuses the stored SQL with the new values; looser matches become
+few-shot examples for generation.
+"""
+import json
+import math
+import os
+import re
+import threading
+from typing import Callable, Optional, Dict, Any, List, Tuple
+
+QUESTION_INDEX_PATH = os.getenv(
+    "QUESTION_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "question_index.jsonl"),
+)
+QUESTION_INDEX_ENABLED = os.getenv("QUESTION_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+QUESTION_INDEX_MAX_ENTRIES = int(os.getenv("QUESTION_INDEX_MAX_ENTRIES", "5000"))
+# Share of a stored question's BM25 self-score a query must reach to reuse its SQL / to be a few-shot example
+QUESTION_INDEX_REUSE_SCORE = float(os.getenv("QUESTION_INDEX_REUSE_SCORE", "0.8"))
+QUESTION_INDEX_FEWSHOT_SCORE = float(os.getenv("QUESTION_INDEX_FEWSHOT_SCORE", "0.3"))
+QUESTION_INDEX_FEWSHOT_K = int(os.getenv("QUESTION_INDEX_FEWSHOT_K", "3"))
+
+_THAI = re.compile(r"[\u0e00-\u0e7f]")
+_SQL_LITERAL = re.compile(r"'(?:[^']|'')*'|(?<![\w.])\d+(?:\.\d+)?(?![\w.])")
+_SLOT = re.compile(r"<S(\d+)>")
+_NUMBER = re.compile(r"^\d+(?:\.\d+)?$")
+_DATE = re.compile(r"^\d{4}-\d{2}(?:-\d{2})?$")
+# What a slot may capture; plain text slots are open here and checked against the catalog's entities in _fill()
+_SLOT_PATTERNS = {
+    "number": r"(\d+(?:\.\d+)?)",
+    "text:number": r"(\d+(?:\.\d+)?)",
+    "text:date": r"(\d{4}-\d{2}(?:-\d{2})?)",
+}
+
+def _index_tokens(text: str) -> List[str]:
+    """
+    Lowercased word tokens; Thai runs (written without spaces) become character bigrams.
+    """
+    tokens: List[str] = []
+    for run in re.findall(r"[\u0e00-\u0e7f]+|[a-z0-9_<>]+", text.lower()):
+        if _THAI.match(run):
+            tokens.extend(run[i:i + 2] for i in range(max(1, len(run) - 1)))
+        elif not re.fullmatch(r"<s\d+>", run):
+            tokens.append(run)
+    return tokens
+
+def _find_word(text: str, needle: str) -> int:
+    pattern = re.escape(needle)
+    if needle[:1].isalnum():
+        pattern = r"(?<!\w)" + pattern
+    if needle[-1:].isalnum():
+        pattern += r"(?!\w)"
+    m = re.search(pattern, text, flags=re.IGNORECASE)
+    return m.start() if m else -1
+
+def make_question_template(question: str, sql: str) -> Dict[str, Any]:
+    """
+    Turn a (question, SQL) pair into a reusable template: every SQL literal whose
+    value also appears in the question becomes a numbered slot in both.
+    """
+    q_template = " ".join(question.split()).rstrip("?.! ")
+    sql_parts: List[str] = []
+    slot_kinds: List[str] = []
+    pos = 0
+    for m in _SQL_LITERAL.finditer(sql):
+        token = m.group(0)
+        if token.startswith("'"):
+            inner = token[1:-1].replace("''", "'")
+            core = inner.strip("%")
+            # Quoted years/dates must be refilled with values of the same shape
+            kind = "text:number" if _NUMBER.match(core) else "text:date" if _DATE.match(core) else "text"
+            if kind == "text" and core != inner:
+                kind = "text:like"  # a fragment inside LIKE '%...%', not a whole value
+        else:
+            inner = core = token
+            kind = "number"
+        at = _find_word(q_template, core) if core.strip() else -1
+        if at < 0 or _SLOT.search(core):
+            continue
+        slot = len(slot_kinds)
+        slot_kinds.append(kind)
+        q_template = q_template[:at] + f"<S{slot}>" + q_template[at + len(core):]
+        if kind.startswith("text"):
+            prefix = inner[:len(inner) - len(inner.lstrip("%"))]
+            suffix = inner[len(inner.rstrip("%")):]
+            replacement = f"'{prefix}<S{slot}>{suffix}'"
+        else:
+            replacement = f"<S{slot}>"
+        sql_parts.append(sql[pos:m.start()] + replacement)
+        pos = m.end()
+    sql_parts.append(sql[pos:])
+    return {"question_template": q_template, "sql_template": "".join(sql_parts), "slots": slot_kinds}
+
+def _template_regex(q_template: str, slots: List[str]) -> "re.Pattern":
+    """
+    The template's wording word for word (case-insensitive), with each slot
+    limited to the shape of its value.
+    """
+    parts = re.split(r"(<S\d+>)", q_template)
+    pattern = ""
+    for part in parts:
+        slot = _SLOT.fullmatch(part)
+        if slot:
+            index = int(slot.group(1))
+            pattern += _SLOT_PATTERNS.get(slots[index] if index < len(slots) else "text", r"(.+?)")
+        elif part.strip():
+            pattern += r"\s+".join(re.escape(w) for w in part.split(" "))
+        else:
+            pattern += r"\s+" if part else ""
+    return re.compile(rf"^\s*{pattern}\s*[?.!]*\s*$", re.IGNORECASE)
+
+class QuestionIndex:
+    """
+    BM25 index over successful (question, SQL) pairs, persisted as JSON lines.
+    A query whose wording matches a stored template is answered by substituting
+    its literals into the stored SQL; weaker matches become few-shot examples.
+    entity_values returns the casefolded text values the database holds, which
+    are the only values a free-text slot accepts.
+    """
+
+    k1 = 1.5
+    b = 0.75
+
+    def __init__(self, path: str, max_entries: int, entity_values: Optional[Callable[[], set]] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.entity_values = entity_values or set
+        self.entries: List[Dict[str, Any]] = []
+        self._templates: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._lengths: List[int] = []
+        self._doc_tokens: List[List[str]] = []
+        self._lock = threading.Lock()
+        self.reused = 0
+        self.fewshot = 0
+        self.misses = 0
+
+    def load(self) -> int:
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        self._add(json.loads(line))
+                    except (json.JSONDecodeError, KeyError):
+                        continue
+        return len(self.entries)
+
+    def _add(self, entry: Dict[str, Any]) -> bool:
+        key = entry["question_template"].lower()
+        if key in self._templates or len(self.entries) >= self.max_entries:
+            return False
+        doc_id = len(self.entries)
+        entry["_regex"] = _template_regex(entry["question_template"], entry["slots"])
+        self.entries.append(entry)
+        self._templates[key] = doc_id
+        tokens = _index_tokens(entry["question_template"])
+        self._doc_tokens.append(tokens)
+        self._lengths.append(len(tokens))
+        for tok in tokens:
+            postings = self._postings.setdefault(tok, {})
+            postings[doc_id] = postings.get(doc_id, 0) + 1
+        return True
+
+    def add(self, question: str, sql: str) -> None:
+        entry = make_question_template(question, sql)
+        entry["question"] = question
+        entry["sql"] = sql
+        with self._lock:
+            if not self._add(entry):
+                return
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    record = {k: v for k, v in entry.items() if not k.startswith("_")}
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"Warning: could not persist question index entry: {e}")
+
+    def _bm25(self, tokens: List[str]) -> List[Tuple[float, int]]:
+        n = len(self.entries)
+        if not n or not tokens:
+            return []
+        avg_len = sum(self._lengths) / n or 1.0
+        scores: Dict[int, float] = {}
+        for tok in set(tokens):
+            postings = self._postings.get(tok)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / avg_len)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return sorted(((score, doc_id) for doc_id, score in scores.items()), reverse=True)
+
+    def _coverage(self, score: float, doc_id: int) -> float:
+        """
+        Query score relative to the stored question scored against itself, i.e.
+        how much of the stored wording the query covers (1.0 = all of it).
+        """
+        tokens = self._doc_tokens[doc_id]
+        n = len(self.entries)
+        avg_len = sum(self._lengths) / n or 1.0
+        total = 0.0
+        for tok in set(tokens):
+            df = len(self._postings[tok])
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            tf = tokens.count(tok)
+            norm = tf + self.k1 * (1 - self.b + self.b * len(tokens) / avg_len)
+            total += idf * tf * (self.k1 + 1) / norm
+        return score / total if total else 0.0
+
+    def _fill(self, entry: Dict[str, Any], question: str) -> Optional[str]:
+        m = entry["_regex"].match(" ".join(question.split()))
+        if not m:
+            return None
+        sql = entry["sql_template"]
+        for slot, (kind, value) in enumerate(zip(entry["slots"], m.groups())):
+            value = value.strip()
+            if kind in ("text", "text:like"):
+                # Free text is only reused for a value the database knows, so a slot
+                # cannot swallow extra words of a differently worded question
+                folded = value.casefold()
+                entities = self.entity_values()
+                if folded not in entities and not (kind == "text:like" and any(folded in e for e in entities)):
+                    return None
+            value = value.replace("'", "''")
+            sql = sql.replace(f"<S{slot}>", value)
+        return sql
+
+    def lookup(self, question: str) -> Tuple[Optional[str], List[Tuple[str, str]]]:
+        """
+        (reusable SQL or None, few-shot examples) for the question.
+        """
+        with self._lock:
+            tokens = _index_tokens(question)
+            ranked = self._bm25(tokens)
+            if not ranked:
+                self.misses += 1
+                return None, []
+            top = [(self._coverage(score, doc_id), doc_id) for score, doc_id in ranked[:QUESTION_INDEX_FEWSHOT_K]]
+            for coverage, doc_id in top:
+                # Reuse needs the stored wording to match apart from the literal values
+                if coverage < QUESTION_INDEX_REUSE_SCORE or len(self._doc_tokens[doc_id]) < 2:
+                    continue
+                sql = self._fill(self.entries[doc_id], question)
+                if sql is not None:
+                    self.reused += 1
+                    return sql, []
+            examples = [
+                (self.entries[doc_id]["question"], self.entries[doc_id]["sql"])
+                for coverage, doc_id in top
+                if coverage >= QUESTION_INDEX_FEWSHOT_SCORE
+            ]
+            if examples:
+                self.fewshot += 1
+            else:
+                self.misses += 1
+            return None, examples
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "reused": self.reused,
+            "fewshot": self.fewshot,
+            "misses": self.misses,
+            "path": self.path,
+        }
@@ -0,0 +1,222 @@
+"""
+Prometheus-style metrics, per-request stage timing (Server-Timing) and the
+slow-query log.
+"""
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Tuple, Callable
+
+from db import SQLiteReadPool, db_pool
+
+# Queries slower than this are counted, and logged with their EXPLAIN QUERY PLAN when SLOW_QUERY_LOG_PATH is set
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+SLOW_QUERY_LOG_PATH = os.getenv("SLOW_QUERY_LOG_PATH", "")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+COST_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000, 10000000, 100000000, 1000000000)
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+def _label_text(labels: Tuple[Tuple[str, Any], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+class MetricsRegistry:
+    """
+    Counters, histograms and callback gauges rendered in the Prometheus text
+    format, without a client library.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta: "OrderedDict[str, Tuple[str, str, Tuple[float, ...]]]" = OrderedDict()
+        self._counters: Dict[str, Dict[Tuple, float]] = {}
+        # labels -> [per-bucket counts, sum, count]
+        self._histograms: Dict[str, Dict[Tuple, List[Any]]] = {}
+        self._gauges: Dict[str, Any] = {}
+
+    def counter(self, name: str, help_text: str) -> None:
+        self._meta[name] = ("counter", help_text, ())
+        self._counters[name] = {}
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...]) -> None:
+        self._meta[name] = ("histogram", help_text, buckets)
+        self._histograms[name] = {}
+
+    def gauge(self, name: str, help_text: str, fn) -> None:
+        self._meta[name] = ("gauge", help_text, ())
+        self._gauges[name] = fn
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        buckets = self._meta[name][2]
+        with self._lock:
+            state = self._histograms[name].get(key)
+            if state is None:
+                state = self._histograms[name][key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, (kind, help_text, buckets) in self._meta.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for labels, value in self._counters[name].items():
+                        lines.append(f"{name}{_label_text(labels)} {value:g}")
+                elif kind == "histogram":
+                    for labels, (counts, total, count) in self._histograms[name].items():
+                        for bound, n in zip(buckets, counts):
+                            lines.append(f"{name}_bucket{_label_text(labels + (('le', f'{bound:g}'),))} {n}")
+                        lines.append(f"{name}_bucket{_label_text(labels + (('le', '+Inf'),))} {count}")
+                        lines.append(f"{name}_sum{_label_text(labels)} {total:.6f}")
+                        lines.append(f"{name}_count{_label_text(labels)} {count}")
+                else:
+                    lines.append(f"{name} {self._gauges[name]():g}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+metrics.histogram("text2sql_stage_seconds", "Time spent per pipeline stage.", LATENCY_BUCKETS)
+metrics.histogram("http_request_duration_seconds", "HTTP request latency by route.", LATENCY_BUCKETS)
+metrics.counter("http_requests_total", "HTTP requests by route, method and status.")
+metrics.counter("llm_tokens_total", "Model tokens reported by the SDK, by kind (prompt/completion).")
+metrics.counter("llm_calls_total", "Model calls by outcome.")
+metrics.counter("partition_queries_total", "SQL on a partitioned build by route (catalog/fanout/union).")
+metrics.counter("text2sql_coalesced_total", "Requests answered by an identical pipeline already in flight.")
+metrics.histogram("sql_result_rows", "Rows returned per executed SQL statement.", ROW_BUCKETS)
+metrics.histogram("sql_result_bytes", "JSON size of each executed SQL result.", BYTE_BUCKETS)
+metrics.histogram("explanation_prompt_tokens", "Estimated tokens of the explanation prompt (part=digest|prompt).", TOKEN_BUCKETS)
+metrics.counter("sql_slow_queries_total", "SQL statements slower than SLOW_QUERY_MS.")
+metrics.counter("sql_timeouts_total", "SQL statements interrupted at their execution deadline.")
+metrics.counter("sql_admission_total", "Generated SQL by admission decision (run/heavy/rejected).")
+metrics.histogram("sql_estimated_cost", "Estimated rows examined per statement, from EXPLAIN QUERY PLAN.", COST_BUCKETS)
+
+# The plain stats dicts behind /stats (validation, admission, explanations) are
+# updated from executor threads as well as the event loop
+_stats_lock = threading.Lock()
+
+def bump(counters: Dict[str, Any], key: str, value: float = 1) -> None:
+    with _stats_lock:
+        counters[key] += value
+
+def snapshot(counters: Dict[str, Any]) -> Dict[str, Any]:
+    with _stats_lock:
+        return dict(counters)
+
+class RequestTrace:
+    """
+    Stage durations and token counts for one HTTP request, rendered as a
+    Server-Timing header.
+    """
+
+    def __init__(self):
+        self.stages: "OrderedDict[str, float]" = OrderedDict()
+        self.tokens: Dict[str, int] = {}
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_tokens(self, kind: str, count: int) -> None:
+        self.tokens[kind] = self.tokens.get(kind, 0) + count
+
+    def server_timing(self, total_seconds: float) -> str:
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        if self.tokens:
+            desc = " ".join(f"{kind}={n}" for kind, n in sorted(self.tokens.items()))
+            parts.append(f'tokens;desc="{desc}"')
+        parts.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(parts)
+
+request_trace: "contextvars.ContextVar[Optional[RequestTrace]]" = contextvars.ContextVar("request_trace", default=None)
+
+@contextmanager
+def stage(name: str):
+    """
+    Time a pipeline stage into the stage histogram and the current request's trace.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe("text2sql_stage_seconds", elapsed, stage=name)
+        trace = request_trace.get()
+        if trace is not None:
+            trace.add_stage(name, elapsed)
+
+def record_token_usage(out: Dict[str, Any]) -> None:
+    usage = out.get("usage") or {}
+    for kind in ("prompt", "completion"):
+        count = usage.get(f"{kind}_tokens")
+        if isinstance(count, (int, float)):
+            metrics.inc("llm_tokens_total", count, kind=kind)
+            trace = request_trace.get()
+            if trace is not None:
+                trace.add_tokens(kind, int(count))
+
+_slow_log_lock = threading.Lock()
+
+def record_query(
+    sql: str,
+    elapsed: float,
+    results: Dict[str, Any],
+    size: int,
+    explain_target: Optional[Callable[[str], Tuple[SQLiteReadPool, str]]] = None,
+) -> None:
+    """
+    Row/byte histograms for an executed statement, plus the slow-query log.
+    explain_target maps the statement to the pool and SQL it actually ran as
+    (e.g. a partition and its rewritten fan-out); the default is db_pool.
+    Runs on the DB executor thread.
+    """
+    metrics.observe("sql_result_rows", results.get("row_count", 0))
+    metrics.observe("sql_result_bytes", size)
+    if elapsed * 1000 < SLOW_QUERY_MS:
+        return
+    metrics.inc("sql_slow_queries_total")
+    if not SLOW_QUERY_LOG_PATH:
+        return
+    try:
+        pool, statement = explain_target(sql) if explain_target is not None else (db_pool, sql)
+        with pool.connection() as conn:
+            plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + statement)]
+    except sqlite3.Error as e:
+        plan = [f"unavailable: {e}"]
+    except RuntimeError as e:
+        # Pool exhausted: log the statement without a plan rather than fail the request
+        print(f"Warning: no connection for slow-query plan: {e}")
+        plan = [f"unavailable: {e}"]
+    record = json.dumps({
+        "ts": round(time.time(), 3),
+        "ms": round(elapsed * 1000, 1),
+        "rows": results.get("row_count", 0),
+        "bytes": size,
+        "sql": sql,
+        "plan": plan,
+    }, ensure_ascii=False)
+    with _slow_log_lock:
+        try:
+            with open(SLOW_QUERY_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(record + "\n")
+        except OSError as e:
+            print(f"Warning: could not write slow-query log: {e}")
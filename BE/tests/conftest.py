@@ -0,0 +1,51 @@
+"""
+Shared fixtures: a small deterministic database in a temp directory and the
+app imported against it. The environment is set before the import, at
+collection time: the stand-in model backend, so no credentials or network are
+needed, and no workload log.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from fixture_data import FakeModel, sample_frames, write_single_db
+
+BE_DIR = Path(__file__).resolve().parent.parent
+REPO_DIR = BE_DIR.parent
+FIXTURE_DIR = Path(tempfile.mkdtemp(prefix="text2sql-tests-"))
+FIXTURE_DB = FIXTURE_DIR / "data.db"
+
+write_single_db(sample_frames(), FIXTURE_DB)
+os.environ.update({
+    "MODEL_BACKEND": "stub",
+    "STUB_MODEL_LATENCY_MS": "0",
+    "DB_PATH": str(FIXTURE_DB),
+    "QUESTION_INDEX_PATH": str(FIXTURE_DIR / "question_index.jsonl"),
+    "SQL_WORKLOAD_LOG_PATH": "",
+    "STARTUP_WARM_MODEL": "false",
+})
+
+sys.path.insert(0, str(BE_DIR))
+sys.path.insert(0, str(REPO_DIR / "DATA"))
+
+
+@pytest.fixture
+def fixture_db():
+    return FIXTURE_DB
+
+
+@pytest.fixture
+def fake_model(monkeypatch, tmp_path):
+    """A fresh FakeModel behind get_model(), with the caches and the question index emptied"""
+    import app
+    model = FakeModel()
+    monkeypatch.setattr(app, "_model", model)
+    index = app.QuestionIndex(
+        str(tmp_path / "question_index.jsonl"), app.QUESTION_INDEX_MAX_ENTRIES, app.get_schema_catalog().entity_values
+    )
+    monkeypatch.setattr(app, "question_index", index)
+    app.cache_invalidate()
+    return model
@@ -0,0 +1,91 @@
+"""Deterministic sample rows shaped like the real sheets, and a scripted model, shared by the test modules"""
+import sqlite3
+
+import pandas as pd
+
+PLANTS = [1000, 2000, 3000]
+CUSTOMERS = [f"Customer {i}" for i in range(1, 9)]
+# Compiles, then fails while running (customer names are not JSON)
+FAILING_SQL = "SELECT json_extract(NameSoldtoParty, '$.id') FROM SALES_LOGISTICS"
+
+
+def sample_frames():
+    """
+    {table: DataFrame} shaped like the real sheets. Every fifth sales order has a
+    second line item in another plant, so orders span partitions of a Plant split.
+    """
+    sales, stock, material = [], [], []
+    for n in range(1, 61):
+        order = 5000 + n
+        plant = PLANTS[n % 3]
+        lines = [plant] + ([PLANTS[(n + 1) % 3]] if n % 5 == 0 else [])
+        for item, line_plant in enumerate(lines, start=1):
+            sales.append({
+                "SalesOrder": order,
+                "LineItemNo": item * 10,
+                "Plant": line_plant,
+                "NameSoldtoParty": CUSTOMERS[n % len(CUSTOMERS)],
+                "OverallStatus": "Completed" if n % 4 else "Open",
+                "SalesDate2": f"{2023 + n % 2}-{1 + n % 12:02d}-{1 + n % 28:02d}",
+                "OrderQty": float(10 * (n % 7) + item),
+                "OpenQty": float(n % 3),
+            })
+        for sloc in range(1 + n % 3):
+            stock.append({
+                "SalesOrder": order,
+                "Sloc": f"S{sloc}",
+                "UnrestrictQty": float(n * 3 + sloc),
+                "UnrestrictValue": round(n * 12.5 + sloc, 2),
+            })
+        material.append({"SalesOrder": order, "Material1": f"M{n % 6}", "NetPrice": round(1.5 * (n % 9 + 1), 2)})
+    return {
+        "SALES_LOGISTICS": pd.DataFrame(sales),
+        "WAREHOUSE_STOCK": pd.DataFrame(stock),
+        "MANUFACTURING_MATERIAL": pd.DataFrame(material),
+    }
+
+
+def write_single_db(frames, path):
+    conn = sqlite3.connect(path)
+    try:
+        for table, df in frames.items():
+            df.to_sql(table, conn, index=False)
+            conn.execute(f'CREATE INDEX "idx_{table}_SalesOrder" ON "{table}" ("SalesOrder")')
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+class FakeModel:
+    """
+    Stands in for ModelInference: generation prompts get a fenced `sql`
+    (or answers[question]), anything else a fixed explanation. A list of
+    statements is handed out one call at a time, repeating the last one.
+    Calls are counted per kind.
+    """
+
+    def __init__(self, sql="SELECT COUNT(*) AS n FROM SALES_LOGISTICS"):
+        self.sql = sql
+        self.answers = {}
+        self.sql_calls = 0
+        self.explain_calls = 0
+
+    def reply(self, messages):
+        if "senior SQL expert" in messages[0]["content"]:
+            self.sql_calls += 1
+            sql = self.answers.get(messages[1]["content"], self.sql)
+            if isinstance(sql, list):
+                sql = sql.pop(0) if len(sql) > 1 else sql[0]
+            return f"```sql\n{sql}\n```"
+        self.explain_calls += 1
+        return "There are some sales lines."
+
+    def chat(self, messages, **kwargs):
+        content = self.reply(messages)
+        return {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]}
+
+    async def achat_stream(self, messages, **kwargs):
+        words = self.reply(messages).split(" ")
+        for i, word in enumerate(words):
+            yield {"choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}}]}
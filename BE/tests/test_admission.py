@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+import admission
+from cache import LRUCache
+from telemetry import bump, snapshot
+
+SALES_ROWS = 72
+STOCK_ROWS = 120
+
+
+def test_index_lookup_costs_its_rows_per_key():
+    estimate = admission.estimate_query_cost("SELECT * FROM SALES_LOGISTICS WHERE SalesOrder = 5001")
+    assert estimate["full_scans"] == []
+    assert 1 <= estimate["cost"] <= 2
+
+
+def test_rowid_lookup_costs_one_row():
+    assert admission.estimate_query_cost("SELECT * FROM SALES_LOGISTICS WHERE rowid = 3")["cost"] == 1
+
+
+def test_full_scan_costs_the_table():
+    estimate = admission.estimate_query_cost("SELECT * FROM SALES_LOGISTICS")
+    assert estimate == {"cost": SALES_ROWS, "tables": 1, "full_scans": ["SALES_LOGISTICS"], "temp_btrees": 0}
+
+
+def test_sort_adds_a_temp_btree():
+    estimate = admission.estimate_query_cost("SELECT * FROM SALES_LOGISTICS ORDER BY OrderQty")
+    assert estimate["temp_btrees"] == 1
+    assert estimate["cost"] > SALES_ROWS
+
+
+def test_nested_loops_multiply():
+    indexed = admission.estimate_query_cost(
+        "SELECT * FROM SALES_LOGISTICS s JOIN WAREHOUSE_STOCK w ON s.SalesOrder = w.SalesOrder")
+    cross = admission.estimate_query_cost(
+        "SELECT COUNT(*) FROM SALES_LOGISTICS a, SALES_LOGISTICS b, WAREHOUSE_STOCK c")
+    assert indexed["cost"] < SALES_ROWS * 10
+    assert cross["tables"] == 3
+    assert cross["cost"] >= SALES_ROWS * SALES_ROWS * STOCK_ROWS
+
+
+@pytest.fixture
+def thresholds(monkeypatch):
+    monkeypatch.setattr(admission, "QUERY_COST_HEAVY", 100)
+    monkeypatch.setattr(admission, "QUERY_COST_REJECT", 100000)
+    monkeypatch.setattr(admission, "plan_cache", LRUCache(16, 60))
+
+
+@pytest.mark.parametrize("sql, decision", [
+    ("SELECT * FROM SALES_LOGISTICS WHERE SalesOrder = 5001", "run"),
+    ("SELECT * FROM SALES_LOGISTICS ORDER BY OrderQty", "heavy"),
+    ("SELECT COUNT(*) FROM SALES_LOGISTICS a, SALES_LOGISTICS b, WAREHOUSE_STOCK c", "rejected"),
+])
+def test_admission_decisions(thresholds, sql, decision):
+    assert admission.admit_query(sql)["decision"] == decision
+
+
+def test_unplannable_statement_is_left_to_execution(thresholds):
+    assert admission.admit_query("SELECT nope FROM SALES_LOGISTICS") == {"decision": "run", "cost": None}
+
+
+def test_rejection_is_a_422():
+    with pytest.raises(HTTPException) as e:
+        admission.record_admission({"decision": "rejected", "cost": 123456})
+    assert e.value.status_code == 422
+    assert e.value.detail["execution"]["cost"] == 123456
+
+
+def test_counters_are_exact_under_threads():
+    counters = {"n": 0}
+
+    def work():
+        for _ in range(2000):
+            bump(counters, "n")
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert snapshot(counters) == {"n": 16000}
@@ -0,0 +1,31 @@
+from fastapi.testclient import TestClient
+
+import app
+from fixture_data import FAILING_SQL
+
+client = TestClient(app.app)
+
+
+def test_identical_items_run_once_and_errors_stay_per_item(fake_model):
+    fake_model.answers["Broken?"] = FAILING_SQL
+    r = client.post("/text2sql/batch", json={"items": [
+        {"question": "How many sales lines are there?"},
+        {"question": "how many sales lines are there"},
+        {"question": "Broken?"},
+        {"question": "How many sales lines are there?", "limit": 5},
+    ]})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["unique_items"] == 3
+    results = body["results"]
+    assert [item["index"] for item in results] == [0, 1, 2, 3]
+    assert [item["deduplicated"] for item in results] == [False, True, False, False]
+    assert results[0]["response"] == results[1]["response"]
+    assert not results[2]["ok"] and results[2]["error"]["status_code"] == 400
+    assert results[3]["ok"]
+    assert fake_model.sql_calls == 3
+
+
+def test_batch_size_is_bounded():
+    r = client.post("/text2sql/batch", json={"items": [{"question": "q"}] * (app.BATCH_MAX_ITEMS + 1)})
+    assert r.status_code == 422
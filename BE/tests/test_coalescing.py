@@ -0,0 +1,79 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import app
+from fixture_data import FAILING_SQL
+
+
+def test_concurrent_calls_share_one_run_and_nothing_is_kept():
+    flight = app.SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        results = await asyncio.gather(*(flight.run("k", work) for _ in range(5)))
+        assert flight.in_flight == 0
+        return results, await flight.run("k", work)
+
+    results, later = asyncio.run(main())
+    assert results == ["result"] * 5 and later == "result"
+    assert len(calls) == 2
+    assert (flight.leaders, flight.coalesced) == (2, 4)
+
+
+def test_errors_reach_every_waiter():
+    flight = app.SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise HTTPException(status_code=400, detail="bad")
+
+    async def main():
+        return await asyncio.gather(*(flight.run("k", fail) for _ in range(3)), return_exceptions=True)
+
+    errors = asyncio.run(main())
+    assert [type(e) for e in errors] == [HTTPException] * 3
+    assert len({id(e) for e in errors}) == 1 and errors[0].status_code == 400
+
+
+def test_a_cancelled_waiter_does_not_cancel_the_shared_run():
+    flight = app.SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.run("k", work))
+        follower = asyncio.ensure_future(flight.run("k", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == "done"
+
+
+@pytest.mark.parametrize("failing", [False, True])
+def test_identical_requests_make_one_model_call(fake_model, failing):
+    if failing:
+        fake_model.sql = FAILING_SQL
+
+    async def main():
+        transport = httpx.ASGITransport(app=app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            body = {"question": "How many sales lines are there?", "explain": "always"}
+            return await asyncio.gather(*(client.post("/text2sql", json=body) for _ in range(5)))
+
+    responses = asyncio.run(main())
+    assert {r.status_code for r in responses} == ({400} if failing else {200})
+    assert len({r.text for r in responses}) == 1
+    assert fake_model.sql_calls == 1
@@ -0,0 +1,64 @@
+import os
+import sqlite3
+
+import pytest
+
+import db
+from fixture_data import sample_frames, write_single_db
+
+STOCK_COUNT = "SELECT COUNT(*) FROM WAREHOUSE_STOCK"
+
+
+@pytest.fixture
+def swappable_db(tmp_path, monkeypatch):
+    db_path = tmp_path / "data.db"
+    write_single_db(sample_frames(), db_path)
+    monkeypatch.setattr(db, "DB_PATH", str(db_path))
+    return db_path
+
+
+def swap_in(db_path, stock_rows):
+    """Replace the file the way the builder does: write a new one and rename it over"""
+    frames = sample_frames()
+    frames["WAREHOUSE_STOCK"] = frames["WAREHOUSE_STOCK"].head(stock_rows)
+    rebuilt = db_path.with_name("rebuilt.db")
+    write_single_db(frames, rebuilt)
+    os.replace(rebuilt, db_path)
+
+
+@pytest.mark.parametrize("in_memory", [False, True])
+def test_pool_reopens_after_the_file_is_swapped(swappable_db, monkeypatch, in_memory):
+    monkeypatch.setattr(db, "DB_IN_MEMORY", in_memory)
+    pool = db.SQLiteReadPool(str(swappable_db), 2)
+    with pool.connection() as conn:
+        assert conn.execute(STOCK_COUNT).fetchone()[0] == len(sample_frames()["WAREHOUSE_STOCK"])
+
+    swap_in(swappable_db, 5)
+    with pool.connection() as conn:
+        assert conn.execute(STOCK_COUNT).fetchone()[0] == 5
+    stats = pool.stats()
+    assert stats["reloads"] == 1
+    assert stats["opened"] == 2
+    assert stats["idle"] == 1
+
+
+def test_connections_are_read_only_and_survive_bad_queries(swappable_db):
+    pool = db.SQLiteReadPool(str(swappable_db), 1)
+    with pytest.raises(sqlite3.OperationalError):
+        with pool.connection() as conn:
+            conn.execute("DELETE FROM WAREHOUSE_STOCK")
+    with pytest.raises(sqlite3.OperationalError):
+        with pool.connection() as conn:
+            conn.execute("SELECT NoSuchColumn FROM WAREHOUSE_STOCK")
+    with pool.connection() as conn:
+        conn.execute(STOCK_COUNT).fetchone()
+    assert pool.stats()["opened"] == 1
+
+
+def test_checkout_times_out_when_the_pool_is_exhausted(swappable_db, monkeypatch):
+    monkeypatch.setattr(db, "DB_POOL_TIMEOUT", 0.01)
+    pool = db.SQLiteReadPool(str(swappable_db), 1)
+    with pool.connection():
+        with pytest.raises(RuntimeError):
+            with pool.connection():
+                pass
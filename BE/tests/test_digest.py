@@ -0,0 +1,27 @@
+import app
+
+
+def results_for(n, columns=("Customer", "Plant", "OrderQty", "Status")):
+    rows = [(f"Customer {i % 8} with a fairly long trading name", 1000 * (1 + i % 3), float(i), "Open" if i % 4 else "Done")
+            for i in range(n)]
+    return app.encode_rows(list(columns), rows, "rows", False)
+
+
+def test_small_result_is_listed_in_full():
+    text, tokens = app.build_result_digest(results_for(3))
+    assert "All rows" in text and text.count("\n3. ") == 1
+    assert tokens == sum(app.estimate_tokens(line) + 1 for line in text.split("\n"))
+
+
+def test_large_result_stays_within_the_budget():
+    for budget in (60, 200, 1200):
+        text, tokens = app.build_result_digest(results_for(5000), token_budget=budget)
+        assert tokens <= budget
+        assert tokens == sum(app.estimate_tokens(line) + 1 for line in text.split("\n"))
+    text, _ = app.build_result_digest(results_for(5000), token_budget=1200)
+    assert "Column stats:" in text and "Representative rows" in text
+
+
+def test_empty_result():
+    text, _ = app.build_result_digest(app.encode_rows(["a"], [], "rows", False))
+    assert text == "No results found."
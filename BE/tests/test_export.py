@@ -0,0 +1,45 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+import admission
+import app
+
+client = TestClient(app.app)
+
+
+def test_export_streams_every_row(monkeypatch):
+    monkeypatch.setattr(app, "export_slots", asyncio.Semaphore(1))
+    r = client.post("/export", json={"sql_query": "SELECT SalesOrder, Sloc FROM WAREHOUSE_STOCK"})
+    assert r.status_code == 200
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert len(rows) == app.run_select("SELECT COUNT(*) AS n FROM WAREHOUSE_STOCK")["rows"][0]["n"]
+    assert not app.export_slots.locked()
+
+
+def test_export_goes_through_admission(monkeypatch):
+    monkeypatch.setattr(admission, "QUERY_COST_REJECT", 1000)
+    r = client.post("/export", json={
+        "sql_query": "SELECT COUNT(*) FROM SALES_LOGISTICS a, SALES_LOGISTICS b, WAREHOUSE_STOCK c",
+    })
+    assert r.status_code == 422
+    assert r.json()["detail"]["execution"]["decision"] == "rejected"
+
+
+def test_export_runs_under_its_own_deadline(monkeypatch):
+    monkeypatch.setattr(app, "EXPORT_TIMEOUT_SECONDS", 1e-9)
+    monkeypatch.setattr(app, "export_slots", asyncio.Semaphore(1))
+    before = app.snapshot(app.admission_counters)["timeouts"]
+    r = client.post("/export", json={
+        "sql_query": "SELECT COUNT(*) FROM SALES_LOGISTICS a, SALES_LOGISTICS b, SALES_LOGISTICS c",
+    })
+    assert r.status_code == 504
+    assert app.snapshot(app.admission_counters)["timeouts"] == before + 1
+    assert not app.export_slots.locked()
+
+
+def test_exports_beyond_the_limit_get_a_429(monkeypatch):
+    monkeypatch.setattr(app, "export_slots", asyncio.Semaphore(0))
+    r = client.post("/export", json={"sql_query": "SELECT 1"})
+    assert r.status_code == 429
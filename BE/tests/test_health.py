@@ -0,0 +1,32 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import app
+
+client = TestClient(app.app)  # no lifespan: each test drives warm-up itself
+
+
+def test_service_is_ready_once_warm_up_has_run(monkeypatch):
+    monkeypatch.setattr(app, "startup_state", app.StartupState())
+    r = client.get("/health/ready")
+    assert r.status_code == 503 and r.json()["status"] == "starting"
+    assert client.get("/health/live").status_code == 200
+
+    asyncio.run(app.warm_up())
+    r = client.get("/health/ready")
+    assert r.status_code == 200, r.text
+    assert r.json()["startup"]["model"] == "lazy"  # STARTUP_WARM_MODEL=false in the tests
+    assert client.get("/health").json()["ready"] is True
+
+
+def test_not_ready_when_the_model_failed_to_initialize(monkeypatch):
+    state = app.StartupState()
+    state.ready_seconds = 0.1
+    state.model = "error"
+    state.errors["model"] = "no credentials"
+    monkeypatch.setattr(app, "startup_state", state)
+    monkeypatch.setattr(app, "_model", None)
+    r = client.get("/health/ready")
+    assert r.status_code == 503 and r.json()["status"] == "error"
+    assert client.get("/health/live").status_code == 200
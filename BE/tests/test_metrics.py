@@ -0,0 +1,42 @@
+import json
+
+from fastapi.testclient import TestClient
+
+import app
+import db
+import telemetry
+
+client = TestClient(app.app)
+
+
+def test_stages_are_timed_and_exported(fake_model):
+    r = client.post("/text2sql", json={"question": "How many sales lines are there?"})
+    assert r.status_code == 200, r.text
+    timing = r.headers["Server-Timing"]
+    assert "sql_generation;dur=" in timing and "db;dur=" in timing
+
+    body = client.get("/metrics").text
+    assert 'text2sql_stage_seconds_count{stage="db"}' in body
+    assert "sql_result_rows_bucket" in body
+
+
+def test_slow_queries_are_logged_with_their_plan(monkeypatch, tmp_path):
+    log = tmp_path / "slow.jsonl"
+    monkeypatch.setattr(telemetry, "SLOW_QUERY_MS", 0)
+    monkeypatch.setattr(telemetry, "SLOW_QUERY_LOG_PATH", str(log))
+    telemetry.record_query("SELECT * FROM SALES_LOGISTICS WHERE SalesOrder = 5001", 0.01, {"row_count": 1}, 10)
+    record = json.loads(log.read_text(encoding="utf-8"))
+    assert record["rows"] == 1
+    assert any("SalesOrder" in step for step in record["plan"])
+
+
+def test_slow_query_is_still_logged_when_no_connection_is_free(monkeypatch, tmp_path):
+    log = tmp_path / "slow.jsonl"
+    monkeypatch.setattr(telemetry, "SLOW_QUERY_MS", 0)
+    monkeypatch.setattr(telemetry, "SLOW_QUERY_LOG_PATH", str(log))
+    monkeypatch.setattr(db, "DB_POOL_TIMEOUT", 0.01)
+    pool = db.SQLiteReadPool(db.DB_PATH, 1)
+    monkeypatch.setattr(telemetry, "db_pool", pool)
+    with pool.connection():
+        telemetry.record_query("SELECT 1", 0.01, {"row_count": 1}, 10)
+    assert json.loads(log.read_text(encoding="utf-8"))["plan"][0].startswith("unavailable")
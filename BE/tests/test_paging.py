@@ -0,0 +1,78 @@
+import base64
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app
+
+client = TestClient(app.app)
+
+
+def encode(state):
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode().rstrip("=")
+
+
+def first_page(fake_model, question, sql, limit):
+    fake_model.sql = sql
+    r = client.post("/text2sql", json={"question": question, "limit": limit, "explain": "never"})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def all_pages(fake_model, question, sql, limit):
+    body = first_page(fake_model, question, sql, limit)
+    rows, modes = list(body["results"]["rows"]), []
+    handle, cursor = body["result_handle"], body["next_cursor"]
+    while cursor:
+        r = client.post(f"/results/{handle}/page", json={"cursor": cursor, "limit": limit})
+        assert r.status_code == 200, r.text
+        page = r.json()
+        rows.extend(page["results"]["rows"])
+        modes.append(page["mode"])
+        cursor = page["next_cursor"]
+    return rows, modes
+
+
+def full_result(sql):
+    return app.run_select(sql)["rows"]
+
+
+def test_unique_key_pages_by_keyset(fake_model):
+    sql = "SELECT SalesOrder, Sloc, UnrestrictQty FROM WAREHOUSE_STOCK ORDER BY UnrestrictQty DESC"
+    rows, modes = all_pages(fake_model, "paging walk over distinct stock quantities", sql, 7)
+    assert rows == full_result(sql)
+    assert set(modes) == {"keyset"}
+
+
+def test_repeated_key_falls_back_to_offset(fake_model):
+    # OrderQty takes seven values over 72 rows: every page boundary falls inside a tie
+    sql = "SELECT SalesOrder, LineItemNo, OrderQty FROM SALES_LOGISTICS ORDER BY OrderQty"
+    rows, modes = all_pages(fake_model, "paging walk over tied sales quantities", sql, 5)
+    expected = full_result(sql)
+    assert len(rows) == len(expected)
+    assert sorted(map(json.dumps, rows)) == sorted(map(json.dumps, expected))
+    assert [r["OrderQty"] for r in rows] == [r["OrderQty"] for r in expected]
+    assert modes and set(modes) == {"offset"}
+
+
+@pytest.mark.parametrize("state", [
+    {"x": 1},
+    [1],
+    {"o": 0, "v": "1", "t": "a"},
+    {"o": -1},
+    {"o": True},
+    {"o": 0, "v": [1], "t": 0},
+    "just a string",
+])
+def test_malformed_cursor_is_a_400(fake_model, state):
+    sql = "SELECT SalesOrder, Sloc FROM WAREHOUSE_STOCK ORDER BY SalesOrder, Sloc"
+    body = first_page(fake_model, "paging cursor validation run", sql, 3)
+    r = client.post(f"/results/{body['result_handle']}/page", json={"cursor": encode(state)})
+    assert r.status_code == 400
+    r = client.post(f"/results/{body['result_handle']}/page", json={"cursor": "%%%"})
+    assert r.status_code == 400
+
+
+def test_unknown_handle_is_a_404():
+    assert client.post("/results/nope/page", json={}).status_code == 404
@@ -0,0 +1,128 @@
+"""
+Partitioned builds must answer every statement exactly as a single-file build
+of the same rows. The fixture data has orders whose line items span two plants,
+so a Plant split by SalesOrder leaves rows of one plant in several partitions.
+"""
+import sqlite3
+
+import pytest
+
+import app
+import build_datadase as B
+import db
+import partitions
+from fixture_data import sample_frames, write_single_db
+
+
+@pytest.fixture(scope="module")
+def builds(tmp_path_factory):
+    root = tmp_path_factory.mktemp("partitioned")
+    frames = sample_frames()
+    single = root / "single.db"
+    write_single_db(frames, single)
+    db_path = root / "data.db"
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(B, "DB_PATH", db_path)
+        mp.setattr(B, "MANIFEST_PATH", root / "data.manifest.json")
+        mp.setattr(B, "PARTITIONS_CATALOG_PATH", root / "data.partitions.json")
+        mp.setattr(B, "PARTITIONS_DIR", root / "data.partitions")
+        mp.setattr(B, "API_URL", None)
+        assert B.create_partitioned_database(frames, "Plant") is not None
+    return single, db_path, root / "data.partitions.json"
+
+
+@pytest.fixture
+def partition_set(builds, monkeypatch):
+    _, db_path, catalog = builds
+    catalog_pool = db.SQLiteReadPool(str(db_path), 2)
+    monkeypatch.setattr(db, "DB_PATH", str(db_path))
+    monkeypatch.setattr(partitions, "DB_PATH", str(db_path))
+    monkeypatch.setattr(partitions, "DB_PARTITIONS_PATH", str(catalog))
+    monkeypatch.setattr(partitions, "db_pool", catalog_pool)
+    monkeypatch.setattr(partitions, "_partition_state", (None, None))
+    monkeypatch.setattr(app, "db_pool", catalog_pool)
+    partition_set = partitions.get_partition_set()
+    assert partition_set is not None and len(partition_set.paths) == 3
+    yield partition_set
+    partition_set.close_all()
+
+
+def single_result(builds, sql):
+    conn = sqlite3.connect(builds[0])
+    try:
+        return [list(row) for row in conn.execute(sql)]
+    finally:
+        conn.close()
+
+
+def partitioned_result(partition_set, sql):
+    before = dict(partition_set.routes)
+    rows = app.run_select(sql, row_format="matrix")["data"]
+    route = next(r for r, n in partition_set.routes.items() if n > before[r])
+    return rows, route
+
+
+def test_orders_span_partitions(builds):
+    assert single_result(builds, "SELECT COUNT(*) FROM (SELECT SalesOrder FROM SALES_LOGISTICS "
+                                 "GROUP BY SalesOrder HAVING COUNT(DISTINCT Plant) > 1)") == [[12]]
+
+
+@pytest.mark.parametrize("sql, route", [
+    # Plant is not co-located: rows of one plant sit in several partitions
+    ("SELECT COUNT(DISTINCT Plant) FROM SALES_LOGISTICS", "union"),
+    ("SELECT Plant, COUNT(DISTINCT Plant), COUNT(*) FROM SALES_LOGISTICS GROUP BY Plant", "union"),
+    ("SELECT s.Plant, COUNT(*) FROM SALES_LOGISTICS s JOIN SALES_LOGISTICS t ON s.Plant = t.Plant GROUP BY s.Plant",
+     "union"),
+    ("SELECT COUNT(*) FROM SALES_LOGISTICS s JOIN WAREHOUSE_STOCK w "
+     "ON s.SalesOrder = w.SalesOrder OR s.Plant = 1000", "union"),
+    # Joins and distinct counts on the link column stay within a partition
+    ("SELECT COUNT(*) FROM SALES_LOGISTICS s JOIN WAREHOUSE_STOCK w USING (SalesOrder)", "fanout"),
+    ("SELECT COUNT(1) FROM SALES_LOGISTICS JOIN WAREHOUSE_STOCK USING (SalesOrder)", "fanout"),
+    ("SELECT COUNT(*) FROM SALES_LOGISTICS s JOIN WAREHOUSE_STOCK w ON s.SalesOrder = w.SalesOrder", "fanout"),
+    ("SELECT COUNT(*) FROM SALES_LOGISTICS NATURAL JOIN WAREHOUSE_STOCK", "union"),
+    ("SELECT COUNT(DISTINCT SalesOrder) FROM SALES_LOGISTICS", "fanout"),
+    ("SELECT COUNT(*) FROM WAREHOUSE_STOCK", "fanout"),
+    ("SELECT Plant, SUM(OrderQty) AS qty, COUNT(*) FROM SALES_LOGISTICS GROUP BY Plant", "fanout"),
+])
+def test_unordered_results_match_single_file(builds, partition_set, sql, route):
+    rows, used = partitioned_result(partition_set, sql)
+    assert sorted(rows) == sorted(single_result(builds, sql))
+    assert used == route
+
+
+@pytest.mark.parametrize("sql, route", [
+    ("SELECT * FROM WAREHOUSE_STOCK ORDER BY UnrestrictQty DESC LIMIT 5", "fanout"),
+    ("SELECT Plant, SUM(OrderQty) AS qty FROM SALES_LOGISTICS GROUP BY Plant ORDER BY qty DESC, Plant", "fanout"),
+    ("SELECT SalesOrder, UnrestrictValue FROM WAREHOUSE_STOCK ORDER BY 2 LIMIT 4 OFFSET 3", "fanout"),
+    # The sort key is not an output column: decided before any partition is queried
+    ("SELECT SalesOrder FROM WAREHOUSE_STOCK ORDER BY UnrestrictQty DESC LIMIT 5", "union"),
+])
+def test_ordered_results_match_single_file(builds, partition_set, sql, route):
+    rows, used = partitioned_result(partition_set, sql)
+    assert rows == single_result(builds, sql)
+    assert used == route
+
+
+def test_catalog_only_statement_skips_partitions(partition_set):
+    rows, used = partitioned_result(partition_set, "SELECT 1")
+    assert rows == [[1]] and used == "catalog"
+
+
+def test_plan_places_order_by_terms():
+    plan = partitions.plan_fanout("SELECT a, SUM(b) AS total FROM t GROUP BY a ORDER BY total DESC, 1", {"SalesOrder"})
+    assert plan["order"] == [(1, True), (0, False)]
+    assert partitions.plan_fanout("SELECT a FROM t ORDER BY b", {"SalesOrder"}) is None
+    assert partitions.plan_fanout("SELECT * FROM t ORDER BY b", {"SalesOrder"}) is None
+    assert partitions.plan_fanout("SELECT * FROM t ORDER BY b", {"SalesOrder"}, ["a", "b"])["order"] == [(1, False)]
+
+
+def test_slow_query_plans_come_from_where_the_statement_ran(partition_set):
+    fanout = "SELECT Plant, SUM(OrderQty) AS qty FROM SALES_LOGISTICS GROUP BY Plant"
+    pool, statement = partition_set.explain_target(fanout)
+    assert pool in partition_set.pools.values() and statement == partitions.plan_fanout(fanout, partition_set.co_located)["sql"]
+    assert partition_set.explain_target("SELECT COUNT(DISTINCT Plant) FROM SALES_LOGISTICS")[0] is partition_set.union_pool
+    assert partition_set.explain_target("SELECT 1")[0] is app.db_pool
+
+
+def test_entity_values_are_read_from_the_partitions(partition_set):
+    assert "customer 1" in app.get_schema_catalog().entity_values()
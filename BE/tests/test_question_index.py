@@ -0,0 +1,98 @@
+from fastapi.testclient import TestClient
+
+import app
+from question_index import QuestionIndex, make_question_template
+
+COUNT_SQL = (
+    "SELECT COUNT(*) FROM SALES_LOGISTICS WHERE NameSoldtoParty = 'Customer 3' "
+    "AND strftime('%Y', SalesDate2) = '2024'"
+)
+
+
+def make_index(tmp_path, *pairs):
+    index = QuestionIndex(str(tmp_path / "index.jsonl"), 100, app.get_schema_catalog().entity_values)
+    for question, sql in pairs:
+        index.add(question, sql)
+    return index
+
+
+def test_template_slots_literals_found_in_the_question():
+    t = make_question_template("How many orders for Customer 3 in 2024?", COUNT_SQL)
+    assert t["question_template"] == "How many orders for <S0> in <S1>"
+    assert t["slots"] == ["text", "text:number"]
+    assert "'<S0>'" in t["sql_template"] and "'<S1>'" in t["sql_template"]
+
+
+def test_like_fragment_gets_its_own_slot_kind():
+    t = make_question_template(
+        "Orders of customers named like tomer 5",
+        "SELECT * FROM SALES_LOGISTICS WHERE NameSoldtoParty LIKE '%tomer 5%'",
+    )
+    assert t["slots"] == ["text:like"]
+    assert "'%<S0>%'" in t["sql_template"]
+
+
+def test_reuses_sql_for_known_entity(tmp_path):
+    index = make_index(tmp_path, ("How many orders for Customer 3 in 2024?", COUNT_SQL))
+    sql, examples = index.lookup("how many orders for Customer 7 in 2023")
+    assert sql == COUNT_SQL.replace("Customer 3", "Customer 7").replace("'2024'", "'2023'")
+    assert examples == []
+    assert app.validate_sql(sql) is None
+
+
+def test_text_slot_does_not_swallow_extra_words(tmp_path):
+    index = make_index(tmp_path, ("How many orders for Customer 3 in 2024?", COUNT_SQL))
+    sql, _ = index.lookup("How many orders for Customer 7 shipped late in 2023")
+    assert sql is None
+
+
+def test_unknown_entity_is_not_reused(tmp_path):
+    index = make_index(tmp_path, ("How many orders for Customer 3 in 2024?", COUNT_SQL))
+    sql, examples = index.lookup("How many orders for Acme Trading in 2023")
+    assert sql is None
+    assert examples  # still a useful few-shot example
+
+
+def test_number_slot_only_takes_numbers(tmp_path):
+    index = make_index(tmp_path, (
+        "Show the top 5 orders by quantity",
+        "SELECT * FROM SALES_LOGISTICS ORDER BY OrderQty DESC LIMIT 5",
+    ))
+    assert index.lookup("Show the top 10 orders by quantity")[0].endswith("LIMIT 10")
+    assert index.lookup("Show the top five orders by quantity")[0] is None
+
+
+def test_non_slot_words_must_match_exactly(tmp_path):
+    index = make_index(tmp_path, ("How many orders for Customer 3 in 2024?", COUNT_SQL))
+    assert index.lookup("How many open orders for Customer 7 in 2023")[0] is None
+    assert index.lookup("How many returns for Customer 7 in 2023")[0] is None
+
+
+def test_like_slot_accepts_fragment_of_known_value(tmp_path):
+    index = make_index(tmp_path, (
+        "Orders of customers named like tomer 5",
+        "SELECT * FROM SALES_LOGISTICS WHERE NameSoldtoParty LIKE '%tomer 5%'",
+    ))
+    assert index.lookup("Orders of customers named like tomer 2")[0].endswith("LIKE '%tomer 2%'")
+    assert index.lookup("Orders of customers named like zzz")[0] is None
+
+
+def test_persisted_entries_reload(tmp_path):
+    make_index(tmp_path, ("How many orders for Customer 3 in 2024?", COUNT_SQL))
+    reloaded = QuestionIndex(str(tmp_path / "index.jsonl"), 100, app.get_schema_catalog().entity_values)
+    assert reloaded.load() == 1
+    assert reloaded.lookup("How many orders for Customer 1 in 2023")[0] is not None
+
+
+def test_answered_questions_are_indexed_and_reused(fake_model):
+    client = TestClient(app.app)
+    fake_model.sql = COUNT_SQL
+    r = client.post("/text2sql", json={"question": "How many orders for Customer 3 in 2024?"})
+    assert r.status_code == 200, r.text
+    assert len(app.question_index.entries) == 1
+    with open(app.question_index.path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
+
+    r = client.post("/text2sql", json={"question": "How many orders for Customer 5 in 2023?"})
+    assert "'Customer 5'" in r.json()["sql_query"]
+    assert fake_model.sql_calls == 1
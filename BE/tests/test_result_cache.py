@@ -0,0 +1,49 @@
+import os
+
+from fastapi.testclient import TestClient
+
+import app
+import db
+from fixture_data import sample_frames, write_single_db
+
+client = TestClient(app.app)
+
+COUNT_SQL = "SELECT COUNT(*) AS n FROM SALES_LOGISTICS;"
+
+
+def test_repeated_question_reuses_rows_and_explanation(fake_model):
+    hits = app.result_cache.stats()["hits"]
+    for _ in range(2):
+        r = client.post("/text2sql", json={"question": "How many sales lines are there?", "explain": "always"})
+        assert r.status_code == 200, r.text
+    assert app.result_cache.stats()["hits"] == hits + 1
+    assert fake_model.explain_calls == 1
+
+
+def test_replaced_database_flushes_cached_rows(fake_model, tmp_path, monkeypatch):
+    db_path = tmp_path / "data.db"
+    write_single_db(sample_frames(), db_path)
+    monkeypatch.setattr(db, "DB_PATH", str(db_path))
+    app.cached_select(COUNT_SQL)
+    app.cached_select(COUNT_SQL)
+    before = app.result_cache.stats()
+
+    rebuilt = tmp_path / "rebuilt.db"
+    write_single_db(sample_frames(), rebuilt)
+    os.replace(rebuilt, db_path)
+    app.cached_select(COUNT_SQL)
+    after = app.result_cache.stats()
+    assert after["invalidations"] == before["invalidations"] + 1
+    assert after["misses"] == before["misses"] + 1
+
+
+def test_result_cache_is_bounded_by_rows():
+    cache = app.ResultCache(max_bytes=1 << 20, max_rows=5)
+    rows = lambda n: {"columns": ["x"], "rows": [{"x": i} for i in range(n)], "row_count": n}
+    cache.put("a", "v1", rows(3))
+    cache.put("b", "v1", rows(3))
+    assert cache.get("a", "v1") is None
+    assert cache.get("b", "v1")["row_count"] == 3
+    cache.put("c", "v1", rows(6))
+    assert cache.get("c", "v1") is None
+    assert cache.stats()["rows"] == 3
@@ -0,0 +1,52 @@
+import app
+
+
+def selected(question):
+    return {table: [c for c, _ in columns] for table, columns in app.get_schema_catalog().select(question).items()}
+
+
+def test_catalog_is_introspected_from_the_database():
+    tables = app.get_schema_catalog().tables
+    assert set(tables) == {"SALES_LOGISTICS", "WAREHOUSE_STOCK", "MANUFACTURING_MATERIAL"}
+    assert ("Plant", "INTEGER") in tables["SALES_LOGISTICS"]
+
+
+def test_question_keeps_only_the_tables_it_mentions():
+    assert list(selected("Total stock in the warehouse per sloc")) == ["WAREHOUSE_STOCK"]
+    assert list(selected("ยอดขายปีนี้")) == ["SALES_LOGISTICS"]
+
+
+def test_column_only_hits_are_pruned_to_those_columns_plus_join_keys():
+    tables = selected("Net price per client")
+    assert set(tables) == {"SALES_LOGISTICS", "MANUFACTURING_MATERIAL"}
+    assert tables["SALES_LOGISTICS"] == ["SalesOrder", "NameSoldtoParty"]
+    assert "NetPrice" in tables["MANUFACTURING_MATERIAL"] and "SalesOrder" in tables["MANUFACTURING_MATERIAL"]
+
+
+def test_unmatched_question_or_disabled_pruning_sends_everything(monkeypatch):
+    everything = app.get_schema_catalog().tables
+    assert list(selected("Hello there")) == list(everything)
+    monkeypatch.setattr(app, "SCHEMA_PRUNING", False)
+    assert list(selected("Total stock in the warehouse")) == list(everything)
+
+
+def test_prompt_renders_the_pruned_schema_with_annotations():
+    prompt = app.build_generation_prompt("Total stock in the warehouse per sloc")
+    assert "TABLE WAREHOUSE_STOCK (" in prompt
+    assert "-- Storage Location" in prompt
+    assert "TABLE SALES_LOGISTICS" not in prompt
+    assert "Use JOINs" not in prompt
+
+
+def test_summary_tables_are_annotated_and_preferred_only_when_built():
+    tables = dict(app.get_schema_catalog().tables)
+    annotations = app._load_annotations()
+    summary = "SUMMARY_OPEN_QTY_BY_CUSTOMER_MONTH"
+    assert summary in annotations["summaries"]
+    assert "Prefer them" not in app.SchemaCatalog(tables, annotations, "v").render("Open qty per customer per month")[2]
+
+    tables[summary] = [("NameSoldtoParty", "TEXT"), ("SalesMonth", "TEXT"), ("OpenQty", "REAL")]
+    schema, _, guideline = app.SchemaCatalog(tables, annotations, "v").render("Open qty per customer per month")
+    assert f"TABLE {summary} (" in schema
+    assert "-- Summary: " in schema
+    assert guideline.startswith(f"- {summary} are precomputed aggregates")
@@ -0,0 +1,60 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app
+import db
+from fixture_data import FAILING_SQL, sample_frames, write_single_db
+
+client = TestClient(app.app)
+
+
+@pytest.fixture(autouse=True)
+def sql_cache_only(monkeypatch):
+    # The similar-question index would otherwise answer repeats without the model
+    monkeypatch.setattr(app, "QUESTION_INDEX_ENABLED", False)
+
+
+def ask(question="How many sales lines are there?"):
+    r = client.post("/text2sql", json={"question": question})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_rephrased_question_reuses_generated_sql(fake_model):
+    ask()
+    ask("  how many SALES lines are there ")
+    assert fake_model.sql_calls == 1
+    assert app.sql_cache.stats()["hits"] >= 1
+
+
+def test_rebuilt_database_misses_the_cache(fake_model, tmp_path, monkeypatch):
+    db_path = tmp_path / "data.db"
+    write_single_db(sample_frames(), db_path)
+    monkeypatch.setattr(db, "DB_PATH", str(db_path))
+    ask()
+    ask()
+    assert fake_model.sql_calls == 1
+
+    rebuilt = tmp_path / "rebuilt.db"
+    write_single_db(sample_frames(), rebuilt)
+    os.replace(rebuilt, db_path)
+    ask()
+    assert fake_model.sql_calls == 2
+
+
+def test_invalidate_drops_cached_sql(fake_model):
+    ask()
+    r = client.post("/cache/invalidate")
+    assert r.json()["sql_generation_cleared"] == 1
+    ask()
+    assert fake_model.sql_calls == 2
+
+
+def test_failing_sql_is_not_cached(fake_model):
+    fake_model.sql = FAILING_SQL
+    for _ in range(2):
+        r = client.post("/text2sql", json={"question": "Broken?"})
+        assert r.status_code == 400
+    assert fake_model.sql_calls == 2
@@ -0,0 +1,54 @@
+import json
+
+from fastapi.testclient import TestClient
+
+import app
+from fixture_data import FAILING_SQL
+
+client = TestClient(app.app)
+
+
+def stream(question, **body):
+    r = client.post("/text2sql/stream", json={"question": question, **body})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/event-stream")
+    assert r.text.endswith("\n\n")
+    events = []
+    for block in r.text.split("\n\n")[:-1]:
+        event, data = block.split("\n")
+        assert event.startswith("event: ") and data.startswith("data: ")
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def test_events_follow_the_pipeline_and_rows_are_chunked(fake_model, monkeypatch):
+    monkeypatch.setattr(app, "SSE_ROW_CHUNK_SIZE", 10)
+    fake_model.sql = "SELECT SalesOrder, LineItemNo FROM SALES_LOGISTICS"
+    events = stream("List every sales line")
+    kinds = [kind for kind, _ in events]
+    assert kinds[:2] == ["sql", "columns"]
+    assert kinds[-1] == "done"
+
+    total = events[1][1]["row_count"]
+    chunks = [data for kind, data in events if kind == "rows"]
+    assert [c["offset"] for c in chunks] == list(range(0, total, 10))
+    assert sum(len(c["rows"]) for c in chunks) == total
+
+    deltas = [data["delta"] for kind, data in events if kind == "explanation"]
+    assert len(deltas) > 1
+    assert "".join(deltas) == events[-1][1]["explanation"] == "There are some sales lines."
+
+
+def test_cached_explanation_arrives_as_one_event(fake_model):
+    stream("How many sales lines are there?", explain="always")
+    events = stream("How many sales lines are there?", explain="always")
+    assert events[0][1]["cached"] is True
+    assert [kind for kind, _ in events].count("explanation") == 1
+    assert fake_model.explain_calls == 1
+
+
+def test_failures_end_the_stream_with_an_error_event(fake_model):
+    fake_model.sql = FAILING_SQL
+    events = stream("Broken?")
+    assert [kind for kind, _ in events] == ["sql", "error"]
+    assert events[-1][1]["status_code"] == 400
@@ -0,0 +1,40 @@
+import asyncio
+import json
+
+import app
+
+GENERATION = "You are a senior SQL expert."
+
+
+def generation(question):
+    return [{"role": "system", "content": GENERATION}, {"role": "user", "content": question}]
+
+
+def test_recorded_sql_is_matched_on_the_normalized_question(tmp_path):
+    responses = tmp_path / "responses.jsonl"
+    responses.write_text(json.dumps({"question": "Stock per plant?", "sql": "SELECT 1"}) + "\n", encoding="utf-8")
+    stub = app.StubModel(str(responses), latency_ms=0)
+    out = stub.chat(generation("  stock PER plant? "))
+    assert out["choices"][0]["message"]["content"] == "SELECT 1"
+    assert out["usage"]["total_tokens"] > 0
+
+
+def test_unknown_questions_fall_back_to_a_count_over_the_first_table():
+    stub = app.StubModel(latency_ms=0)
+    sql = stub.chat(generation("Anything else"))["choices"][0]["message"]["content"]
+    assert sql.startswith("SELECT COUNT(*) AS row_count FROM")
+    assert app.validate_sql(sql) is None
+    assert app.StubModel(default_sql="SELECT 2", latency_ms=0).chat(generation("x"))["choices"][0]["message"]["content"] == "SELECT 2"
+
+
+def test_stream_yields_the_same_answer_in_deltas():
+    stub = app.StubModel(latency_ms=0)
+    messages = [{"role": "user", "content": "Original question: How many?"}]
+
+    async def collect():
+        return [chunk async for chunk in stub.achat_stream(messages)]
+
+    chunks = asyncio.run(collect())
+    text = "".join(c["choices"][0]["delta"]["content"] for c in chunks if c["choices"])
+    assert text == stub.chat(messages)["choices"][0]["message"]["content"] == "(stub) Answer to: How many?"
+    assert "usage" in chunks[-1]
@@ -0,0 +1,39 @@
+from fastapi.testclient import TestClient
+
+import app
+
+client = TestClient(app.app)
+
+GOOD_SQL = "SELECT COUNT(*) AS n FROM SALES_LOGISTICS"
+BAD_SQL = "SELECT COUNT(*) AS n FROM SALES_LOGISTICS WHERE Customer = 'Customer 1'"
+
+
+def test_invalid_sql_gets_one_repair_round(fake_model):
+    fake_model.sql = [BAD_SQL, GOOD_SQL]
+    before = dict(app.validation_counters)
+    r = client.post("/text2sql", json={"question": "How many sales lines are there?"})
+    assert r.status_code == 200, r.text
+    assert r.json()["sql_query"] == GOOD_SQL + ";"
+    assert fake_model.sql_calls == 2
+    assert app.validation_counters["repaired"] == before["repaired"] + 1
+
+
+def test_repair_is_bounded_to_one_call(fake_model):
+    fake_model.sql = BAD_SQL
+    r = client.post("/text2sql", json={"question": "How many sales lines are there?"})
+    assert r.status_code == 400
+    assert "after repair" in r.json()["detail"]
+    assert fake_model.sql_calls == 2
+
+
+def test_validation_compiles_without_running():
+    assert app.validate_sql(GOOD_SQL) is None
+    assert "no such column: Customer" in app.validate_sql(BAD_SQL)
+    assert "no such table" in app.validate_sql("SELECT * FROM SALES")
+    assert app.validate_sql("DELETE FROM SALES_LOGISTICS") is not None
+
+
+def test_limit_is_only_skipped_for_a_top_level_limit():
+    assert app.maybe_wrap_with_limit("SELECT * FROM SALES_LOGISTICS LIMIT 3;", 10) == "SELECT * FROM SALES_LOGISTICS LIMIT 3;"
+    nested = "SELECT * FROM (SELECT * FROM SALES_LOGISTICS LIMIT 3) -- newest"
+    assert app.maybe_wrap_with_limit(nested, 10) == nested + "\nLIMIT 10;"
@@ -0,0 +1,90 @@
+"""
+Benchmark the database build: the old per-cell text cleaning vs the vectorized
+one, and sequential vs parallel Excel loading, on synthetic data.
+
+    python benchmark_build.py --rows 200000
+    python benchmark_build.py --rows 20000 --files 4 --workers 4   # also times Excel loading
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import build_datadase as B
+
+DATE_STYLES = ['%Y-%m-%d', '%d/%m/%Y', '%Y%m%d', '%d-%m-%Y', '%Y/%m/%d']
+NOISE = ["", " ", "  ", "\u200b", "\u00a0", "\ufeff"]
+
+
+def noisy(text, rng):
+    """Surround/split a value with the kind of junk found in exported sheets"""
+    return rng.choice(NOISE) + text.replace(" ", rng.choice([" ", "  ", " \u200b"])) + rng.choice(NOISE)
+
+
+def make_synthetic_frame(rows, seed=0):
+    rng = random.Random(seed)
+    base = pd.Timestamp("2023-01-01")
+    dates = [base + pd.Timedelta(days=rng.randrange(730)) for _ in range(rows)]
+    # Object columns, as read_excel returns text before pandas' string dtype became the default
+    return pd.DataFrame({
+        "SalesOrder": pd.Series([noisy(f"SO{2000 + i}", rng) for i in range(rows)], dtype=object),
+        "NameSoldtoParty": pd.Series([noisy(f"Customer {rng.randrange(500)} Co Ltd", rng) for _ in range(rows)],
+                                     dtype=object),
+        "MaterialDes": pd.Series([noisy(f"Can 3PC {rng.randrange(50)} mm", rng) if rng.random() > 0.05
+                                  else rng.choice(NOISE + [None]) for _ in range(rows)], dtype=object),
+        "SalesDate2": pd.Series([d.strftime(rng.choice(DATE_STYLES)) for d in dates], dtype=object),
+        "OrderQty": np.random.default_rng(seed).integers(1, 1000, rows),
+    })
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def report(label, old, new):
+    print(f"  {label:<28} legacy {old:8.3f}s   new {new:8.3f}s   speedup {old / new:6.1f}x")
+
+
+def bench_cleaning(rows):
+    df = make_synthetic_frame(rows)
+    print(f"Cleaning {rows:,} rows x {df.shape[1]} columns")
+    legacy, t_old = timed(lambda: B.clean_frame(df.copy(), vectorized=False))
+    fast, t_new = timed(lambda: B.clean_frame(df.copy()))
+    same = legacy.dtypes.equals(fast.dtypes) and legacy.equals(fast)
+    report("text cleaning", t_old, t_new)
+    print(f"  outputs identical: {same}")
+
+
+def bench_loading(rows, files, workers):
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(files):
+            path = Path(tmp) / f"TABLE_{i}.xlsx"
+            make_synthetic_frame(rows, seed=i).to_excel(path, index=False)
+            paths.append(path)
+        print(f"Loading {files} Excel files x {rows:,} rows (workers={workers}, calamine={B.HAS_CALAMINE})")
+        _, t_old = timed(lambda: B.load_all_excel_files(paths, workers=1, vectorized=False))
+        _, t_new = timed(lambda: B.load_all_excel_files(paths, workers=workers))
+        report("Excel load + clean", t_old, t_new)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark build_datadase.py cleaning and loading")
+    parser.add_argument("--rows", type=int, default=100000, help="Synthetic rows per table")
+    parser.add_argument("--files", type=int, default=0, help="Also benchmark loading this many Excel files")
+    parser.add_argument("--workers", type=int, default=4, help="Processes for parallel loading")
+    args = parser.parse_args()
+
+    bench_cleaning(args.rows)
+    if args.files:
+        bench_loading(args.rows, args.files, args.workers)
+
+
+if __name__ == "__main__":
+    main()
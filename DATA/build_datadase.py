@@ -6,11 +6,37 @@ import numpy as np
 from datetime import datetime
 import warnings
 import os
+import argparse
+import hashlib
+import json
+import urllib.request
+import importlib.util
+import re
+import shutil
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from index_advisor import (
+    ANNOTATIONS_PATH, DEFAULT_WORKLOAD_PATHS, documented_joins, optimize_database, print_plan, read_workload,
+)
 warnings.filterwarnings('ignore')
 
 # --------- CONFIG ----------
 DATA_DIR = Path(os.path.dirname(os.path.abspath(__file__))) / "TABLE"
 DB_PATH = Path("data.db")
+# Per-table source hashes and row counts from the last successful build
+MANIFEST_PATH = DB_PATH.with_name(DB_PATH.stem + ".manifest.json")
+# Base URL of the running Text2SQL API (e.g. http://localhost:8000); its caches are flushed after a rebuild
+API_URL = os.getenv("TEXT2SQL_API_URL")
+
+# `--partition-by <column>` output: one database per value under data.partitions/<build>/, listed in the
+# shared catalog data.partitions.json; data.db then holds the schema and the global summary tables
+PARTITIONS_CATALOG_PATH = DB_PATH.with_name(DB_PATH.stem + ".partitions.json")
+PARTITIONS_DIR = DB_PATH.with_name(DB_PATH.stem + ".partitions")
+UNASSIGNED_PARTITION = "unassigned"
+
+# Optional faster Excel reader (pip install python-calamine; pandas >= 2.2)
+HAS_CALAMINE = importlib.util.find_spec("python_calamine") is not None
 
 # ---------- CLEANING HELPERS ----------
 HIDDEN_CHARS = {
@@ -28,13 +54,51 @@ def clean_text(x):
         s = s.replace(ch, "")
     return " ".join(s.split()).strip()
 
-def clean_df_text_columns(df, cols):
+HIDDEN_CHARS_PATTERN = "[" + "".join(sorted(HIDDEN_CHARS)) + "]"
+
+def clean_text_series(series):
+    """Vectorized clean_text for a whole column (pandas .str operations)."""
+    mask = series.notna()
+    out = series.astype(object)
+    if not mask.any():
+        return out.infer_objects()
+    s = series[mask].astype(str)
+    s = s.str.replace(HIDDEN_CHARS_PATTERN, "", regex=True)
+    s = s.str.replace(r"\s+", " ", regex=True).str.strip()
+    out = out.copy()
+    out[mask] = s
+    # Same dtype inference as Series.apply(clean_text)
+    return out.infer_objects()
+
+def clean_df_text_columns(df, cols, vectorized=True):
     """Apply clean_text to a list of columns if present."""
     for c in cols:
         if c in df.columns:
-            df[c] = df[c].apply(clean_text)
+            df[c] = clean_text_series(df[c]) if vectorized else df[c].apply(clean_text)
     return df
 
+def blank_to_nan(series):
+    r"""Vectorized df.replace({r'^\s*$': np.nan}, regex=True) for one column."""
+    # strip() rather than a regex: it matches exactly what Python's \s does for every string dtype
+    blank = series.notna() & (series.astype(str).str.strip() == "")
+    return series.mask(blank) if blank.any() else series
+
+def clean_frame(df, vectorized=True):
+    """
+    Blank cells to NaN, then clean the text columns. Both paths give the same
+    result; the per-cell one is kept for benchmark_build.py.
+    """
+    # Replace empty strings with NaN
+    if vectorized:
+        for c in df.select_dtypes(include=['object', 'string']).columns:
+            df[c] = blank_to_nan(df[c])
+    else:
+        df = df.replace({r'^\s*$': np.nan}, regex=True)
+    
+    # Clean text columns
+    text_cols = df.select_dtypes(include=['object']).columns
+    return clean_df_text_columns(df, text_cols, vectorized=vectorized)
+
 def standardize_date(date_val):
     """Standardize various date formats to YYYY-MM-DD"""
     if pd.isna(date_val):
@@ -76,13 +140,19 @@ def to_numeric_safe(val):
         return np.nan
 
 # ---------- GENERIC LOAD FUNCTION ----------
-def load_excel_file(file_path):
+def read_excel_fast(file_path):
+    """Read the first sheet with the fastest engine available (calamine, else pandas' default)"""
+    if file_path.suffix.lower() in (".xlsx", ".xls") and HAS_CALAMINE:
+        return pd.read_excel(file_path, engine="calamine")
+    return pd.read_excel(file_path)
+
+def load_excel_file(file_path, vectorized=True):
     """Generic function to load any Excel file with consistent cleaning"""
     try:
         print(f"Loading: {file_path.name}")
         
         # Read Excel file
-        df = pd.read_excel(file_path)
+        df = read_excel_fast(file_path) if vectorized else pd.read_excel(file_path)
         
         # Debug: Print initial data info
         print(f"  Initial data shape: {df.shape}")
@@ -91,12 +161,7 @@ def load_excel_file(file_path):
         # Clean column names
         df.columns = [clean_text(str(c)) for c in df.columns]
         
-        # Replace empty strings with NaN
-        df = df.replace({r'^\s*$': np.nan}, regex=True)
-        
-        # Clean text columns
-        text_cols = df.select_dtypes(include=['object']).columns
-        df = clean_df_text_columns(df, text_cols)
+        df = clean_frame(df, vectorized=vectorized)
         
         print(f"  Successfully loaded {len(df)} records")
         return df
@@ -105,35 +170,51 @@ def load_excel_file(file_path):
         print(f"  Error loading {file_path.name}: {e}")
         return pd.DataFrame()
 
-def load_all_excel_files():
-    """Load all Excel files from the TABLE directory"""
-    print("Loading all Excel files from TABLE directory...")
-    
+def find_excel_files():
+    """Return all Excel files in the TABLE directory"""
     # Check if TABLE directory exists
     if not DATA_DIR.exists():
         print(f"ERROR: TABLE directory does not exist: {DATA_DIR.resolve()}")
-        return {}
+        return []
     
     print(f"Looking for Excel files in: {DATA_DIR.resolve()}")
     
     # Find all Excel files
-    excel_files = list(DATA_DIR.glob("*.xlsx")) + list(DATA_DIR.glob("*.xls"))
+    excel_files = sorted(list(DATA_DIR.glob("*.xlsx")) + list(DATA_DIR.glob("*.xls")))
     
     if not excel_files:
         print("No Excel files found in TABLE directory")
-        return {}
+        return []
     
     print(f"Found {len(excel_files)} Excel files:")
     for file in excel_files:
         print(f"  - {file.name}")
     
+    return excel_files
+
+def load_all_excel_files(excel_files=None, workers=1, vectorized=True):
+    """
+    Load the given Excel files (default: all files in the TABLE directory).
+    With workers > 1 the files are read and cleaned in parallel processes.
+    """
+    print("Loading Excel files from TABLE directory...")
+    
+    if excel_files is None:
+        excel_files = find_excel_files()
+    
+    loader = partial(load_excel_file, vectorized=vectorized)
+    if workers > 1 and len(excel_files) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(excel_files))) as pool:
+            loaded = list(pool.map(loader, excel_files))
+    else:
+        loaded = [loader(f) for f in excel_files]
+    
     # Load all files
     dataframes = {}
     
-    for excel_file in excel_files:
+    for excel_file, df in zip(excel_files, loaded):
         # Use filename without extension as table name
         table_name = excel_file.stem.upper()
-        df = load_excel_file(excel_file)
         
         if not df.empty:
             dataframes[table_name] = df
@@ -143,75 +224,534 @@ def load_all_excel_files():
     
     return dataframes
 
+# ---------- MANIFEST ----------
+def file_sha256(path):
+    """Content hash of a source file"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def load_manifest():
+    """Read the manifest written by the last successful build"""
+    try:
+        with open(MANIFEST_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"tables": {}}
+
+def write_manifest(manifest):
+    """Write the manifest atomically next to the database"""
+    tmp_path = MANIFEST_PATH.with_name(f".{MANIFEST_PATH.name}.tmp-{os.getpid()}")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def plan_build(excel_files, manifest, full=False):
+    """
+    Decide which tables need rebuilding.
+    Returns (files_to_load, tables_to_drop, source_hashes).
+    """
+    hashes = {f.stem.upper(): file_sha256(f) for f in excel_files}
+    previous = manifest.get("tables", {})
+    
+    if full or not DB_PATH.exists():
+        return list(excel_files), [t for t in previous if t not in hashes], hashes
+    
+    changed = [f for f in excel_files if previous.get(f.stem.upper(), {}).get("sha256") != hashes[f.stem.upper()]]
+    removed = [t for t in previous if t not in hashes]
+    return changed, removed, hashes
+
+# ---------- TYPED SCHEMA ----------
+NUMERIC_TEXT = r"-?(?:0|[1-9]\d*)(?:\.\d+)?"
+INTEGER_TEXT = r"-?(?:0|[1-9]\d*)"
+
+def typed_frame(df):
+    """
+    Tighten column types before writing: text columns that hold only plain
+    numbers become numeric (INTEGER when no value has a decimal point, nullable
+    so blanks stay NULL), datetimes become YYYY-MM-DD text. Float columns stay
+    REAL even when every value is whole, so ratios of them never turn into
+    integer division. Returns the frame and the SQLite type to declare for
+    each column. Every decision looks at the whole column, so call it on a
+    complete table, never on a slice of one.
+    """
+    df = df.copy()
+    dtypes = {}
+    for c in df.columns:
+        s = df[c]
+        if 'date' not in c.lower() and (pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s)):
+            values = s.dropna().astype(str)
+            if len(values) and values.str.fullmatch(NUMERIC_TEXT).all():
+                s = pd.to_numeric(s.astype(object).where(s.notna(), None))
+                if values.str.fullmatch(INTEGER_TEXT).all():
+                    s = s.astype("Int64")
+        if pd.api.types.is_datetime64_any_dtype(s):
+            s = s.dt.strftime('%Y-%m-%d').astype(object).where(s.notna(), None)
+        
+        if pd.api.types.is_bool_dtype(s) or pd.api.types.is_integer_dtype(s):
+            dtypes[c] = "INTEGER"
+        elif pd.api.types.is_float_dtype(s):
+            dtypes[c] = "REAL"
+        else:
+            dtypes[c] = "TEXT"
+        df[c] = s
+    return df, dtypes
+
 # ---------- DB CREATION ----------
-def create_database(dataframes_dict):
-    """Create SQLite database with all tables"""
-    print("\nCreating database...")
+def create_index(cursor, table_name, key_columns=()):
+    """Create some useful indexes (you can customize this based on your data)"""
+    try:
+        # Check if common columns exist and create indexes
+        cursor.execute(f"PRAGMA table_info({table_name})")
+        columns = [row[1] for row in cursor.fetchall()]
+        
+        # Create indexes on common ID or date columns, and on join keys
+        for col in columns:
+            col_lower = col.lower()
+            if col in key_columns or any(keyword in col_lower for keyword in ['id', 'date', 'time']):
+                try:
+                    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_{col} ON {table_name}({col})")
+                    print(f"    Index created on {table_name}.{col}")
+                except:
+                    pass  # Skip if index creation fails
+    except:
+        pass  # Skip if table doesn't exist or other error
+
+def create_database(dataframes_dict, drop_tables=(), incremental=False, workload=(), saved_indexes=None,
+                    db_path=None, summary_specs=None, column_types=None):
+    """
+    Build the database in a temporary file and atomically rename it over db_path
+    (default DB_PATH), so readers always see either the old or the new database,
+    never a partial one. With incremental=True the live database is copied first
+    and only the given tables are replaced or dropped. Summary tables are always
+    rebuilt from the result (summary_specs, default: the annotation file's).
+    Indexes are advised from the workload SQL (or saved_indexes from the last
+    build are re-created). column_types ({table: {column: type}}) marks frames
+    already converted by typed_frame() over the full table, e.g. the slices of a
+    partitioned build. Returns the build info ({"indexes", "summaries"}) on
+    success, None on failure.
+    """
+    db_path = Path(db_path or DB_PATH)
+    print(f"\nCreating database {db_path.name}...")
     
-    if not dataframes_dict:
+    if not dataframes_dict and not drop_tables and not incremental:
         print("No data to create database with")
-        return
+        return None
     
-    # Remove existing database
-    if DB_PATH.exists():
-        DB_PATH.unlink()
-        print("Removed existing database")
+    tmp_path = db_path.with_name(f".{db_path.name}.tmp-{os.getpid()}")
+    if tmp_path.exists():
+        tmp_path.unlink()
     
     # Create connection
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(tmp_path)
     
     try:
+        if incremental and db_path.exists():
+            # Consistent copy of the live database to start from
+            live = sqlite3.connect(db_path)
+            try:
+                live.backup(conn)
+            finally:
+                live.close()
+            print("Copied live database for incremental update")
+        
+        cursor = conn.cursor()
+        for table_name in drop_tables:
+            cursor.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+            print(f"  🗑️  {table_name} table dropped (source removed)")
+        
         tables_created = 0
         
         # Create table for each dataframe
         for table_name, df in dataframes_dict.items():
             if not df.empty:
-                df.to_sql(table_name, conn, if_exists='replace', index=False)
+                if column_types and table_name in column_types:
+                    dtypes = column_types[table_name]
+                else:
+                    df, dtypes = typed_frame(df)
+                df.to_sql(table_name, conn, if_exists='replace', index=False, dtype=dtypes)
                 tables_created += 1
                 print(f"  ✅ {table_name} table created: {len(df)} records")
         
         print(f"\nTotal tables created: {tables_created}")
         
-        # Create some useful indexes (you can customize this based on your data)
-        cursor = conn.cursor()
-        
-        # Example: Create indexes on common columns if they exist
+        join_keys = documented_joins()
         for table_name in dataframes_dict.keys():
-            try:
-                # Check if common columns exist and create indexes
-                cursor.execute(f"PRAGMA table_info({table_name})")
-                columns = [row[1] for row in cursor.fetchall()]
-                
-                # Create indexes on common ID or date columns
-                for col in columns:
-                    col_lower = col.lower()
-                    if any(keyword in col_lower for keyword in ['id', 'date', 'time']):
-                        try:
-                            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_{col} ON {table_name}({col})")
-                            print(f"    Index created on {table_name}.{col}")
-                        except:
-                            pass  # Skip if index creation fails
-            except:
-                pass  # Skip if table doesn't exist or other error
+            create_index(cursor, table_name, {c for t, c in join_keys if t == table_name})
+        
+        # Precomputed aggregates, refreshed from the tables just written
+        print("\nBuilding summary tables...")
+        summaries = build_summary_tables(conn, load_summary_specs() if summary_specs is None else summary_specs)
+        
+        # Workload-driven indexes, then planner statistics
+        print(f"\nOptimizing indexes ({len(workload)} workload queries)...")
+        index_plan, timings = optimize_database(conn, workload, saved_indexes)
+        print_plan(index_plan, timings)
         
         conn.commit()
+        conn.close()
+        
+        if db_path == DB_PATH and PARTITIONS_CATALOG_PATH.exists():
+            # A single file replaces a partitioned build. The API re-reads the partition list
+            # when data.db changes, so the list must be gone before the swap, not after it
+            PARTITIONS_CATALOG_PATH.unlink()
+        
+        # Atomic swap: open API connections keep reading the old inode until they reopen
+        os.replace(tmp_path, db_path)
         print("Database creation completed successfully")
+        return {"indexes": index_plan, "summaries": summaries}
         
     except Exception as e:
         print(f"Error creating database: {e}")
+        conn.close()
+        if tmp_path.exists():
+            tmp_path.unlink()
+        return None
+
+# ---------- SUMMARY TABLES ----------
+def load_summary_specs():
+    """Summary table definitions ("summaries" in BE/schema_annotations.json, shared with the API prompt)"""
+    try:
+        with open(ANNOTATIONS_PATH, encoding="utf-8") as f:
+            return json.load(f).get("summaries", {})
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Warning: could not read summary specs from {ANNOTATIONS_PATH}: {e}")
+        return {}
+
+def summary_specs_hash(specs):
+    return hashlib.sha256(json.dumps(specs, sort_keys=True).encode("utf-8")).hexdigest()
+
+def summary_sql(spec):
+    """SELECT ... GROUP BY ... for a summary spec: dimensions are the grouping keys, measures the aggregates"""
+    dims = spec.get("dimensions", {})
+    parts = [f'{d["expr"]} AS "{name}"' for name, d in dims.items()]
+    parts += [f'{m["expr"]} AS "{name}"' for name, m in spec.get("measures", {}).items()]
+    sql = f"SELECT {', '.join(parts)} FROM {spec['from']}"
+    if spec.get("where"):
+        sql += f" WHERE {spec['where']}"
+    if dims:
+        sql += " GROUP BY " + ", ".join(str(i + 1) for i in range(len(dims)))
+    return sql
+
+def build_summary_tables(conn, specs):
+    """
+    (Re)build every summary table from its spec. Summaries whose source
+    tables are missing are dropped so the prompt never advertises stale data.
+    Returns {table_name: row_count} for the summaries built.
+    """
+    built = {}
+    for name, spec in specs.items():
+        conn.execute(f'DROP TABLE IF EXISTS "{name}"')
+        staging = f"_staging_{name}"
+        try:
+            conn.execute(f'CREATE TABLE "{staging}" AS {summary_sql(spec)}')
+        except sqlite3.Error as e:
+            print(f"  ⚠️  Summary {name} skipped: {e}")
+            continue
+        # CREATE TABLE AS leaves expression columns untyped; declare what the data holds
+        decls = []
+        for row in conn.execute(f'PRAGMA table_info("{staging}")'):
+            col = row[1]
+            kind = conn.execute(
+                f'SELECT typeof("{col}") FROM "{staging}" WHERE "{col}" IS NOT NULL LIMIT 1'
+            ).fetchone()
+            decls.append(f'"{col}" {(kind[0] if kind else "text").upper()}')
+        conn.execute(f'CREATE TABLE "{name}" ({", ".join(decls)})')
+        conn.execute(f'INSERT INTO "{name}" SELECT * FROM "{staging}"')
+        conn.execute(f'DROP TABLE "{staging}"')
+        dims = list(spec.get("dimensions", {}))
+        if dims:
+            cols = ", ".join(f'"{d}"' for d in dims)
+            conn.execute(f'CREATE INDEX "idx_{name}_dims" ON "{name}" ({cols})')
+        built[name] = conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+        print(f"  📊 {name} summary built: {built[name]} rows")
+    return built
+
+# ---------- PARTITIONING ----------
+def partition_name(value):
+    """File-name-safe partition label for a column value (1000.0 -> '1000')"""
+    if value is None or pd.isna(value):
+        return UNASSIGNED_PARTITION
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return re.sub(r"[^\w-]+", "_", str(value).strip()) or UNASSIGNED_PARTITION
+
+def partition_frames(dataframes, column):
+    """
+    Split the tables by the partition column. Rows are assigned per link key (the
+    documented join column, e.g. SalesOrder, taking the first value seen for it), so
+    rows that join always land in the same partition, including tables that lack
+    the column. Tables with neither column stay whole in the catalog database.
+    Returns ({partition: {table: df}}, link column, [unpartitioned tables]).
+    """
+    owners = [t for t, df in dataframes.items() if column in df.columns]
+    if not owners:
+        raise ValueError(f"No table has a '{column}' column to partition by")
+    join_columns = defaultdict(set)
+    for table, col in documented_joins():
+        join_columns[table].add(col)
+    link = next((c for t in owners for c in sorted(join_columns[t])
+                 if any(c in df.columns for o, df in dataframes.items() if o != t)), None)
+    
+    mapping = None
+    if link:
+        keyed = pd.concat([dataframes[t][[link, column]] for t in owners if link in dataframes[t].columns])
+        keyed = keyed.dropna(subset=[link]).drop_duplicates(subset=[link])
+        mapping = keyed.set_index(link)[column].map(partition_name)
+    
+    partitions = defaultdict(dict)
+    unpartitioned = []
+    for table, df in dataframes.items():
+        if mapping is not None and link in df.columns:
+            parts = df[link].map(mapping)
+            if column in df.columns:
+                parts = parts.fillna(df[column].map(partition_name))
+        elif column in df.columns:
+            parts = df[column].map(partition_name)
+        else:
+            unpartitioned.append(table)
+            continue
+        for name, group in df.groupby(parts.fillna(UNASSIGNED_PARTITION), sort=True):
+            partitions[name][table] = group.reset_index(drop=True)
+    return dict(partitions), link, unpartitioned
+
+def build_partition(item, workload=(), column_types=None):
+    """One partition database (no summary tables: those are built once, over all partitions)"""
+    name, frames, path = item
+    return name, create_database(frames, workload=workload, db_path=path, summary_specs={}, column_types=column_types)
+
+def build_partition_catalog(partition_paths, tables, unpartitioned_frames, specs):
+    """
+    data.db for a partitioned build: empty copies of the partitioned tables (the API
+    still introspects a single schema), the unpartitioned tables in full, and the
+    summary tables computed over every partition at once through ATTACH and
+    UNION ALL temp views, which shadow the empty tables while building.
+    Returns (temporary file to rename over DB_PATH, summary row counts).
+    """
+    schemas = {}
+    for path in partition_paths.values():
+        src = sqlite3.connect(path)
+        try:
+            for name, sql in src.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table'"):
+                schemas.setdefault(name, sql)
+        finally:
+            src.close()
+    # A partition without rows for some table still needs the table, or queries on it fail there
+    for path in partition_paths.values():
+        dst = sqlite3.connect(path)
+        try:
+            present = {r[0] for r in dst.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            for table in tables:
+                if table not in present:
+                    dst.execute(schemas[table])
+            dst.commit()
+        finally:
+            dst.close()
+    
+    tmp_path = DB_PATH.with_name(f".{DB_PATH.name}.tmp-{os.getpid()}")
+    if tmp_path.exists():
+        tmp_path.unlink()
+    conn = sqlite3.connect(tmp_path)
+    try:
+        max_attached = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        if len(partition_paths) > max_attached:
+            raise ValueError(f"{len(partition_paths)} partitions exceed SQLite's ATTACH limit ({max_attached})")
+        for table in tables:
+            conn.execute(schemas[table])
+        for table_name, df in unpartitioned_frames.items():
+            df, dtypes = typed_frame(df)
+            df.to_sql(table_name, conn, if_exists='replace', index=False, dtype=dtypes)
+            print(f"  ✅ {table_name} table created in the catalog: {len(df)} records")
         
-    finally:
+        aliases = []
+        for i, path in enumerate(partition_paths.values()):
+            conn.execute(f"ATTACH DATABASE ? AS p{i}", (str(path),))
+            aliases.append(f"p{i}")
+        for table in tables:
+            union = " UNION ALL ".join(f'SELECT * FROM {a}."{table}"' for a in aliases)
+            conn.execute(f'CREATE TEMP VIEW "{table}" AS {union}')
+        print("\nBuilding summary tables over all partitions...")
+        summaries = build_summary_tables(conn, specs)
+        for table in tables:
+            conn.execute(f'DROP VIEW temp."{table}"')
+        conn.commit()
+        for a in aliases:
+            conn.execute(f"DETACH DATABASE {a}")
+        optimize_database(conn)
+        conn.commit()
+        conn.close()
+        return tmp_path, summaries
+    except Exception:
         conn.close()
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+
+def write_partitions_catalog(catalog):
+    tmp_path = PARTITIONS_CATALOG_PATH.with_name(f".{PARTITIONS_CATALOG_PATH.name}.tmp-{os.getpid()}")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(catalog, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, PARTITIONS_CATALOG_PATH)
+
+def prune_partition_builds(keep):
+    """Remove old partition build directories, keeping the given ones (current and previous)"""
+    if not PARTITIONS_DIR.exists():
+        return
+    for build_dir in PARTITIONS_DIR.iterdir():
+        if build_dir.is_dir() and build_dir.name not in keep:
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+def create_partitioned_database(dataframes_dict, column, workers=1, workload=()):
+    """
+    Write one database per partition value in parallel, then the catalog database
+    and data.partitions.json. Each build goes to its own directory, and the catalog
+    is swapped in last, so the API moves from the old partition set to the new one
+    in a single step. Returns the build info, or None on failure.
+    """
+    # Types are decided over each whole table, so every partition declares the same
+    # schema (a slice of whole-number text must not make a REAL column INTEGER)
+    typed = {t: typed_frame(df) for t, df in dataframes_dict.items()}
+    dataframes_dict = {t: df for t, (df, _) in typed.items()}
+    column_types = {t: dtypes for t, (_, dtypes) in typed.items()}
+    try:
+        partitions, link, unpartitioned = partition_frames(dataframes_dict, column)
+    except ValueError as e:
+        print(f"Error partitioning data: {e}")
+        return None
+    print(f"\nPartitioning by {column} (rows follow {link or column}): {len(partitions)} partitions")
+    
+    build_id = datetime.now().strftime("%Y%m%d-%H%M%S")
+    build_dir = PARTITIONS_DIR / build_id
+    build_dir.mkdir(parents=True, exist_ok=True)
+    items = [(name, frames, build_dir / f"{DB_PATH.stem}.{name}.db") for name, frames in sorted(partitions.items())]
+    builder = partial(build_partition, workload=workload, column_types=column_types)
+    if workers > 1 and len(items) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(items))) as pool:
+            results = dict(pool.map(builder, items))
+    else:
+        results = dict(builder(item) for item in items)
+    failed = [name for name, build in results.items() if build is None]
+    if failed:
+        print(f"Error: partitions failed to build: {failed}")
+        shutil.rmtree(build_dir, ignore_errors=True)
+        return None
+    
+    partition_paths = {name: path for name, _, path in items}
+    tables = sorted({t for frames in partitions.values() for t in frames})
+    try:
+        previous = json.loads(PARTITIONS_CATALOG_PATH.read_text(encoding="utf-8")).get("build")
+    except (OSError, json.JSONDecodeError):
+        previous = None
+    try:
+        tmp_path, summaries = build_partition_catalog(partition_paths, tables,
+                                                      {t: dataframes_dict[t] for t in unpartitioned}, load_summary_specs())
+    except Exception as e:
+        print(f"Error creating the partition catalog: {e}")
+        shutil.rmtree(build_dir, ignore_errors=True)
+        return None
+    # The JSON goes first: the API re-reads it when the catalog database changes
+    write_partitions_catalog({
+        "column": column,
+        "link": link,
+        "build": build_id,
+        "built_at": datetime.now().isoformat(timespec="seconds"),
+        "tables": tables,
+        "unpartitioned": unpartitioned,
+        "summaries": sorted(summaries),
+        "partitions": {
+            name: {
+                "path": str(path.relative_to(DB_PATH.parent)),
+                "rows": {t: len(df) for t, df in partitions[name].items()},
+            }
+            for name, path in partition_paths.items()
+        },
+    })
+    os.replace(tmp_path, DB_PATH)
+    prune_partition_builds({build_id, previous})
+    for name, path in partition_paths.items():
+        rows = sum(len(df) for df in partitions[name].values())
+        print(f"  🗂️  {column}={name}: {rows} records -> {path}")
+    return {
+        "indexes": next(iter(results.values()))["indexes"] if results else {},
+        "summaries": summaries,
+        "partitions": {"column": column, "build": build_id, "count": len(partition_paths)},
+    }
+
+def remove_partitions():
+    """Back to a single database: drop the partition catalog and partition files"""
+    if PARTITIONS_CATALOG_PATH.exists():
+        PARTITIONS_CATALOG_PATH.unlink()
+    prune_partition_builds(set())
+    if PARTITIONS_DIR.exists() and not any(PARTITIONS_DIR.iterdir()):
+        PARTITIONS_DIR.rmdir()
+
+# ---------- API CACHE INVALIDATION ----------
+def notify_api_cache_invalidation():
+    """Tell the running API to drop cached SQL built against the old database"""
+    if not API_URL:
+        return
+    url = API_URL.rstrip("/") + "/cache/invalidate"
+    try:
+        req = urllib.request.Request(url, data=b"", method="POST")
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            print(f"Invalidated API caches: {resp.read().decode('utf-8')}")
+    except Exception as e:
+        print(f"Warning: could not invalidate API caches at {url}: {e}")
 
 # ---------- MAIN ----------
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the SQLite database from the Excel files in TABLE/")
+    parser.add_argument("--full", action="store_true", help="Rebuild every table even if its source file is unchanged")
+    parser.add_argument("--workload", action="append",
+                        help="SQL workload file (.jsonl with a \"sql\" field, or .sql) used to advise indexes; repeatable. "
+                             "Defaults to the API's question index / SQL workload log when present")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes used to load Excel files (and build partitions) in parallel")
+    parser.add_argument("--partition-by", metavar="COLUMN",
+                        help="Write one database per value of this column (e.g. Plant) plus a shared catalog; "
+                             "always a full build")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
     print("=== Generic Excel to SQLite Database Builder ===")
     print(f"Data directory: {DATA_DIR.resolve()}")
     print(f"Output database: {DB_PATH.resolve()}")
     print()
     
-    # Load all Excel files from DATA directory
-    all_dataframes = load_all_excel_files()
+    excel_files = find_excel_files()
+    if not excel_files:
+        print("\n❌ No data loaded. Please check your TABLE directory and Excel files.")
+        return
+    
+    manifest = load_manifest()
+    if args.partition_by:
+        return main_partitioned(args, excel_files)
+    # data.db of a partitioned build has no rows to update incrementally
+    files_to_load, tables_to_drop, hashes = plan_build(excel_files, manifest,
+                                                       full=args.full or bool(manifest.get("partitions")))
+    summary_specs = load_summary_specs()
+    spec_hash = summary_specs_hash(summary_specs)
+    summaries_changed = manifest.get("summary_spec") != spec_hash
+    # Summaries removed from the spec must not linger in the database
+    tables_to_drop += [t for t in manifest.get("summaries", {}) if t not in summary_specs]
+    
+    if not files_to_load and not tables_to_drop and not summaries_changed:
+        print("\n✅ All tables are up to date; nothing to rebuild.")
+        if args.workload:
+            print("   To re-index for a new workload run: python index_advisor.py --db data.db --workload <file>")
+        return
+    
+    print(f"\nTables to rebuild: {[f.stem.upper() for f in files_to_load]}")
+    if tables_to_drop:
+        print(f"Tables to drop: {tables_to_drop}")
+    if summaries_changed:
+        print("Summary table definitions changed; summaries will be rebuilt")
+    
+    # Load only the changed Excel files
+    all_dataframes = load_all_excel_files(files_to_load, workers=args.workers)
     
     # Summary
     print(f"\nData Summary:")
@@ -223,14 +763,45 @@ def main():
     
     print(f"  Total records across all tables: {total_records}")
     
-    if not all_dataframes:
+    if not all_dataframes and not tables_to_drop and not (summaries_changed and DB_PATH.exists()):
         print("\n❌ No data loaded. Please check your TABLE directory and Excel files.")
         return
     
     # Create database
-    create_database(all_dataframes)
+    incremental = not args.full and not manifest.get("partitions") and DB_PATH.exists()
+    workload = read_workload(args.workload or DEFAULT_WORKLOAD_PATHS)
+    build = create_database(all_dataframes, drop_tables=tables_to_drop, incremental=incremental,
+                            workload=workload, saved_indexes=manifest.get("indexes"))
+    if build is None:
+        print("\n❌ Database build failed; the existing database was left untouched.")
+        return
+    
+    # Record what was built so the next run only rebuilds what changed
+    built_at = datetime.now().isoformat(timespec="seconds")
+    tables = {} if args.full else {t: v for t, v in manifest.get("tables", {}).items() if t not in tables_to_drop}
+    for excel_file in files_to_load:
+        table_name = excel_file.stem.upper()
+        if table_name in all_dataframes:
+            tables[table_name] = {
+                "source": excel_file.name,
+                "sha256": hashes[table_name],
+                "rows": len(all_dataframes[table_name]),
+                "built_at": built_at,
+            }
+    write_manifest({
+        "built_at": built_at,
+        "database": DB_PATH.name,
+        "tables": tables,
+        "indexes": build["indexes"],
+        "summaries": build["summaries"],
+        "summary_spec": spec_hash,
+    })
     
     print(f"\n✅ Database created successfully: {DB_PATH.resolve()}")
+    if manifest.get("partitions"):
+        remove_partitions()
+        print("Removed the previous partitioned build")
+    notify_api_cache_invalidation()
     
     # Quick validation
     try:
@@ -253,5 +824,39 @@ def main():
     except Exception as e:
         print(f"Error validating database: {e}")
 
+def main_partitioned(args, excel_files):
+    """--partition-by: load every source file and write the partitioned layout"""
+    hashes = {f.stem.upper(): file_sha256(f) for f in excel_files}
+    all_dataframes = load_all_excel_files(excel_files, workers=args.workers)
+    if not all_dataframes:
+        print("\n❌ No data loaded. Please check your TABLE directory and Excel files.")
+        return
+    workload = read_workload(args.workload or DEFAULT_WORKLOAD_PATHS)
+    build = create_partitioned_database(all_dataframes, args.partition_by, workers=args.workers, workload=workload)
+    if build is None:
+        print("\n❌ Partitioned build failed; the existing database was left untouched.")
+        return
+    
+    built_at = datetime.now().isoformat(timespec="seconds")
+    write_manifest({
+        "built_at": built_at,
+        "database": DB_PATH.name,
+        "tables": {
+            f.stem.upper(): {
+                "source": f.name,
+                "sha256": hashes[f.stem.upper()],
+                "rows": len(all_dataframes[f.stem.upper()]),
+                "built_at": built_at,
+            }
+            for f in excel_files if f.stem.upper() in all_dataframes
+        },
+        "indexes": build["indexes"],
+        "summaries": build["summaries"],
+        "summary_spec": summary_specs_hash(load_summary_specs()),
+        "partitions": build["partitions"],
+    })
+    print(f"\n✅ Partitioned database created: catalog {DB_PATH.resolve()}, partitions in {PARTITIONS_DIR.resolve()}")
+    notify_api_cache_invalidation()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Workload-driven index advisor for the generated SQLite database.
+
+Reads the SQL the API actually generated (BE/question_index.jsonl, the optional
+SQL workload log, or any .sql/.jsonl file), works out which columns each query
+filters, joins, groups and sorts on, and recommends composite (and, for narrow
+queries, covering) indexes. Used by build_datadase.py; can also be run on its
+own against an existing database:
+
+    python index_advisor.py --db data.db --workload ../BE/question_index.jsonl
+"""
+import argparse
+import json
+import re
+import sqlite3
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+# --------- CONFIG ----------
+BE_DIR = Path(__file__).resolve().parent.parent / "BE"
+# Used when no --workload is given: SQL remembered by the API, and its optional workload log
+DEFAULT_WORKLOAD_PATHS = [BE_DIR / "question_index.jsonl", BE_DIR / "sql_workload.jsonl"]
+ANNOTATIONS_PATH = BE_DIR / "schema_annotations.json"
+INDEX_PREFIX = "adv_"
+MAX_INDEXES_PER_TABLE = 6
+# Queries reading at most this many columns of a table get a covering index
+MAX_INDEX_COLUMNS = 5
+MAX_WORKLOAD_QUERIES = 500
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_NOT_ALIAS = (
+    "ON", "WHERE", "JOIN", "LEFT", "RIGHT", "INNER", "OUTER", "CROSS", "NATURAL", "USING",
+    "GROUP", "ORDER", "LIMIT", "HAVING", "UNION", "EXCEPT", "INTERSECT", "WINDOW",
+)
+_TABLE_REF = re.compile(
+    r'\b(?:FROM|JOIN)\s+"?(\w+)"?(?:\s+(?:AS\s+)?(?!(?:' + "|".join(_NOT_ALIAS) + r')\b)"?(\w+)"?)?', re.I
+)
+_COLUMN = r'(?:"?(\w+)"?\s*\.\s*)?"?([A-Za-z_]\w*)"?'
+_JOIN_PRED = re.compile(_COLUMN + r"\s*==?\s*" + _COLUMN + r"(?!\s*\()")
+_EQ_PRED = re.compile(_COLUMN + r"\s*(?:==?|\bIN\b|\bIS\b)", re.I)
+_RANGE_PRED = re.compile(_COLUMN + r"\s*(?:<=|>=|<>|!=|<|>|\bBETWEEN\b|\bLIKE\b|\bGLOB\b)", re.I)
+_ORDER_CLAUSE = re.compile(
+    r"\b(?:ORDER|GROUP)\s+BY\s+(.*?)(?=\bLIMIT\b|\bHAVING\b|\bORDER\b|\bUNION\b|\)|;|$)", re.I | re.S
+)
+_KEYWORDS = {"AND", "OR", "NOT", "NULL", "SELECT", "WHERE", "ON", "CASE", "WHEN", "THEN", "ELSE", "END"}
+
+
+# ---------- WORKLOAD ----------
+def read_workload(paths):
+    """SQL statements from .jsonl files (records with a "sql" field) or plain .sql files"""
+    queries = []
+    for path in paths:
+        path = Path(path)
+        if not path.exists():
+            continue
+        with open(path, encoding="utf-8") as f:
+            if path.suffix.lower() == ".jsonl":
+                for line in f:
+                    try:
+                        sql = json.loads(line).get("sql")
+                    except (json.JSONDecodeError, AttributeError):
+                        continue
+                    if sql:
+                        queries.append(sql.strip())
+            else:
+                statement = ""
+                for part in f.read().split(";"):
+                    statement += part + ";"
+                    if sqlite3.complete_statement(statement):
+                        if statement.strip(" \n\r\t;"):
+                            queries.append(statement.strip())
+                        statement = ""
+    return queries[-MAX_WORKLOAD_QUERIES:]
+
+
+def documented_joins():
+    """(table, column) pairs used by the joins documented for the prompt"""
+    try:
+        with open(ANNOTATIONS_PATH, encoding="utf-8") as f:
+            joins = json.load(f).get("joins", [])
+    except (OSError, json.JSONDecodeError):
+        return []
+    pairs = []
+    for join in joins:
+        for side in join.split("="):
+            table, _, column = side.strip().partition(".")
+            if column:
+                pairs.append((table, column))
+    return pairs
+
+
+# ---------- QUERY ANALYSIS ----------
+def read_columns(conn, sql):
+    """{table: {columns}} the query reads, as resolved by SQLite itself; None if it does not compile"""
+    reads = defaultdict(set)
+
+    def authorizer(action, arg1, arg2, db_name, trigger):
+        if action == sqlite3.SQLITE_READ and arg1 and arg2:
+            reads[arg1].add(arg2)
+        return sqlite3.SQLITE_OK
+
+    conn.set_authorizer(authorizer)
+    try:
+        conn.execute("EXPLAIN " + sql.rstrip().rstrip(";")).fetchall()
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.set_authorizer(None)
+    return reads
+
+
+def analyze_query(conn, sql):
+    """
+    Per table: equality/join columns, range columns, ORDER/GROUP BY columns and
+    all columns read. Columns wrapped in functions are ignored (no index helps them).
+    """
+    reads = read_columns(conn, sql)
+    if not reads:
+        return None
+    text = _STRING_LITERAL.sub("''", _COMMENT.sub(" ", sql))
+
+    tables = {t.lower(): t for t in reads}
+    aliases = dict(tables)
+    for table, alias in _TABLE_REF.findall(text):
+        if table.lower() in tables and alias and alias.upper() not in _NOT_ALIAS:
+            aliases[alias.lower()] = tables[table.lower()]
+
+    def resolve(qualifier, column):
+        candidates = [aliases[qualifier.lower()]] if qualifier else list(reads)
+        for table in candidates:
+            if table not in reads:
+                continue
+            for col in reads[table]:
+                if col.lower() == column.lower():
+                    return table, col
+        return None
+
+    usage = {t: {"eq": [], "range": [], "order": [], "read": set(cols)} for t, cols in reads.items()}
+
+    def note(kind, qualifier, column):
+        if column.upper() in _KEYWORDS or (qualifier and qualifier.lower() not in aliases):
+            return
+        hit = resolve(qualifier, column)
+        if hit and hit[1] not in usage[hit[0]][kind]:
+            usage[hit[0]][kind].append(hit[1])
+
+    for q1, c1, q2, c2 in _JOIN_PRED.findall(text):
+        note("eq", q1, c1)
+        note("eq", q2, c2)
+    for q, c in _EQ_PRED.findall(text):
+        note("eq", q, c)
+    for q, c in _RANGE_PRED.findall(text):
+        note("range", q, c)
+    for clause in _ORDER_CLAUSE.findall(text):
+        for item in clause.split(","):
+            m = re.fullmatch(r"\s*" + _COLUMN + r"(?:\s+(?:ASC|DESC))?\s*", item, re.I)
+            if m:
+                note("order", *m.groups())
+    for u in usage.values():
+        u["range"] = [c for c in u["range"] if c not in u["eq"]]
+    return usage
+
+
+# ---------- RECOMMENDATION ----------
+def recommend_indexes(conn, queries, extra_keys=()):
+    """
+    Index column lists per table, most useful first: equality/join columns
+    (most frequently used first), then one range or sort column, widened to a
+    covering index when the query reads only a few columns of the table.
+    extra_keys are (table, column) pairs that always get an index (join keys).
+    """
+    analyzed = [u for u in (analyze_query(conn, sql) for sql in queries) if u]
+    eq_freq = Counter()
+    for usage in analyzed:
+        for table, u in usage.items():
+            eq_freq.update((table, c) for c in u["eq"])
+
+    candidates = defaultdict(Counter)
+    for usage in analyzed:
+        for table, u in usage.items():
+            key = sorted(u["eq"], key=lambda c: (-eq_freq[(table, c)], c))
+            tail = u["range"][:1] or [c for c in u["order"] if c not in key][:1]
+            key += tail
+            if not key:
+                continue
+            if len(u["read"]) <= MAX_INDEX_COLUMNS:
+                key += sorted(u["read"] - set(key))
+            candidates[table][tuple(key)] += 1
+
+    table_columns = {}
+    for table, column in extra_keys:
+        if table not in table_columns:
+            table_columns[table] = {r[1] for r in conn.execute(f'PRAGMA table_info("{table}")')}
+        if column in table_columns[table]:
+            candidates[table].setdefault((column,), 0)
+
+    return {
+        table: prune_keys([list(k) for k, _ in sorted(counter.items(), key=lambda kv: (-kv[1], -len(kv[0])))])
+        for table, counter in candidates.items()
+    }
+
+
+def prune_keys(keys):
+    """Drop duplicates and keys that are a prefix of a wider key (that index serves them too)"""
+    chosen = []
+    for key in keys:
+        if key in chosen or any(len(other) > len(key) and other[:len(key)] == key for other in keys):
+            continue
+        chosen.append(key)
+    return chosen[:MAX_INDEXES_PER_TABLE]
+
+
+def index_name(table, columns):
+    return f"{INDEX_PREFIX}{table}_{'_'.join(columns)}"[:120]
+
+
+def drop_advised_indexes(conn):
+    names = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE ?", (INDEX_PREFIX + "%",)
+    )]
+    for name in names:
+        conn.execute(f'DROP INDEX IF EXISTS "{name}"')
+    return len(names)
+
+
+def existing_index_keys(conn, table):
+    """Column lists of the table's indexes that the advisor does not manage"""
+    keys = []
+    for row in conn.execute(f'PRAGMA index_list("{table}")'):
+        name = row[1]
+        if not name.startswith(INDEX_PREFIX):
+            keys.append([r[2] for r in conn.execute(f'PRAGMA index_info("{name}")')])
+    return keys
+
+
+def apply_indexes(conn, plan):
+    """Create the planned indexes; returns [{"table", "columns", "name"}] actually created"""
+    created = []
+    for table, keys in plan.items():
+        columns = {r[1] for r in conn.execute(f'PRAGMA table_info("{table}")')}
+        existing = existing_index_keys(conn, table)
+        for key in keys:
+            if not key or not set(key) <= columns or key in existing:
+                continue
+            name = index_name(table, key)
+            cols = ", ".join(f'"{c}"' for c in key)
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({cols})')
+            created.append({"table": table, "columns": key, "name": name})
+    return created
+
+
+def time_workload(conn, queries, repeat=3):
+    """Sum over distinct queries of the best-of-N wall time (seconds); failing queries are skipped"""
+    total = 0.0
+    for sql in dict.fromkeys(queries):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            try:
+                conn.execute(sql).fetchall()
+            except sqlite3.Error:
+                best = None
+                break
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        total += best or 0.0
+    return total
+
+
+def optimize_database(conn, queries=(), saved_plan=None):
+    """
+    Rebuild the advised indexes from the workload (or re-create a previously
+    saved plan when there is no workload), then refresh planner statistics.
+    Returns (plan, timings) where timings is None without a workload.
+    """
+    timings = None
+    drop_advised_indexes(conn)
+    if queries:
+        before = time_workload(conn, queries)
+        plan = recommend_indexes(conn, queries, documented_joins())
+    else:
+        plan = recommend_indexes(conn, [], documented_joins())
+        for table, keys in (saved_plan or {}).items():
+            plan[table] = prune_keys(list(keys) + plan.get(table, []))
+    created = apply_indexes(conn, plan)
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA optimize")
+    if queries:
+        timings = {"before": before, "after": time_workload(conn, queries), "queries": len(set(queries))}
+    applied = defaultdict(list)
+    for idx in created:
+        applied[idx["table"]].append(idx["columns"])
+    return dict(applied), timings
+
+
+def print_plan(plan, timings=None):
+    for table, keys in plan.items():
+        for key in keys:
+            print(f"    Index {index_name(table, key)} on {table}({', '.join(key)})")
+    if timings:
+        speedup = timings["before"] / timings["after"] if timings["after"] else float("inf")
+        print(f"  Workload ({timings['queries']} queries): "
+              f"{timings['before'] * 1000:.1f} ms -> {timings['after'] * 1000:.1f} ms ({speedup:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommend and create indexes for a workload")
+    parser.add_argument("--db", default="data.db", help="SQLite database to index")
+    parser.add_argument("--workload", action="append", help="SQL workload file (.jsonl or .sql); repeatable")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the recommended indexes")
+    args = parser.parse_args()
+
+    queries = read_workload(args.workload or DEFAULT_WORKLOAD_PATHS)
+    print(f"Workload: {len(queries)} queries")
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.dry_run:
+            print_plan(recommend_indexes(conn, queries, documented_joins()))
+            return
+        plan, timings = optimize_database(conn, queries)
+        conn.commit()
+        print_plan(plan, timings)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Synthetic scale-up generator: turns the sample database into a 10x-1000x one
+with the same schemas, value distributions and SalesOrder relationships.
+
+Every copy of the source data gets fresh SalesOrder numbers (the same mapping
+in all three tables, so joins keep their fan-out), per-order date shifts,
+noise on quantities/values, and renumbered high-cardinality codes (customers,
+POs, batches). Low-cardinality codes (Plant, SalesType, statuses, units) keep
+their original frequencies. The result goes through the normal build
+(typed columns, join-key indexes, summary tables, ANALYZE).
+
+    python scale_up.py --factor 100 --output data_x100.db
+"""
+import argparse
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import sqlite3
+
+import build_datadase as B
+
+KEY_COLUMN = "SalesOrder"
+TABLES = ["SALES_LOGISTICS", "MANUFACTURING_MATERIAL", "WAREHOUSE_STOCK"]
+# Columns whose values are codes, not measurements or identifiers: copied unchanged
+CODE_COLUMNS = {"Plant", "LineItemNo", "PricingUnit", "MG2", "MatGroup1", "MatGroup3", "MatGroup4"}
+ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+# Identifier-like text: a prefix and a trailing number ("Customer 12", "PO3000", "00042")
+IDENTIFIER = r"^\D*\d+$"
+DIGITS = re.compile(r"\d+")
+
+
+# ---------- PROFILING ----------
+def profile_columns(df):
+    """How each column is regenerated: key, date, noise (numeric), renumber (high-cardinality text) or keep"""
+    kinds = {}
+    for c in df.columns:
+        values = df[c].dropna()
+        distinct = values.nunique()
+        if c == KEY_COLUMN:
+            kinds[c] = "key"
+        elif c in CODE_COLUMNS:
+            kinds[c] = "keep"
+        elif len(values) and values.astype(str).str.match(ISO_DATE).all():
+            kinds[c] = "date"
+        elif pd.api.types.is_numeric_dtype(df[c]) and distinct > 3:
+            kinds[c] = "noise"
+        elif (not pd.api.types.is_numeric_dtype(df[c]) and len(values)
+              and distinct / len(values) > 0.5 and values.astype(str).str.match(IDENTIFIER).all()):
+            kinds[c] = "renumber"
+        else:
+            kinds[c] = "keep"
+    return kinds
+
+
+def number_span(series):
+    """1 + the largest number embedded in the column's values (so copies never collide)"""
+    numbers = [int(n) for v in series.dropna().astype(str) for n in DIGITS.findall(v)]
+    return (max(numbers) + 1) if numbers else 1
+
+
+# ---------- GENERATION ----------
+def renumber(value, copy, span):
+    """'Customer 7' -> 'Customer 7' for copy 0, 'Customer 107' for copy 1 (span 100), ...
+    The width of zero-padded numbers is kept."""
+    if pd.isna(value) or copy == 0:
+        return value
+    def shift(m):
+        text = m.group(0)
+        return str(int(text) + copy * span).zfill(len(text))
+    return re.sub(r"\d+$", shift, str(value))
+
+
+def key_mapping(keys, copy, span):
+    return {k: renumber(k, copy, span) for k in keys}
+
+
+def scale_table(df, kinds, copy, so_map, shifts, spans, rng):
+    """One synthetic copy of a table"""
+    out = df.copy()
+    orig_keys = df[KEY_COLUMN] if KEY_COLUMN in df.columns else None
+    for c, kind in kinds.items():
+        if kind == "key":
+            out[c] = df[c].map(so_map)
+        elif kind == "date" and copy:
+            # One shift per sales order keeps its dates consistent across tables
+            days = orig_keys.map(shifts).fillna(0) if orig_keys is not None else rng.integers(-180, 180, len(df))
+            dates = pd.to_datetime(df[c], errors="coerce") + pd.to_timedelta(np.asarray(days, dtype=int), unit="D")
+            out[c] = dates.dt.strftime("%Y-%m-%d").where(dates.notna(), None)
+        elif kind == "noise" and copy:
+            factor = rng.uniform(0.5, 1.5, len(df))
+            noisy = df[c] * factor
+            out[c] = noisy.round() if pd.api.types.is_integer_dtype(df[c]) or (df[c].dropna() % 1 == 0).all() else noisy.round(2)
+        elif kind == "renumber":
+            out[c] = df[c].map(lambda v: renumber(v, copy, spans[c]))
+    return out
+
+
+def scale_up(source, factor, seed=0):
+    """{table: DataFrame} for factor copies of the source database"""
+    conn = sqlite3.connect(source)
+    try:
+        existing = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        frames = {t: pd.read_sql_query(f'SELECT * FROM "{t}"', conn) for t in TABLES if t in existing}
+    finally:
+        conn.close()
+    if not frames:
+        raise SystemExit(f"No source tables ({', '.join(TABLES)}) in {source}")
+
+    rng = np.random.default_rng(seed)
+    all_keys = sorted({k for df in frames.values() if KEY_COLUMN in df.columns for k in df[KEY_COLUMN].dropna()})
+    key_span = number_span(pd.Series(all_keys))
+    kinds = {t: profile_columns(df) for t, df in frames.items()}
+    spans = {t: {c: number_span(df[c]) for c, k in kinds[t].items() if k == "renumber"} for t, df in frames.items()}
+    for t, k in kinds.items():
+        print(f"  {t}: " + ", ".join(f"{c}={kind}" for c, kind in k.items()))
+
+    parts = {t: [] for t in frames}
+    for copy in range(factor):
+        so_map = key_mapping(all_keys, copy, key_span)
+        shifts = dict(zip(all_keys, rng.integers(-365, 365, len(all_keys)) if copy else np.zeros(len(all_keys), int)))
+        for t, df in frames.items():
+            parts[t].append(scale_table(df, kinds[t], copy, so_map, shifts, spans[t], rng))
+    return {t: pd.concat(p, ignore_index=True) for t, p in parts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a scaled-up synthetic copy of the database")
+    parser.add_argument("--source", default=str(B.DB_PATH), help="Database to profile (default: data.db)")
+    parser.add_argument("--factor", type=int, default=100, help="Copies of the source data (10-1000 typical)")
+    parser.add_argument("--output", help="Output database (default: data_x<factor>.db)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    output = Path(args.output or f"data_x{args.factor}.db")
+    print(f"Scaling {args.source} x{args.factor} -> {output}")
+    frames = scale_up(args.source, args.factor, args.seed)
+    for t, df in frames.items():
+        print(f"  {t}: {len(df)} rows")
+
+    # Same build path as the real database, just a different target file
+    if B.create_database(frames, db_path=output) is None:
+        raise SystemExit("Build failed")
+    print(f"\n✅ Synthetic database written: {output.resolve()}")
+
+
+if __name__ == "__main__":
+    main()
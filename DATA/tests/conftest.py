@@ -0,0 +1,21 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+DATA_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(DATA_DIR))
+
+import build_datadase as B  # noqa: E402
+
+
+@pytest.fixture
+def build_paths(tmp_path, monkeypatch):
+    """Point the builder's output paths at a temp directory"""
+    db_path = tmp_path / "data.db"
+    monkeypatch.setattr(B, "DB_PATH", db_path)
+    monkeypatch.setattr(B, "MANIFEST_PATH", db_path.with_name("data.manifest.json"))
+    monkeypatch.setattr(B, "PARTITIONS_CATALOG_PATH", db_path.with_name("data.partitions.json"))
+    monkeypatch.setattr(B, "PARTITIONS_DIR", db_path.with_name("data.partitions"))
+    monkeypatch.setattr(B, "API_URL", None)
+    return db_path
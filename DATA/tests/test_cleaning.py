@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+import build_datadase as B
+
+
+def messy_frame():
+    return pd.DataFrame({
+        "Name": ["  Customer \t 1 ", "\u200b", "", "   ", None, "Co\u200b  Ltd\u00a0", 42],
+        "Code": [1, 2, " ", 4, None, 6, 7],
+        "Qty": [1.0, 2.5, np.nan, 4.0, 5.0, 6.0, 7.0],
+        "Blank": ["", " ", None, "\t", "", "", ""],
+    })
+
+
+def test_vectorized_cleaning_matches_the_per_cell_path():
+    legacy = B.clean_frame(messy_frame(), vectorized=False)
+    fast = B.clean_frame(messy_frame())
+    assert fast.dtypes.equals(legacy.dtypes)
+    assert fast.equals(legacy)
+    assert fast["Name"].tolist()[:2] == ["Customer 1", ""]
+    assert fast["Name"].tolist()[5:] == ["Co Ltd", "42"]
+
+
+def test_cleaning_leaves_dates_as_loaded():
+    df = pd.DataFrame({"SalesDate2": pd.to_datetime(["2024-01-02 13:45", None]), "PODate": ["02/01/2024", " "]})
+    cleaned = B.clean_frame(df.copy())
+    assert cleaned["SalesDate2"].equals(df["SalesDate2"])
+    assert cleaned["PODate"].tolist()[0] == "02/01/2024"
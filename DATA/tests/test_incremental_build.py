@@ -0,0 +1,88 @@
+import json
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import build_datadase as B
+
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch, build_paths):
+    table_dir = tmp_path / "TABLE"
+    table_dir.mkdir()
+    monkeypatch.setattr(B, "DATA_DIR", table_dir)
+    monkeypatch.setattr("sys.argv", ["build_datadase.py"])
+    write_sheet(table_dir, "sales", 3)
+    write_sheet(table_dir, "stock", 2)
+    return table_dir
+
+
+def write_sheet(table_dir, name, rows):
+    pd.DataFrame({"SalesOrder": range(rows), "Qty": [float(i) for i in range(rows)]}).to_excel(
+        table_dir / f"{name}.xlsx", index=False
+    )
+
+
+def table_counts(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        names = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+        return {name: conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0] for name in names}
+    finally:
+        conn.close()
+
+
+def manifest():
+    with open(B.MANIFEST_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_first_build_writes_every_table_and_the_manifest(sources, build_paths):
+    B.main()
+    assert table_counts(build_paths) == {"SALES": 3, "STOCK": 2}
+    tables = manifest()["tables"]
+    assert tables["SALES"]["rows"] == 3
+    assert tables["SALES"]["sha256"] == B.file_sha256(sources / "sales.xlsx")
+
+
+def test_unchanged_sources_leave_the_database_alone(sources, build_paths):
+    B.main()
+    before = build_paths.stat()
+    B.main()
+    after = build_paths.stat()
+    assert (after.st_ino, after.st_mtime_ns) == (before.st_ino, before.st_mtime_ns)
+
+
+def test_only_changed_tables_are_reloaded(sources, build_paths, monkeypatch):
+    B.main()
+    write_sheet(sources, "stock", 5)
+    loaded = []
+    load = B.load_excel_file
+    monkeypatch.setattr(B, "load_excel_file", lambda path, **kw: loaded.append(path.name) or load(path, **kw))
+    B.main()
+    assert loaded == ["stock.xlsx"]
+    assert table_counts(build_paths) == {"SALES": 3, "STOCK": 5}
+    assert manifest()["tables"]["STOCK"]["rows"] == 5
+
+
+def test_removed_source_drops_its_table(sources, build_paths):
+    B.main()
+    (sources / "stock.xlsx").unlink()
+    B.main()
+    assert table_counts(build_paths) == {"SALES": 3}
+    assert set(manifest()["tables"]) == {"SALES"}
+
+
+def test_failed_build_keeps_the_live_database(sources, build_paths, monkeypatch):
+    B.main()
+    write_sheet(sources, "stock", 5)
+
+    def fail(*args, **kwargs):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(pd.DataFrame, "to_sql", fail)
+    B.main()
+    assert table_counts(build_paths) == {"SALES": 3, "STOCK": 2}
+    assert manifest()["tables"]["STOCK"]["rows"] == 2
+    assert [p.name for p in build_paths.parent.iterdir() if ".tmp-" in p.name] == []
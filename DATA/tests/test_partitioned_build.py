@@ -0,0 +1,31 @@
+import os
+
+import pandas as pd
+
+import build_datadase as B
+
+
+def frames():
+    return {"SALES_LOGISTICS": pd.DataFrame({"SalesOrder": [1, 2, 3], "Plant": [1000, 1000, 2000], "OrderQty": [1.0, 2.0, 3.0]})}
+
+
+def test_partitioned_build_writes_one_database_per_value(build_paths):
+    build = B.create_partitioned_database(frames(), "Plant")
+    assert build["partitions"]["count"] == 2
+    assert B.PARTITIONS_CATALOG_PATH.exists() and build_paths.exists()
+
+
+def test_single_file_build_drops_the_partition_list_before_the_swap(build_paths, monkeypatch):
+    assert B.create_partitioned_database(frames(), "Plant") is not None
+    swaps = []
+    replace = os.replace
+
+    def recording_replace(src, dst):
+        if B.Path(dst) == build_paths:
+            # What a reader that sees the new data.db would find next to it
+            swaps.append(B.PARTITIONS_CATALOG_PATH.exists())
+        replace(src, dst)
+
+    monkeypatch.setattr(B.os, "replace", recording_replace)
+    assert B.create_database(frames()) is not None
+    assert swaps == [False]
@@ -0,0 +1,33 @@
+import sqlite3
+import sys
+from pathlib import Path
+
+import build_datadase as B
+import scale_up
+
+# The API tests' sample rows have the real sheets' shape and key relationships
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "BE" / "tests"))
+from fixture_data import sample_frames, write_single_db  # noqa: E402
+
+
+def counts(path, sql):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql).fetchone()
+    finally:
+        conn.close()
+
+
+def test_scaled_copy_keeps_the_key_relationships_and_leaves_data_db_alone(tmp_path, monkeypatch, build_paths):
+    source = tmp_path / "source.db"
+    write_single_db(sample_frames(), source)
+    output = tmp_path / "data_x3.db"
+    monkeypatch.setattr("sys.argv", ["scale_up.py", "--source", str(source), "--factor", "3", "--output", str(output)])
+    scale_up.main()
+
+    assert B.DB_PATH == build_paths and not build_paths.exists()
+    rows, orders = counts(output, "SELECT COUNT(*), COUNT(DISTINCT SalesOrder) FROM SALES_LOGISTICS")
+    src_rows, src_orders = counts(source, "SELECT COUNT(*), COUNT(DISTINCT SalesOrder) FROM SALES_LOGISTICS")
+    assert (rows, orders) == (3 * src_rows, 3 * src_orders)
+    # Every stock row still joins to a sales order of the same copy
+    assert counts(output, "SELECT COUNT(*) FROM WAREHOUSE_STOCK WHERE SalesOrder NOT IN (SELECT SalesOrder FROM SALES_LOGISTICS)") == (0,)
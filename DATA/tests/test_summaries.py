@@ -0,0 +1,81 @@
+import json
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import build_datadase as B
+
+SPEC = {
+    "SUMMARY_QTY_BY_PLANT": {
+        "from": "SALES",
+        "dimensions": {"Plant": {"expr": "Plant"}, "SalesMonth": {"expr": "substr(SalesDate, 1, 7)"}},
+        "measures": {"OrderQty": {"expr": "SUM(OrderQty)"}, "OrderLines": {"expr": "COUNT(*)"}},
+    },
+}
+
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch, build_paths):
+    table_dir = tmp_path / "TABLE"
+    table_dir.mkdir()
+    monkeypatch.setattr(B, "DATA_DIR", table_dir)
+    monkeypatch.setattr(B, "ANNOTATIONS_PATH", tmp_path / "schema_annotations.json")
+    monkeypatch.setattr("sys.argv", ["build_datadase.py"])
+    pd.DataFrame({
+        "Plant": [1000, 1000, 2000],
+        "SalesDate": ["2024-01-05", "2024-01-20", "2024-02-01"],
+        "OrderQty": [1.5, 2.0, 4.0],
+    }).to_excel(table_dir / "sales.xlsx", index=False)
+    write_specs(SPEC)
+    return table_dir
+
+
+def write_specs(specs):
+    with open(B.ANNOTATIONS_PATH, "w", encoding="utf-8") as f:
+        json.dump({"tables": {}, "joins": [], "summaries": specs}, f)
+
+
+def query(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def test_summaries_are_typed_indexed_and_aggregated(sources, build_paths):
+    B.main()
+    assert query(build_paths, 'SELECT * FROM SUMMARY_QTY_BY_PLANT ORDER BY 1, 2') == [
+        (1000, "2024-01", 3.5, 2),
+        (2000, "2024-02", 4.0, 1),
+    ]
+    declared = {r[1]: r[2] for r in query(build_paths, 'PRAGMA table_info("SUMMARY_QTY_BY_PLANT")')}
+    assert declared == {"Plant": "INTEGER", "SalesMonth": "TEXT", "OrderQty": "REAL", "OrderLines": "INTEGER"}
+    assert query(build_paths, "SELECT name FROM sqlite_master WHERE tbl_name = 'SUMMARY_QTY_BY_PLANT' AND type = 'index'") == [
+        ("idx_SUMMARY_QTY_BY_PLANT_dims",)
+    ]
+    assert B.load_manifest()["summaries"] == {"SUMMARY_QTY_BY_PLANT": 2}
+
+
+def test_spec_changes_rebuild_and_removed_summaries_are_dropped(sources, build_paths):
+    B.main()
+    spec = json.loads(json.dumps(SPEC))
+    spec["SUMMARY_QTY_BY_PLANT"]["where"] = "Plant = 1000"
+    write_specs(spec)
+    B.main()  # no source changed, only the spec
+    assert query(build_paths, "SELECT COUNT(*) FROM SUMMARY_QTY_BY_PLANT") == [(1,)]
+
+    write_specs({})
+    B.main()
+    assert query(build_paths, "SELECT name FROM sqlite_master WHERE name LIKE 'SUMMARY_%'") == []
+    assert B.load_manifest()["summaries"] == {}
+
+
+def test_summary_over_a_missing_table_is_skipped():
+    conn = sqlite3.connect(":memory:")
+    try:
+        assert B.build_summary_tables(conn, SPEC) == {}
+        assert conn.execute("SELECT name FROM sqlite_master").fetchall() == []
+    finally:
+        conn.close()
@@ -0,0 +1,58 @@
+import json
+import sqlite3
+
+import pandas as pd
+
+import build_datadase as B
+
+
+def test_integer_text_becomes_integer_and_leading_zeros_stay_text():
+    df, dtypes = B.typed_frame(pd.DataFrame({"Plant": ["1000", None, "2000"], "Code": ["7", "08", None]}))
+    assert dtypes == {"Plant": "INTEGER", "Code": "TEXT"}  # "08" is not a plain number
+    assert df["Plant"].tolist()[0] == 1000
+
+
+def test_float_columns_stay_real_even_when_whole(build_paths):
+    frame = pd.DataFrame({"OrderQty": [10.0, 20.0, None], "Delivered": [3.0, 5.0, 1.0], "Ratio": ["1.5", "2", None]})
+    df, dtypes = B.typed_frame(frame)
+    assert dtypes == {"OrderQty": "REAL", "Delivered": "REAL", "Ratio": "REAL"}
+
+    assert B.create_database({"SALES_LOGISTICS": frame}) is not None
+    conn = sqlite3.connect(build_paths)
+    try:
+        # Whole-number floats must not turn this into integer division (which gives 0)
+        assert conn.execute("SELECT Delivered / OrderQty FROM SALES_LOGISTICS").fetchone()[0] == 0.3
+    finally:
+        conn.close()
+
+
+def test_dates_become_iso_text_and_date_columns_are_not_numeric():
+    df, dtypes = B.typed_frame(pd.DataFrame({
+        "DeliveryDate": pd.to_datetime(["2024-01-15", None]),
+        "PostingDate": ["20240115", "20240116"],
+    }))
+    assert dtypes == {"DeliveryDate": "TEXT", "PostingDate": "TEXT"}
+    assert df["DeliveryDate"].tolist() == ["2024-01-15", None]
+
+
+def test_partitions_declare_the_types_of_the_whole_table(build_paths):
+    # Plant 1000 only has whole quantities; plant 2000 has a fraction
+    sales = pd.DataFrame({
+        "SalesOrder": [1, 2, 3, 4],
+        "Plant": [1000, 1000, 2000, 2000],
+        "OrderQty": ["10", "20", "2.5", "4"],
+    })
+    assert B.create_partitioned_database({"SALES_LOGISTICS": sales}, "Plant") is not None
+
+    catalog = json.loads(B.PARTITIONS_CATALOG_PATH.read_text(encoding="utf-8"))
+    paths = [build_paths.parent / p["path"] for p in catalog["partitions"].values()]
+    assert len(paths) == 2
+    values = []
+    for path in paths + [build_paths]:
+        conn = sqlite3.connect(path)
+        try:
+            assert {r[1]: r[2] for r in conn.execute('PRAGMA table_info("SALES_LOGISTICS")')}["OrderQty"] == "REAL"
+            values += [r[0] for r in conn.execute("SELECT OrderQty FROM SALES_LOGISTICS")]
+        finally:
+            conn.close()
+    assert sorted(values) == [2.5, 4.0, 10.0, 20.0]